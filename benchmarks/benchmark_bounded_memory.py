@@ -0,0 +1,142 @@
+"""
+Benchmark checking that the memory needed to parse a Pubmed XML file does not grow with the size of the file. A
+synthetic file of the given size (2 GB by default) is generated with :mod:~`data_processing.synthetic_pubmed` and
+parsed with :func:~`data_processing.extract_publication_data.iterate_publications_from_xml`, optionally ingested into
+a database with :func:~`data_processing.ingest_publication_data.ingest_xml_files` instead, while a thread samples the
+resident set size of the process. The benchmark fails if the memory grows by more than the ceiling after the warm-up,
+i.e. the first tenth of the run, in which the caches of the parser and of the interpreter fill up.
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from pathlib import Path
+
+from data_processing.extract_publication_data import create_publication_tables
+from data_processing.extract_publication_data import iterate_publications_from_xml
+from data_processing.ingest_publication_data import ingest_xml_files
+from data_processing.synthetic_pubmed import write_synthetic_pubmed_xml
+from protein_score_utilities.run_metrics import current_rss_bytes
+from protein_score_utilities.run_metrics import peak_rss_bytes
+
+# share of the run in which the memory is still allowed to grow
+WARM_UP_SHARE = 0.1
+
+
+class MemorySampler(threading.Thread):
+    """
+    Thread sampling the resident set size of the process in regular intervals until it is stopped.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self._stopped = threading.Event()
+
+    def run(self):
+        started = time.perf_counter()
+        while not self._stopped.is_set():
+            self.samples.append((time.perf_counter() - started, current_rss_bytes()))
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        return self.samples
+
+
+def generate_file(file_path: Path, gigabytes: float, args):
+    """
+    Generates a synthetic Pubmed file of roughly the given size, estimating the number of articles needed from a small
+    sample file generated with the same settings.
+    """
+    sample_path = file_path.with_name("sample_" + file_path.name)
+    write_synthetic_pubmed_xml(sample_path, 1000, abstract_words=args.abstract_words, n_items=args.items,
+                               seed=args.seed)
+    n_articles = int(gigabytes * 1024 ** 3 / (sample_path.stat().st_size / 1000))
+    sample_path.unlink()
+    started = time.perf_counter()
+    write_synthetic_pubmed_xml(file_path, n_articles, abstract_words=args.abstract_words, n_items=args.items,
+                               seed=args.seed)
+    print(f"Generated {n_articles} articles ({file_path.stat().st_size / 1024 ** 3:.2f} GB) in "
+          f"{time.perf_counter() - started:.1f} s", file=sys.stderr)
+    return n_articles
+
+
+def parse_file(file_path: Path, fields: tuple):
+    """
+    Parses the file and prepares the record of every publication, as the workers of the ingestion do.
+    """
+    n_publications = 0
+    for publication in iterate_publications_from_xml(file_path, fields=fields):
+        publication.to_record()
+        n_publications += 1
+    return n_publications
+
+
+def ingest_file(file_path: Path, db_file: Path, fields: tuple):
+    """
+    Ingests the file into a new database with a single process.
+    """
+    db_conn = sqlite3.connect(db_file)
+    create_publication_tables(db_conn, fields=fields)
+    counters = ingest_xml_files([file_path], db_conn, n_workers=1, fields=fields)
+    db_conn.close()
+    return counters[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--gigabytes', type=float, default=2.0, help="size of the XML file generated")
+    parser.add_argument('--abstract-words', type=int, default=200)
+    parser.add_argument('--items', type=int, default=1, help="number of authors, MeSH headings, ... per article")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--fields', nargs='*', default=(), help="details extracted besides the publications")
+    parser.add_argument('--ingest', action='store_true', help="ingest the file into a database instead of parsing it")
+    parser.add_argument('--ceiling-mb', type=float, default=64.0,
+                        help="growth of the memory after the warm-up up to which the run passes")
+    parser.add_argument('--interval', type=float, default=0.2, help="seconds between two samples of the memory")
+    parser.add_argument('--data-dir', type=Path, help="folder for the generated file, a temporary folder if omitted")
+    args = parser.parse_args()
+    if current_rss_bytes() is None:
+        sys.exit("The current memory can only be determined on Linux.")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir or Path(tmp_dir)
+        data_dir.mkdir(parents=True, exist_ok=True)
+        file_path = data_dir / f"pubmed_{args.gigabytes:g}gb_{args.seed}.xml"
+        if not file_path.exists():
+            generate_file(file_path, args.gigabytes, args)
+
+        fields = tuple(args.fields)
+        sampler = MemorySampler(args.interval)
+        sampler.start()
+        started = time.perf_counter()
+        if args.ingest:
+            n_publications = ingest_file(file_path, Path(tmp_dir) / "bounded_memory.db", fields)
+        else:
+            n_publications = parse_file(file_path, fields)
+        seconds = time.perf_counter() - started
+        samples = sampler.stop()
+
+    warm_up = [rss for elapsed, rss in samples if elapsed <= seconds * WARM_UP_SHARE]
+    after_warm_up = [rss for elapsed, rss in samples if elapsed > seconds * WARM_UP_SHARE]
+    growth = max(after_warm_up, default=0) - max(warm_up)
+    result = dict(mode='ingest' if args.ingest else 'parse', gigabytes=args.gigabytes, fields=fields,
+                  publications=n_publications, seconds=round(seconds, 1),
+                  publications_per_second=round(n_publications / seconds, 1), samples=len(samples),
+                  rss_after_warm_up_bytes=max(warm_up), rss_growth_bytes=growth, peak_rss_bytes=peak_rss_bytes(),
+                  ceiling_bytes=int(args.ceiling_mb * 1024 ** 2))
+    print(json.dumps(result, indent=2))
+    if growth > result['ceiling_bytes']:
+        sys.exit(f"Memory grew by {growth / 1024 ** 2:.1f} MB after the warm-up, more than {args.ceiling_mb} MB.")
+
+
+if __name__ == '__main__':
+    main()
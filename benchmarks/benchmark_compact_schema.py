@@ -0,0 +1,81 @@
+"""
+Benchmark comparing the plain with the compact schema of the table publications (see
+:func:~`data_processing.extract_publication_data.create_publication_tables`): the size of the database file after
+ingesting the same synthetic Pubmed XML file, the time of a full scan of the table without reading the abstracts (e.g.
+counting publications per year and journal) and the time of reading all abstracts through
+:func:~`protein_score_utilities.convenience_functions_database.iterate_publications`.
+
+The synthetic abstracts are drawn from a small vocabulary and compress better than real abstracts, for which a ratio of
+about 2.5-3 is typical.
+"""
+
+import argparse
+import sqlite3
+import tempfile
+import time
+
+from pathlib import Path
+
+from data_processing.extract_publication_data import create_publication_tables
+from data_processing.ingest_publication_data import ingest_xml_files
+from data_processing.synthetic_pubmed import write_synthetic_pubmed_xml
+from protein_score_utilities.convenience_functions_database import COMPRESSION_CODECS
+from protein_score_utilities.convenience_functions_database import iterate_publications
+
+SQL_SCAN_PLAIN = "SELECT pub_year, journal, COUNT(*) FROM publications GROUP BY pub_year, journal"
+SQL_SCAN_COMPACT = "SELECT p.pub_year, j.journal, COUNT(*) FROM publications p " \
+                   "JOIN journals j ON j.journal_id = p.journal_id GROUP BY p.pub_year, j.journal"
+
+
+def measure_schema(db_file, xml_file, codec: str = None):
+    """
+    Ingests the XML file into a new database and measures the file size and the scan times.
+
+    :param db_file: path to the database file to be created
+    :type db_file: Path
+    :param xml_file: path to the synthetic XML file
+    :type xml_file: Path
+    :param codec: codec of the compact schema, None for the plain schema
+    :type codec: str
+    :return: size of the database in bytes, seconds of the full scan and seconds to read all abstracts
+    :rtype: tuple
+    """
+    db_conn = sqlite3.connect(db_file)
+    create_publication_tables(db_conn, compact=codec is not None)
+    ingest_xml_files([xml_file], db_conn, codec=codec or 'zlib')
+    db_conn.execute("VACUUM")
+    db_conn.close()
+    size = db_file.stat().st_size
+
+    db_conn = sqlite3.connect(db_file)
+    start = time.perf_counter()
+    db_conn.execute(SQL_SCAN_COMPACT if codec is not None else SQL_SCAN_PLAIN).fetchall()
+    scan_time = time.perf_counter() - start
+    start = time.perf_counter()
+    n_characters = sum(len(row[1]) for chunk in iterate_publications(db_conn) for row in chunk)
+    read_time = time.perf_counter() - start
+    db_conn.close()
+    assert n_characters > 0
+    return size, scan_time, read_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--articles", type=int, default=50000, help="number of articles in the synthetic file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        xml_file = Path(tmp_dir) / "synthetic_pubmed.xml"
+        write_synthetic_pubmed_xml(xml_file, args.articles)
+
+        results = {'plain': measure_schema(Path(tmp_dir) / "plain.db", xml_file)}
+        for codec in COMPRESSION_CODECS:
+            try:
+                results[f'compact ({codec})'] = measure_schema(Path(tmp_dir) / f"compact_{codec}.db", xml_file, codec)
+            except ImportError:
+                print(f"Skipping codec {codec}, as it is not installed")
+
+    plain_size = results['plain'][0]
+    print(f"{'schema':16} {'size (MB)':>10} {'ratio':>6} {'scan (s)':>9} {'read (s)':>9}")
+    for name, (size, scan_time, read_time) in results.items():
+        print(f"{name:16} {size / 2 ** 20:10.1f} {plain_size / size:6.2f} {scan_time:9.3f} {read_time:9.3f}")
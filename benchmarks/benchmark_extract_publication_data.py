@@ -0,0 +1,81 @@
+"""
+Micro-benchmark comparing the number of articles per second the field extraction of
+:func:~`data_processing.extract_publication_data.iterate_publications_from_xml` achieves with precompiled XPath
+expressions against the previous implementation, which evaluated the XPath expressions from strings for every article.
+Both variants parse the same synthetic Pubmed XML file, which is generated in a temporary folder.
+"""
+
+import argparse
+import tempfile
+import time
+
+from pathlib import Path
+
+from data_processing.extract_publication_data import ELEM_OF_INTEREST
+from data_processing.extract_publication_data import Publication
+from data_processing.extract_publication_data import iterate_publications_from_xml
+from data_processing.synthetic_pubmed import write_synthetic_pubmed_xml
+
+
+def iterate_publications_from_xml_uncompiled(file_path):
+    """
+    Previous implementation of the field extraction, evaluating the XPath expressions from strings for every article.
+
+    :param file_path: path to XML file from which publication data is to be extracted
+    :type file_path: str
+    :return: generator of publications found in the XML file
+    :rtype: generator
+    """
+    from lxml import etree
+    for event, elem in etree.iterparse(file_path, events=('end',), tag="PubmedArticle"):
+        publication = Publication()
+        for key, value in ELEM_OF_INTEREST.items():
+            eoi = elem.xpath(value)
+            if len(eoi) > 0:
+                if eoi[0].text is not None:
+                    publication.__setattr__(key, eoi[0].text)
+            else:
+                break
+        yield publication
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+def measure_articles_per_second(iterate_publications, file_path: str, repeats: int):
+    """
+    Measures the best throughput of a publication generator over a number of repeats.
+
+    :param iterate_publications: generator function taking the file path
+    :type iterate_publications: callable
+    :param file_path: path to the XML file to be parsed
+    :type file_path: str
+    :param repeats: number of times the file is parsed
+    :type repeats: int
+    :return: highest number of articles per second measured
+    :rtype: float
+    """
+    best = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        n_articles = sum(1 for _ in iterate_publications(file_path))
+        best = max(best, n_articles / (time.perf_counter() - start))
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--articles", type=int, default=30000, help="number of articles in the synthetic file")
+    parser.add_argument("--repeats", type=int, default=3, help="number of times each variant parses the file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        xml_file = str(Path(tmp_dir) / "synthetic_pubmed.xml")
+        write_synthetic_pubmed_xml(xml_file, args.articles)
+
+        uncompiled = measure_articles_per_second(iterate_publications_from_xml_uncompiled, xml_file, args.repeats)
+        compiled = measure_articles_per_second(iterate_publications_from_xml, xml_file, args.repeats)
+
+    print(f"XPath evaluated from strings: {uncompiled:10.0f} articles/s")
+    print(f"Precompiled XPath:            {compiled:10.0f} articles/s")
+    print(f"Speed-up:                     {compiled / uncompiled:10.2f}x")
@@ -0,0 +1,109 @@
+"""
+Benchmark comparing the number of articles per second extracted with the five fields of the table publications only
+against the extraction of all details in :data:~`data_processing.extract_publication_data.DETAIL_FIELDS` in addition.
+Both the parsing alone and the ingestion into a database, including the writing of the child tables, are measured on
+the same synthetic Pubmed XML file with structured abstracts, several items per detail and a list of references, which
+is generated in a temporary folder. The default numbers of items and references are chosen to resemble typical MEDLINE
+articles. The benchmark reports whether the extraction of the details costs at most 20% of the throughput.
+"""
+
+import argparse
+import io
+import tempfile
+import time
+
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from data_processing.extract_publication_data import DETAIL_FIELDS
+from data_processing.extract_publication_data import create_publication_tables
+from data_processing.extract_publication_data import iterate_publications_from_xml
+from data_processing.ingest_publication_data import ingest_xml_files
+from data_processing.synthetic_pubmed import write_synthetic_pubmed_xml
+from protein_score_utilities.convenience_functions_database import create_database_connection
+
+# highest share of the throughput of the five fields the extraction of the details may cost
+MAX_SLOWDOWN = 0.2
+
+
+def measure_parsing(xml_file: str, fields: tuple, repeats: int):
+    """
+    Measures the best number of articles per second parsed including the details given.
+
+    :param xml_file: path to the XML file to be parsed
+    :type xml_file: str
+    :param fields: names of the details extracted
+    :type fields: tuple
+    :param repeats: number of times the file is parsed
+    :type repeats: int
+    :return: highest number of articles per second measured
+    :rtype: float
+    """
+    best = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        n_articles = sum(1 for _ in iterate_publications_from_xml(xml_file, fields=fields))
+        best = max(best, n_articles / (time.perf_counter() - start))
+    return best
+
+
+def measure_ingestion(xml_file: str, tmp_dir: str, fields: tuple, repeats: int):
+    """
+    Measures the best number of articles per second ingested into a new database including the details given, with
+    the connection set up for bulk loads as by the run script.
+
+    :param xml_file: path to the XML file to be ingested
+    :type xml_file: str
+    :param tmp_dir: folder the databases are created in
+    :type tmp_dir: str
+    :param fields: names of the details extracted
+    :type fields: tuple
+    :param repeats: number of times the file is ingested
+    :type repeats: int
+    :return: highest number of articles per second measured
+    :rtype: float
+    """
+    best = 0.0
+    for i in range(repeats):
+        db_file = Path(tmp_dir) / f"details_{len(fields)}_{i}.db"
+        db_conn = create_database_connection(db_file, profile='bulk_load')
+        create_publication_tables(db_conn, fields=fields)
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            n_articles = ingest_xml_files([xml_file], db_conn, upsert=True, fields=fields)[0]
+        best = max(best, n_articles / (time.perf_counter() - start))
+        db_conn.close()
+        db_file.unlink()
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--articles", type=int, default=30000, help="number of articles in the synthetic file")
+    parser.add_argument("--items", type=int, default=8, help="number of authors and MeSH headings per article")
+    parser.add_argument("--references", type=int, default=20, help="number of references per article")
+    parser.add_argument("--repeats", type=int, default=3, help="number of times each variant processes the file")
+    args = parser.parse_args()
+
+    all_fields = tuple(DETAIL_FIELDS)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        xml_file = str(Path(tmp_dir) / "synthetic_pubmed.xml")
+        write_synthetic_pubmed_xml(xml_file, args.articles, n_items=args.items, n_references=args.references)
+
+        five_fields = measure_parsing(xml_file, (), args.repeats)
+        print(f"Parsing with five fields:     {five_fields:10.0f} articles/s")
+        # the share of the throughput each detail costs on its own, to decide which details to extract
+        for field in all_fields:
+            details = measure_parsing(xml_file, (field,), args.repeats)
+            print(f"Parsing with {field + ':':17}{details:10.0f} articles/s ({details / five_fields:.0%})")
+        details = measure_parsing(xml_file, all_fields, args.repeats)
+        print(f"Parsing with all details:     {details:10.0f} articles/s ({details / five_fields:.0%})")
+        results = [details >= (1 - MAX_SLOWDOWN) * five_fields]
+
+        five_fields = measure_ingestion(xml_file, tmp_dir, (), args.repeats)
+        details = measure_ingestion(xml_file, tmp_dir, all_fields, args.repeats)
+        results.append(details >= (1 - MAX_SLOWDOWN) * five_fields)
+        print(f"Ingestion with five fields:   {five_fields:10.0f} articles/s")
+        print(f"Ingestion with all details:   {details:10.0f} articles/s ({details / five_fields:.0%})")
+
+    print(f"Throughput within {MAX_SLOWDOWN:.0%}: {'yes' if all(results) else 'no'}")
@@ -0,0 +1,299 @@
+"""
+Benchmark suite measuring the throughput and the peak memory of the hot functions of the ingestion and of the complete
+pipeline of scripts/run_data_processing_XML.py on a synthetic data set, which is generated deterministically by
+:mod:~`data_processing.synthetic_pubmed`. Each benchmark runs in a fresh process, so that the peak memory measured is
+the one of the benchmark alone. The results can be saved as baseline and later runs compared against it, where
+throughput falling or memory growing by more than the tolerance is reported as regression.
+
+Baselines are only comparable on the same machine with the same parameters, which are stored with the results and
+checked when comparing.
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from data_processing.synthetic_pubmed import write_synthetic_pubmed_xml
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+# parameters that need to match for results to be compared
+DATA_PARAMETERS = ('files', 'articles', 'abstract_words', 'items', 'duplicate_rate', 'missing_rate', 'gzip', 'seed',
+                   'workers')
+
+
+def generate_data_set(data_dir: Path, args):
+    """
+    Generates the synthetic Pubmed files of the data set, where every file continues the PMIDs of the previous one and
+    deletes some publications of it, like Pubmed update files.
+
+    :param data_dir: folder the files are written to
+    :type data_dir: Path
+    :param args: parameters of the suite
+    :type args: argparse.Namespace
+    :return: paths to the files and the counters an ingestion into an empty database is expected to report
+    :rtype: tuple
+    """
+    data_dir.mkdir(parents=True, exist_ok=True)
+    file_paths = []
+    expected = [0, 0, 0, 0]
+    previous_pmids = set()
+    for i in range(args.files):
+        file_path = data_dir / f"pubmed_{i:04d}.xml{'.gz' if args.gzip else ''}"
+        # the PMIDs of the files do not overlap, as every file has at most as many distinct PMIDs as articles
+        first_pmid = 1 + i * args.articles
+        deleted_pmids = tuple(range(first_pmid - args.articles, first_pmid - args.articles + 10)) if i > 0 else ()
+        complete_pmids = set()
+        counters = write_synthetic_pubmed_xml(file_path, args.articles, abstract_words=args.abstract_words,
+                                              seed=args.seed + i, n_items=args.items,
+                                              duplicate_rate=args.duplicate_rate, missing_rate=args.missing_rate,
+                                              first_pmid=first_pmid, deleted_pmids=deleted_pmids,
+                                              complete_pmids=complete_pmids)
+        file_paths.append(file_path)
+        # the publications deleted belong to the previous file, which is not known to the generator of this file
+        counters = counters[:3] + (len(previous_pmids.intersection(deleted_pmids)),)
+        expected = [total + counter for total, counter in zip(expected, counters)]
+        previous_pmids = complete_pmids
+    return file_paths, tuple(expected)
+
+
+def _result(name: str, n_items: int, unit: str, seconds: list, **fields):
+    """
+    Returns the result of a benchmark with the best throughput of the repeats and the peak memory of the process.
+    """
+    from protein_score_utilities.run_metrics import peak_rss_bytes
+    return dict(name=name, throughput=round(n_items / min(seconds), 1), unit=unit, seconds=round(min(seconds), 4),
+                peak_rss_bytes=peak_rss_bytes(), **fields)
+
+
+def benchmark_parse(file_paths: list, repeats: int, fields: tuple = ()):
+    """
+    Measures the publications parsed per second by
+    :func:~`data_processing.extract_publication_data.iterate_publications_from_xml`, with the details given.
+    """
+    from data_processing.extract_publication_data import iterate_publications_from_xml
+
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        stats = {}
+        n_publications = sum(1 for file_path in file_paths
+                             for _ in iterate_publications_from_xml(file_path, fields=fields, stats=stats))
+        seconds.append(time.perf_counter() - start)
+    return _result('parse_details' if fields else 'parse', n_publications, 'publications/s', seconds,
+                   megabytes_per_second=round(stats['bytes_read'] / min(seconds) / 1e6, 1))
+
+
+def benchmark_to_record(file_paths: list, repeats: int, codec: str = 'zlib'):
+    """
+    Measures the publication records prepared per second by
+    :meth:~`data_processing.extract_publication_data.Publication.to_record`, including the compression of the
+    abstracts for the compact schema.
+    """
+    from data_processing.extract_publication_data import iterate_publications_from_xml
+
+    publications = [publication for publication in iterate_publications_from_xml(file_paths[0])
+                    if publication._has_all_attributes()]
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for publication in publications:
+            publication.to_record(codec)
+        seconds.append(time.perf_counter() - start)
+    return _result('to_record', len(publications), 'records/s', seconds, codec=codec)
+
+
+def benchmark_bulk_insert(file_paths: list, repeats: int, tmp_dir: str):
+    """
+    Measures the publication records written per second by
+    :class:~`protein_score_utilities.convenience_functions_database.BulkInsertWriter` into a database set up with the
+    profile for bulk loads.
+    """
+    from data_processing.extract_publication_data import create_publication_tables
+    from data_processing.extract_publication_data import create_publication_writer
+    from data_processing.extract_publication_data import iterate_publications_from_xml
+    from protein_score_utilities.convenience_functions_database import create_database_connection
+
+    records = [publication.to_record() for file_path in file_paths
+               for publication in iterate_publications_from_xml(file_path) if publication._has_all_attributes()]
+    seconds = []
+    for i in range(repeats):
+        db_conn = create_database_connection(Path(tmp_dir) / f"bulk_insert_{i}.db", profile='bulk_load')
+        create_publication_tables(db_conn)
+        start = time.perf_counter()
+        with create_publication_writer(db_conn, upsert=True) as writer:
+            writer.add_many(records)
+        seconds.append(time.perf_counter() - start)
+        db_conn.close()
+    return _result('bulk_insert', len(records), 'records/s', seconds)
+
+
+def benchmark_pipeline(data_dir: Path, repeats: int, tmp_dir: str, n_workers: int, expected: tuple):
+    """
+    Runs the complete pipeline of scripts/run_data_processing_XML.py on the data set and measures the publications
+    ingested per second over the whole run, including the start of the script and the full-text index. The counters
+    of the metrics file of the run are checked against the ones expected for the data set, the peak memory is the
+    highest one of the processes of the pipeline.
+    """
+    seconds = []
+    peak_rss = 0
+    for i in range(repeats):
+        processed_dir = Path(tmp_dir) / f"pipeline_{i}"
+        processed_dir.mkdir()
+        config_file = processed_dir / "config.yml"
+        config_file.write_text(f"config_for: 'benchmark suite'\n"
+                               f"data_raw: '{data_dir}/'\n"
+                               f"data_processed: '{processed_dir}/'\n"
+                               f"db_file: 'publication_data.sql'\n"
+                               f"database_rewrite: True\n"
+                               f"n_workers: {n_workers}\n"
+                               f"full_text_index: True\n"
+                               f"metrics_file: 'metrics.jsonl'\n", encoding="UTF-8")
+        start = time.perf_counter()
+        subprocess.run([sys.executable, str(ROOT_DIR / "scripts" / "run_data_processing_XML.py"), str(config_file)],
+                       check=True, stdout=subprocess.DEVNULL, cwd=ROOT_DIR)
+        seconds.append(time.perf_counter() - start)
+
+        events = [json.loads(line) for line in (processed_dir / "metrics.jsonl").read_text().splitlines()]
+        run = next(event for event in events if event['event'] == 'run')
+        counters = tuple(run[counter] for counter in ('publications', 'publications_incomplete',
+                                                      'publications_duplicated', 'publications_deleted'))
+        if counters != expected:
+            raise AssertionError(f"Pipeline reported {counters} rather than the expected counters {expected}")
+        peak_rss = max([peak_rss] + [event['peak_rss_bytes'] or 0 for event in events] +
+                       [event.get('worker_peak_rss_bytes') or 0 for event in events])
+        db_conn = sqlite3.connect(processed_dir / "publication_data.sql")
+        n_stored = db_conn.execute("SELECT COUNT(*) FROM publications").fetchone()[0]
+        db_conn.close()
+    result = _result('pipeline', expected[0], 'publications/s', seconds, stored_publications=n_stored)
+    # the memory of the benchmark process itself is irrelevant, the one of the processes of the pipeline counts
+    result['peak_rss_bytes'] = peak_rss
+    return result
+
+
+def _run_isolated(function, *args):
+    """
+    Runs a benchmark in a fresh process and returns its result, with the output of the benchmark suppressed.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(_call_quietly, function, *args).result()
+
+
+def _call_quietly(function, *args):
+    with redirect_stdout(io.StringIO()):
+        return function(*args)
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float):
+    """
+    Prints the change of throughput and peak memory of each benchmark compared with the baseline.
+
+    :param results: results of the current run
+    :type results: dict
+    :param baseline: results of the baseline run
+    :type baseline: dict
+    :param tolerance: share by which the throughput may fall or the peak memory grow before it is a regression
+    :type tolerance: float
+    :return: names of the benchmarks that regressed
+    :rtype: list
+    """
+    differing = [name for name in DATA_PARAMETERS
+                 if results['parameters'].get(name) != baseline['parameters'].get(name)]
+    if differing:
+        print(f"Warning: the parameters {', '.join(differing)} differ from the baseline, results are not comparable")
+
+    regressions = []
+    print(f"{'benchmark':<20} {'throughput':>12} {'baseline':>12} {'change':>8} {'peak MB':>9} {'baseline':>9}")
+    for name, result in results['benchmarks'].items():
+        base = baseline['benchmarks'].get(name)
+        if base is None:
+            print(f"{name:<20} {result['throughput']:>12.0f} {'-':>12}")
+            continue
+        change = result['throughput'] / base['throughput'] - 1
+        memory_change = result['peak_rss_bytes'] / base['peak_rss_bytes'] - 1 if base['peak_rss_bytes'] else 0
+        flag = ""
+        if change < -tolerance or memory_change > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<20} {result['throughput']:>12.0f} {base['throughput']:>12.0f} {change:>+8.1%} "
+              f"{result['peak_rss_bytes'] / 2 ** 20:>9.1f} {base['peak_rss_bytes'] / 2 ** 20:>9.1f}{flag}")
+    return regressions
+
+
+def _environment():
+    """
+    Returns a description of the machine and the code the benchmarks have been run on.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return dict(python=platform.python_version(), platform=platform.platform(), machine=platform.machine(),
+                cpus=multiprocessing.cpu_count(), sqlite=sqlite3.sqlite_version, commit=commit)
+
+
+BENCHMARKS = ('parse', 'parse_details', 'to_record', 'bulk_insert', 'pipeline')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=4, help="number of files of the data set")
+    parser.add_argument("--articles", type=int, default=10000, help="number of articles per file")
+    parser.add_argument("--abstract-words", type=int, default=200, help="average number of words per abstract")
+    parser.add_argument("--items", type=int, default=4, help="number of authors and MeSH headings per article")
+    parser.add_argument("--duplicate-rate", type=float, default=0.02, help="share of articles repeating a PMID")
+    parser.add_argument("--missing-rate", type=float, default=0.01, help="share of articles lacking a field")
+    parser.add_argument("--gzip", action="store_true", help="generate gzip compressed files")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the generator")
+    parser.add_argument("--workers", type=int, default=1, help="number of parsing processes of the pipeline")
+    parser.add_argument("--repeats", type=int, default=3, help="number of times each benchmark is run")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS, help="benchmarks to be run")
+    parser.add_argument("--data-dir", help="folder to keep the data set in rather than a temporary folder")
+    parser.add_argument("--save", help="JSON file the results are written to, e.g. as baseline")
+    parser.add_argument("--baseline", help="JSON file with the results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="share by which throughput may fall or memory grow before it counts as regression")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = Path(args.data_dir).resolve() if args.data_dir else Path(tmp_dir) / "raw"
+        file_paths, expected = generate_data_set(data_dir, args)
+        size = sum(file_path.stat().st_size for file_path in file_paths)
+        print(f"Data set of {len(file_paths)} files with {expected[0]} articles ({size / 1e6:.1f} MB) in {data_dir}")
+
+        from data_processing.extract_publication_data import DETAIL_FIELDS
+        runs = {
+            'parse': (benchmark_parse, file_paths, args.repeats),
+            'parse_details': (benchmark_parse, file_paths, args.repeats, tuple(DETAIL_FIELDS)),
+            'to_record': (benchmark_to_record, file_paths, args.repeats),
+            'bulk_insert': (benchmark_bulk_insert, file_paths, args.repeats, tmp_dir),
+            'pipeline': (benchmark_pipeline, data_dir, args.repeats, tmp_dir, args.workers, expected),
+        }
+        benchmarks = {}
+        for name in args.only:
+            result = _run_isolated(*runs[name])
+            benchmarks[name] = result
+            print(f"{name:<20} {result['throughput']:>12.0f} {result['unit']:<15} "
+                  f"peak {result['peak_rss_bytes'] / 2 ** 20:.1f} MB")
+
+    results = dict(environment=_environment(), parameters=vars(args), benchmarks=benchmarks)
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(results, indent=2), encoding="UTF-8")
+        print(f"Results written to {args.save}")
+    if args.baseline:
+        regressions = compare_with_baseline(results, json.loads(Path(args.baseline).read_text(encoding="UTF-8")),
+                                            args.tolerance)
+        if regressions:
+            print(f"Regressions in {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,323 @@
+"""
+Module that provides functionality to annotate the publications held in the SQLite database with mentions of proteins
+and genes. The annotation is dictionary based: a lexicon mapping synonyms (e.g. protein names, gene symbols) to an
+identifier (e.g. a UniProt accession or HGNC ID) is read from a tab separated file and compiled into an Aho-Corasick
+automaton <https://en.wikipedia.org/wiki/Aho%E2%80%93Corasick_algorithm>`_. The automaton finds all synonyms in a text
+in a single pass, so that the time needed grows with the length of the text only, however large the lexicon.
+
+Mentions are only accepted at word boundaries and, by default, only the longest of overlapping mentions is kept. The
+mentions found in title and abstract of each publication are written with their character offsets to the table
+annotations.
+"""
+
+from protein_score_utilities.convenience_functions_database import decompress_text
+from protein_score_utilities.convenience_functions_files import open_data_file
+
+SQL_CREATE_ANNOTATIONS_TABLE = "CREATE TABLE IF NOT EXISTS annotations (pmid integer NOT NULL, " \
+                               "entity_id text NOT NULL, entity_type text NOT NULL, section text NOT NULL, " \
+                               "start_offset integer NOT NULL, end_offset integer NOT NULL, matched_text text NOT NULL);"
+SQL_CREATE_ANNOTATIONS_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS annotations_pmid ON annotations(pmid);",
+    "CREATE INDEX IF NOT EXISTS annotations_entity ON annotations(entity_type, entity_id);",
+)
+ANNOTATION_COLUMNS = ('pmid', 'entity_id', 'entity_type', 'section', 'start_offset', 'end_offset', 'matched_text')
+
+# number of publications read from the database at once
+DEFAULT_CHUNK_SIZE = 2000
+# synonyms shorter than this are ignored, as they lead to a large number of false positive mentions
+DEFAULT_MIN_SYNONYM_LENGTH = 2
+
+# characters are packed together with the node into one integer key of the transition table, unicode code points
+# need at most 21 bits
+_CHAR_BITS = 21
+
+
+def read_lexicon(file_path, id_column: int = 0, synonym_column: int = 1, has_header: bool = False,
+                 separator: str = "\t"):
+    """
+    Reads a lexicon from a tab separated file (optionally compressed, e.g. .tsv.gz), where each line holds the
+    identifier of an entity and one of its synonyms, e.g. as exported from UniProt or HGNC. Entities with multiple
+    synonyms are listed on multiple lines.
+
+    :param file_path: path to the lexicon file
+    :type file_path: str or Path
+    :param id_column: index of the column holding the identifier
+    :type id_column: int
+    :param synonym_column: index of the column holding the synonym
+    :type synonym_column: int
+    :param has_header: whether the first line of the file is a header to be skipped
+    :type has_header: bool
+    :param separator: separator of the columns
+    :type separator: str
+    :return: dictionary mapping each synonym to the set of identifiers it refers to
+    :rtype: dict
+    """
+    import io
+
+    lexicon = {}
+    with io.TextIOWrapper(open_data_file(file_path), encoding="UTF-8") as file:
+        if has_header:
+            next(file, None)
+        for line in file:
+            fields = line.rstrip("\r\n").split(separator)
+            if len(fields) <= max(id_column, synonym_column):
+                continue
+            entity_id = fields[id_column].strip()
+            synonym = fields[synonym_column].strip()
+            if entity_id and synonym:
+                lexicon.setdefault(synonym, set()).add(entity_id)
+    return lexicon
+
+
+def _normalise(text: str, case_sensitive: bool):
+    """
+    Normalises a text for matching while keeping the character offsets intact.
+
+    :param text: text to be normalised
+    :type text: str
+    :param case_sensitive: whether the case of the characters is kept
+    :type case_sensitive: bool
+    :return: normalised text of the same length as the text provided
+    :rtype: str
+    """
+    if case_sensitive:
+        return text
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    # a few characters are lowered to more than one character, these are kept as they are
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+class LexiconAnnotator:
+    """
+    Annotator that finds the synonyms of a lexicon in texts using an Aho-Corasick automaton. The automaton is held in
+    flat structures (one dictionary for all transitions and lists indexed by node), which keeps the memory needed for
+    lexicons with hundreds of thousands of synonyms manageable.
+    """
+
+    def __init__(self, lexicon: dict, case_sensitive: bool = False, min_length: int = DEFAULT_MIN_SYNONYM_LENGTH,
+                 longest_only: bool = True):
+        """
+        Compiling the lexicon into the automaton.
+
+        :param lexicon: dictionary mapping each synonym to the identifier(s) it refers to, as from :func:~`read_lexicon`
+        :type lexicon: dict
+        :param case_sensitive: whether synonyms need to match the case of the text
+        :type case_sensitive: bool
+        :param min_length: minimal number of characters of a synonym to be considered
+        :type min_length: int
+        :param longest_only: whether only the longest of overlapping mentions is kept
+        :type longest_only: bool
+        """
+        self.case_sensitive = case_sensitive
+        self.longest_only = longest_only
+
+        # synonyms normalised to the same string are merged
+        patterns = {}
+        for synonym, entity_ids in lexicon.items():
+            if len(synonym) < min_length:
+                continue
+            if isinstance(entity_ids, str):
+                entity_ids = (entity_ids,)
+            patterns.setdefault(_normalise(synonym, case_sensitive), set()).update(entity_ids)
+
+        # pattern index -> (length of the pattern, identifiers)
+        self._patterns = [(len(pattern), tuple(sorted(entity_ids))) for pattern, entity_ids in patterns.items()]
+        self._build_automaton(patterns)
+
+    def _build_automaton(self, patterns: dict):
+        """
+        Builds the trie of the patterns and adds the failure and output links in breadth first order.
+
+        :param patterns: normalised patterns in the order of their index
+        :type patterns: dict
+        """
+        goto = {}
+        terminal = [-1]
+        for pattern_index, pattern in enumerate(patterns):
+            node = 0
+            for char in pattern:
+                key = (node << _CHAR_BITS) | ord(char)
+                child = goto.get(key)
+                if child is None:
+                    child = len(terminal)
+                    goto[key] = child
+                    terminal.append(-1)
+                node = child
+            terminal[node] = pattern_index
+
+        # children of each node, needed only while the links are computed
+        children = [[] for _ in terminal]
+        for key, child in goto.items():
+            children[key >> _CHAR_BITS].append((key & ((1 << _CHAR_BITS) - 1), child))
+
+        fail = [0] * len(terminal)
+        # nearest node along the failure links at which a pattern ends
+        output = [-1] * len(terminal)
+        queue = [child for _, child in children[0]]
+        for node in queue:
+            for char, child in children[node]:
+                state = fail[node]
+                while state and ((state << _CHAR_BITS) | char) not in goto:
+                    state = fail[state]
+                target = goto.get((state << _CHAR_BITS) | char, 0)
+                fail[child] = target if target != child else 0
+                output[child] = fail[child] if terminal[fail[child]] >= 0 else output[fail[child]]
+                queue.append(child)
+
+        self._goto = goto
+        self._fail = fail
+        self._terminal = terminal
+        self._output = output
+
+    @property
+    def n_synonyms(self):
+        """
+        Number of distinct (normalised) synonyms in the automaton.
+        """
+        return len(self._patterns)
+
+    def find_mentions(self, text: str):
+        """
+        Finds all synonyms of the lexicon in a text. A mention needs to start and end at a word boundary, i.e. it may
+        not be preceded or followed by a letter or digit.
+
+        :param text: text to be searched
+        :type text: str
+        :return: list of mentions, each a tuple of start offset, end offset and identifiers of the synonym
+        :rtype: list
+        """
+        if not text:
+            return []
+
+        goto = self._goto
+        fail = self._fail
+        terminal = self._terminal
+        output = self._output
+        patterns = self._patterns
+
+        mentions = []
+        node = 0
+        for position, char in enumerate(_normalise(text, self.case_sensitive)):
+            char = ord(char)
+            while True:
+                child = goto.get((node << _CHAR_BITS) | char)
+                if child is not None:
+                    node = child
+                    break
+                if node == 0:
+                    break
+                node = fail[node]
+
+            match = node if terminal[node] >= 0 else output[node]
+            while match > 0:
+                length, entity_ids = patterns[terminal[match]]
+                start = position + 1 - length
+                end = position + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    mentions.append((start, end, entity_ids))
+                match = output[match]
+
+        if self.longest_only and len(mentions) > 1:
+            mentions = _keep_longest_mentions(mentions)
+        return mentions
+
+
+def _keep_longest_mentions(mentions: list):
+    """
+    Removes mentions overlapping with a longer mention, preferring the leftmost mention among equally long ones.
+
+    :param mentions: mentions as tuples of start offset, end offset and identifiers
+    :type mentions: list
+    :return: non-overlapping mentions sorted by their start offset
+    :rtype: list
+    """
+    from bisect import bisect_right
+
+    starts = []
+    kept = []
+    for mention in sorted(mentions, key=lambda m: (m[0] - m[1], m[0])):
+        i = bisect_right(starts, mention[0])
+        # the mention overlaps if the previous kept mention ends after its start or the next one starts before its end
+        if (i > 0 and kept[i - 1][1] > mention[0]) or (i < len(kept) and kept[i][0] < mention[1]):
+            continue
+        starts.insert(i, mention[0])
+        kept.insert(i, mention)
+    return kept
+
+
+def iterate_publication_texts(db_conn, chunk_size: int = DEFAULT_CHUNK_SIZE, after_pmid: int = None,
+                              up_to_pmid: int = None):
+    """
+    Generator reading PMID, title and abstract of the publications in chunks ordered by PMID. Each chunk is read with
+    a separate query starting after the last PMID of the previous chunk, so that only one chunk is held in memory at a
+    time and the database is not locked while the chunks are processed. Compressed abstracts are decompressed.
+
+    :param db_conn: connection to the database holding the table publications
+    :type db_conn: sqlite3.Connection
+    :param chunk_size: number of publications per chunk
+    :type chunk_size: int
+    :param after_pmid: only publications with a PMID larger than this are read, None to start at the beginning
+    :type after_pmid: int
+    :param up_to_pmid: only publications with a PMID up to and including this are read, None to read to the end
+    :type up_to_pmid: int
+    :return: generator of lists of tuples of PMID, title and abstract
+    :rtype: generator
+    """
+    last_pmid = after_pmid if after_pmid is not None else -1
+    upper_bound = up_to_pmid if up_to_pmid is not None else (1 << 63) - 1
+    while True:
+        chunk = db_conn.execute("SELECT pmid, title, pub_abstract FROM publications WHERE pmid > ? AND pmid <= ? "
+                                "ORDER BY pmid LIMIT ?", (last_pmid, upper_bound, chunk_size)).fetchall()
+        if not chunk:
+            return
+        yield [(pmid, title, decompress_text(abstract)) for pmid, title, abstract in chunk]
+        last_pmid = chunk[-1][0]
+
+
+def annotate_publication_chunk(annotator: LexiconAnnotator, chunk: list, entity_type: str = 'protein'):
+    """
+    Finds the mentions in title and abstract of a chunk of publications.
+
+    :param annotator: annotator holding the compiled lexicon
+    :type annotator: LexiconAnnotator
+    :param chunk: tuples of PMID, title and abstract
+    :type chunk: list
+    :param entity_type: type of the entities of the lexicon, e.g. 'protein'
+    :type entity_type: str
+    :return: annotation records in the order of :data:~`ANNOTATION_COLUMNS`
+    :rtype: list
+    """
+    records = []
+    for pmid, title, abstract in chunk:
+        for section, text in (('title', title), ('abstract', abstract)):
+            for start, end, entity_ids in annotator.find_mentions(text):
+                matched_text = text[start:end]
+                for entity_id in entity_ids:
+                    records.append((pmid, entity_id, entity_type, section, start, end, matched_text))
+    return records
+
+
+def annotate_publications(db_conn, annotator: LexiconAnnotator, entity_type: str = 'protein',
+                          chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Annotates all publications in the database with the mentions of the lexicon entities and writes them to the table
+    annotations, which needs to exist. Annotations of the same entity type written before are removed first, together
+    with the progress recorded for them, as by a restart of
+    :func:~`data_processing.annotation_pipeline.annotate_publications_parallel` within the calling process.
+
+    :param db_conn: connection to the database holding the tables publications and annotations
+    :type db_conn: sqlite3.Connection
+    :param annotator: annotator holding the compiled lexicon
+    :type annotator: LexiconAnnotator
+    :param entity_type: type of the entities of the lexicon, e.g. 'protein'
+    :type entity_type: str
+    :param chunk_size: number of publications read from the database at once
+    :type chunk_size: int
+    :return: number of publications annotated and number of mentions found
+    :rtype: tuple
+    """
+    from data_processing.annotation_pipeline import annotate_publications_parallel
+    return annotate_publications_parallel(db_conn, annotator, entity_type=entity_type, n_workers=1,
+                                          chunk_size=chunk_size, restart=True)
@@ -0,0 +1,291 @@
+"""
+Module that provides a parallel pipeline stage for the annotation of publications, as implemented in
+:mod:~`data_processing.annotate_text_data`. The publications are read from the database in chunks of consecutive PMIDs
+and fanned out to a pool of worker processes, while the calling process is the only one writing the annotations back.
+
+The compiled lexicon is shared with the workers rather than sent along with every chunk: where processes are forked,
+the workers inherit it from the calling process (copy-on-write), otherwise it is sent once to each worker when the pool
+is started. Only a limited number of chunks is in flight at any time, so that the memory needed does not depend on the
+number of publications in the database.
+
+The progress is recorded as watermark, the highest PMID up to which all publications have been annotated, which is
+committed together with the annotations of each chunk. An interrupted run therefore resumes after the last chunk
+written, and publications added later with higher PMIDs (e.g. from Pubmed update files) are annotated in the next run.
+
+Publications changed at or below the watermark are tracked by triggers on the table publications (see
+:func:~`create_annotation_tracking`): the annotations of deleted and updated publications are removed as soon as the
+publication is, and the PMIDs are queued in the table annotation_queue, as are the PMIDs of publications inserted at or
+below the watermark (e.g. records incomplete before and completed by an update file), so that the publications inserted,
+updated, or deleted and ingested again, are annotated at the start of the next run. Only the entity types annotated by
+this pipeline are recorded in the table annotation_progress, as the publications queued for them are only removed from
+the queue by their next run.
+"""
+
+from collections import deque
+
+from data_processing.annotate_text_data import ANNOTATION_COLUMNS
+from data_processing.annotate_text_data import DEFAULT_CHUNK_SIZE
+from data_processing.annotate_text_data import annotate_publication_chunk
+from data_processing.annotate_text_data import iterate_publication_texts
+from protein_score_utilities.convenience_functions_database import BulkInsertWriter
+from protein_score_utilities.convenience_functions_database import decompress_text
+
+SQL_CREATE_ANNOTATION_PROGRESS_TABLE = "CREATE TABLE IF NOT EXISTS annotation_progress (" \
+                                       "entity_type text PRIMARY KEY, last_pmid integer NOT NULL, updated_at text);"
+SQL_CREATE_ANNOTATION_QUEUE_TABLE = "CREATE TABLE IF NOT EXISTS annotation_queue (entity_type text NOT NULL, " \
+                                    "pmid integer NOT NULL, PRIMARY KEY (entity_type, pmid)) WITHOUT ROWID;"
+# statements of the triggers removing the annotations of publications deleted or updated and queueing the publications
+# for every entity type whose watermark they are at or below of
+_SQL_QUEUE_PUBLICATION = "DELETE FROM annotations WHERE pmid=old.pmid; " \
+                         "INSERT OR IGNORE INTO annotation_queue(entity_type, pmid) SELECT entity_type, old.pmid " \
+                         "FROM annotation_progress WHERE last_pmid >= old.pmid;"
+SQL_CREATE_ANNOTATION_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS publications_annotations_delete AFTER DELETE ON publications "
+    f"BEGIN {_SQL_QUEUE_PUBLICATION} END;",
+    "CREATE TRIGGER IF NOT EXISTS publications_annotations_update AFTER UPDATE OF title, pub_abstract ON publications "
+    "WHEN old.title IS NOT new.title OR old.pub_abstract IS NOT new.pub_abstract "
+    f"BEGIN {_SQL_QUEUE_PUBLICATION} END;",
+    "CREATE TRIGGER IF NOT EXISTS publications_annotations_insert AFTER INSERT ON publications "
+    "BEGIN INSERT OR IGNORE INTO annotation_queue(entity_type, pmid) SELECT entity_type, new.pmid "
+    "FROM annotation_progress WHERE last_pmid >= new.pmid; END;",
+)
+
+# number of chunks per worker that are read ahead of the chunk currently written
+DEFAULT_CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+# annotator used by the worker processes, set before the pool is started or through the initializer of the pool
+_annotator = None
+
+
+def _set_annotator(annotator):
+    """
+    Sets the annotator used by :func:~`_annotate_chunk` within the current process.
+
+    :param annotator: annotator holding the compiled lexicon
+    :type annotator: :class:~`data_processing.annotate_text_data.LexiconAnnotator`
+    """
+    global _annotator
+    _annotator = annotator
+
+
+def _annotate_chunk(chunk: list, entity_type: str):
+    """
+    Worker function annotating a chunk of publications with the annotator of the process.
+
+    :param chunk: tuples of PMID, title and abstract, ordered by PMID
+    :type chunk: list
+    :param entity_type: type of the entities of the lexicon
+    :type entity_type: str
+    :return: last PMID of the chunk and the annotation records found
+    :rtype: tuple
+    """
+    return chunk[-1][0], annotate_publication_chunk(_annotator, chunk, entity_type)
+
+
+def create_annotation_tracking(db_conn):
+    """
+    Creates the tables annotation_progress and annotation_queue as well as the triggers keeping the annotations in line
+    with publications deleted, updated or inserted at or below the watermark, if they do not exist yet. The tables
+    publications and annotations need to exist. The triggers are kept when the table publications is migrated to the
+    compact schema.
+
+    :param db_conn: connection to the database holding the tables publications and annotations
+    :type db_conn: sqlite3.Connection
+    """
+    for statement in (SQL_CREATE_ANNOTATION_PROGRESS_TABLE, SQL_CREATE_ANNOTATION_QUEUE_TABLE) + \
+            SQL_CREATE_ANNOTATION_TRIGGERS:
+        db_conn.execute(statement)
+    db_conn.commit()
+
+
+def reset_annotations(db_conn, entity_type: str = None):
+    """
+    Removes the annotations, the watermark and the queued publications of an entity type, or of all entity types, so
+    that all publications are annotated anew, without committing.
+
+    :param db_conn: connection to the database holding the tables annotations, annotation_progress and annotation_queue
+    :type db_conn: sqlite3.Connection
+    :param entity_type: type of the entities, e.g. 'protein', None for all entity types
+    :type entity_type: str
+    """
+    for table_name in ('annotations', 'annotation_progress', 'annotation_queue'):
+        if entity_type is None:
+            db_conn.execute(f"DELETE FROM {table_name}")
+        else:
+            db_conn.execute(f"DELETE FROM {table_name} WHERE entity_type=?", (entity_type,))
+
+
+def _annotate_queued_publications(writer, annotator, entity_type: str, chunk_size: int):
+    """
+    Annotates the publications queued after they have been inserted, updated, or deleted and ingested again at or below
+    the watermark, committing their annotations together with the removal from the queue. Queued publications that have
+    been deleted are only removed from the queue.
+
+    :param writer: writer for the table annotations
+    :type writer: :class:~`protein_score_utilities.convenience_functions_database.BulkInsertWriter`
+    :param annotator: annotator holding the compiled lexicon
+    :type annotator: :class:~`data_processing.annotate_text_data.LexiconAnnotator`
+    :param entity_type: type of the entities, e.g. 'protein'
+    :type entity_type: str
+    :param chunk_size: number of publications annotated together
+    :type chunk_size: int
+    :return: number of publications annotated
+    :rtype: int
+    """
+    db_conn = writer.db_conn
+    counter_publications = 0
+    while True:
+        pmids = [pmid for pmid, in db_conn.execute(
+            "SELECT pmid FROM annotation_queue WHERE entity_type=? ORDER BY pmid LIMIT ?", (entity_type, chunk_size))]
+        if not pmids:
+            return counter_publications
+        placeholders = ",".join("?" for _ in pmids)
+        chunk = [(pmid, title, decompress_text(abstract)) for pmid, title, abstract in db_conn.execute(
+            f"SELECT pmid, title, pub_abstract FROM publications WHERE pmid IN ({placeholders}) ORDER BY pmid", pmids)]
+        # annotations of the publications written by an interrupted run are replaced
+        db_conn.execute(f"DELETE FROM annotations WHERE entity_type=? AND pmid IN ({placeholders})",
+                        [entity_type] + pmids)
+        writer.add_many(annotate_publication_chunk(annotator, chunk, entity_type))
+        writer.flush()
+        db_conn.execute(f"DELETE FROM annotation_queue WHERE entity_type=? AND pmid IN ({placeholders})",
+                        [entity_type] + pmids)
+        writer.commit()
+        counter_publications += len(chunk)
+
+
+def get_annotation_watermark(db_conn, entity_type: str = 'protein'):
+    """
+    Returns the highest PMID up to which all publications have been annotated with entities of the given type.
+
+    :param db_conn: connection to the database holding the table annotation_progress
+    :type db_conn: sqlite3.Connection
+    :param entity_type: type of the entities, e.g. 'protein'
+    :type entity_type: str
+    :return: PMID of the watermark, None if no publication has been annotated yet
+    :rtype: int
+    """
+    row = db_conn.execute("SELECT last_pmid FROM annotation_progress WHERE entity_type=?", (entity_type,)).fetchone()
+    return row[0] if row is not None else None
+
+
+def set_annotation_watermark(db_conn, entity_type: str, last_pmid: int):
+    """
+    Records the highest PMID up to which all publications have been annotated, without committing.
+
+    :param db_conn: connection to the database holding the table annotation_progress
+    :type db_conn: sqlite3.Connection
+    :param entity_type: type of the entities, e.g. 'protein'
+    :type entity_type: str
+    :param last_pmid: PMID of the watermark
+    :type last_pmid: int
+    """
+    db_conn.execute("INSERT INTO annotation_progress(entity_type, last_pmid, updated_at) VALUES(?,?,datetime('now')) "
+                    "ON CONFLICT(entity_type) DO UPDATE SET last_pmid=excluded.last_pmid, "
+                    "updated_at=excluded.updated_at", (entity_type, last_pmid))
+
+
+def _write_annotated_chunk(writer, entity_type: str, last_pmid: int, records: list):
+    """
+    Writes the annotations of a chunk and commits them together with the new watermark.
+
+    :param writer: writer for the table annotations
+    :type writer: :class:~`protein_score_utilities.convenience_functions_database.BulkInsertWriter`
+    :param entity_type: type of the entities, e.g. 'protein'
+    :type entity_type: str
+    :param last_pmid: last PMID of the chunk
+    :type last_pmid: int
+    :param records: annotation records found in the chunk
+    :type records: list
+    """
+    writer.add_many(records)
+    writer.flush()
+    set_annotation_watermark(writer.db_conn, entity_type, last_pmid)
+    writer.commit()
+
+
+def annotate_publications_parallel(db_conn, annotator, entity_type: str = 'protein', n_workers: int = None,
+                                   chunk_size: int = DEFAULT_CHUNK_SIZE, restart: bool = False,
+                                   chunks_in_flight: int = None):
+    """
+    Annotates the publications not annotated yet with the mentions of the lexicon entities, using a pool of worker
+    processes, and writes them to the table annotations, which needs to exist. The publications queued after they have
+    been inserted or updated at or below the watermark are annotated first, within the calling process. The tables and
+    triggers tracking the progress are created if needed (see :func:~`create_annotation_tracking`).
+
+    :param db_conn: connection to the database holding the tables publications, annotations and annotation_progress
+    :type db_conn: sqlite3.Connection
+    :param annotator: annotator holding the compiled lexicon
+    :type annotator: :class:~`data_processing.annotate_text_data.LexiconAnnotator`
+    :param entity_type: type of the entities of the lexicon, e.g. 'protein'
+    :type entity_type: str
+    :param n_workers: number of worker processes, None for the number of CPUs; with one worker, the publications are
+        annotated within the calling process
+    :type n_workers: int
+    :param chunk_size: number of publications per chunk
+    :type chunk_size: int
+    :param restart: whether all annotations of the entity type should be removed and all publications annotated anew
+    :type restart: bool
+    :param chunks_in_flight: maximal number of chunks read but not written yet, by default two per worker
+    :type chunks_in_flight: int
+    :return: number of publications annotated and number of mentions found in this run
+    :rtype: tuple
+    """
+    import multiprocessing
+    import sys
+
+    create_annotation_tracking(db_conn)
+    if restart:
+        reset_annotations(db_conn, entity_type)
+    watermark = get_annotation_watermark(db_conn, entity_type)
+    if watermark is not None:
+        print(f"Resuming annotation after PMID {watermark}")
+        # annotations beyond the watermark can only stem from an interrupted run and are written again
+        db_conn.execute("DELETE FROM annotations WHERE entity_type=? AND pmid>?", (entity_type, watermark))
+    db_conn.commit()
+
+    n_workers = n_workers or multiprocessing.cpu_count()
+    chunks_in_flight = chunks_in_flight or DEFAULT_CHUNKS_IN_FLIGHT_PER_WORKER * n_workers
+    chunks = iterate_publication_texts(db_conn, chunk_size, after_pmid=watermark)
+
+    # annotations are committed together with the watermark of each chunk only
+    writer = BulkInsertWriter(db_conn, 'annotations', ANNOTATION_COLUMNS, transaction_size=sys.maxsize)
+    counter_publications = _annotate_queued_publications(writer, annotator, entity_type, chunk_size)
+    if counter_publications:
+        print(f"Annotated {counter_publications} publications ingested below the watermark since the last run")
+
+    if n_workers == 1:
+        for chunk in chunks:
+            _write_annotated_chunk(writer, entity_type, chunk[-1][0],
+                                   annotate_publication_chunk(annotator, chunk, entity_type))
+            counter_publications += len(chunk)
+    else:
+        if 'fork' in multiprocessing.get_all_start_methods():
+            # forked workers inherit the annotator without it being pickled
+            ctx = multiprocessing.get_context('fork')
+            _set_annotator(annotator)
+            pool = ctx.Pool(n_workers)
+        else:
+            ctx = multiprocessing.get_context()
+            pool = ctx.Pool(n_workers, initializer=_set_annotator, initargs=(annotator,))
+
+        try:
+            # results are written in the order of the chunks, so that the watermark only ever moves forward
+            pending = deque()
+            for chunk in chunks:
+                pending.append((len(chunk), pool.apply_async(_annotate_chunk, (chunk, entity_type))))
+                while len(pending) >= chunks_in_flight:
+                    n_publications, result = pending.popleft()
+                    _write_annotated_chunk(writer, entity_type, *result.get())
+                    counter_publications += n_publications
+            while pending:
+                n_publications, result = pending.popleft()
+                _write_annotated_chunk(writer, entity_type, *result.get())
+                counter_publications += n_publications
+        finally:
+            pool.terminate()
+            pool.join()
+            _set_annotator(None)
+
+    print(f"Total number of publications annotated: {counter_publications}")
+    print(f"Total number of {entity_type} mentions found: {writer.rows_written}")
+    return counter_publications, writer.rows_written
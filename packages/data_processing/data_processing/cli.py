@@ -0,0 +1,171 @@
+"""
+Console entry point of the data processing pipeline, installed as ``pubmed-data-processing`` with the package and run by
+scripts/run_data_processing_XML.py as well:
+
+    pubmed-data-processing data/results/example_1/config.yml
+
+Short incremental runs, e.g. ingesting one daily update file, spend a noticeable share of their time starting up. This
+module therefore only imports the standard library at module level: the config file is read and validated first (see
+:func:~`protein_score_utilities.convenience_functions_files.read_config`), and the modules of the pipeline, lxml and
+sqlite3 are imported once the run starts, only as far as the configured run needs them, e.g. the Parquet export only
+if a Parquet mode is set. The import time can be inspected with ``python -X importtime -m data_processing.cli``.
+"""
+
+import sys
+
+USAGE = "usage: pubmed-data-processing CONFIG_FILE.yml"
+
+
+def _emit_run_summary(metrics, n_workers: int, n_publications: int):
+    """
+    Emits the summary of the whole run, including the stages following the ingestion, as the only summary event.
+    """
+    seconds = metrics.elapsed
+    metrics.emit_summary('run', n_workers=n_workers, seconds=round(seconds, 3),
+                         publications_per_second=round(n_publications / seconds, 1) if seconds > 0 else None)
+
+
+def run_data_processing(config: dict, metrics):
+    """
+    Ingests the XML files of the data_raw folder as configured, reporting the progress to the metrics. The summary of
+    the run is emitted once all stages have completed.
+
+    :param config: settings read from the config file and validated
+    :type config: dict
+    :param metrics: recorder the ingestion is reported to
+    :type metrics: :class:~`protein_score_utilities.run_metrics.MetricsRecorder`
+    """
+    import shutil
+    from pathlib import Path
+
+    from data_processing.ingest_publication_data import ingest_xml_files
+    from protein_score_utilities.convenience_functions_files import read_xml_file_names
+
+    fnames = read_xml_file_names(config['data_raw'])
+    parquet_mode = config.get('parquet_mode', 'off')
+    parquet_dir = Path(config['data_processed']) / config.get('parquet_dir', 'publications_parquet')
+    n_workers = config.get('n_workers', 1)
+
+    if parquet_mode == 'direct':
+        from data_processing.export_publication_data import PublicationParquetWriter
+        # publications are written to Parquet files partitioned by year without setting up the database
+        if config['database_rewrite'] and parquet_dir.exists():
+            shutil.rmtree(parquet_dir)
+        with PublicationParquetWriter(parquet_dir) as writer:
+            totals = ingest_xml_files(sorted(fnames), None, n_workers=n_workers, writer=writer, metrics=metrics,
+                                      summary=False)
+        _emit_run_summary(metrics, n_workers, totals[0])
+        return
+
+    from data_processing.extract_publication_data import DETAIL_FIELDS
+    from data_processing.extract_publication_data import create_publication_tables
+    from data_processing.ingestion_manifest import SQL_CREATE_MANIFEST_TABLE
+    from protein_score_utilities.convenience_functions_database import DEFAULT_COMPRESSION_CODEC
+    from protein_score_utilities.convenience_functions_database import DEFAULT_INSERT_BATCH_SIZE
+    from protein_score_utilities.convenience_functions_database import DEFAULT_TRANSACTION_SIZE
+    from protein_score_utilities.convenience_functions_database import create_database_connection
+    from protein_score_utilities.convenience_functions_database import create_table
+    from protein_score_utilities.convenience_functions_database import delete_table_content
+
+    # setting up database to write extracted data to
+    db_conn = create_database_connection(config['data_processed'] + config['db_file'], profile='bulk_load')
+    codec = config.get('compression_codec', DEFAULT_COMPRESSION_CODEC)
+    fields = tuple(config.get('extraction_fields') or ())
+    # an existing database is migrated if the compact schema is requested
+    create_publication_tables(db_conn, compact=config.get('database_compact', False), codec=codec, fields=fields)
+    create_table(db_conn, SQL_CREATE_MANIFEST_TABLE)
+    full_text_index = config.get('full_text_index', False)
+    if config['database_rewrite']:
+        from protein_score_utilities.publication_search import drop_publication_search_index
+        # the full-text index is built once after all publications have been written rather than kept in sync
+        drop_publication_search_index(db_conn)
+        if db_conn.execute("SELECT 1 FROM sqlite_master WHERE name='annotation_progress'").fetchone():
+            from data_processing.annotation_pipeline import reset_annotations
+            # all publications are annotated anew by the next annotation run
+            reset_annotations(db_conn)
+        if db_conn.execute("SELECT 1 FROM sqlite_master WHERE name='cluster_progress'").fetchone():
+            from data_processing.extract_concepts import reset_clustering
+            # the clusters are trained anew by the next clustering run
+            reset_clustering(db_conn)
+        delete_table_content(db_conn, 'publications')
+        for field in fields:
+            delete_table_content(db_conn, DETAIL_FIELDS[field].table_name)
+        delete_table_content(db_conn, 'ingestion_manifest')
+        db_conn.commit()
+    elif full_text_index:
+        from protein_score_utilities.publication_search import create_publication_search_index
+        # the index is populated through triggers while the publications are written
+        create_publication_search_index(db_conn)
+
+    # files are parsed in parallel if more than one worker is configured, the database is only written by this process
+    totals = ingest_xml_files(sorted(fnames), db_conn, n_workers=n_workers,
+                              insert_batch_size=config.get('insert_batch_size', DEFAULT_INSERT_BATCH_SIZE),
+                              transaction_size=config.get('transaction_size', DEFAULT_TRANSACTION_SIZE),
+                              upsert=config.get('database_upsert', True),
+                              use_manifest=config.get('use_manifest', True),
+                              with_checksum=config.get('manifest_checksum', False),
+                              codec=codec,
+                              fields=fields,
+                              metrics=metrics,
+                              summary=False)
+
+    if full_text_index and config['database_rewrite']:
+        from protein_score_utilities.publication_search import create_publication_search_index
+        with metrics.stage('search_index'):
+            create_publication_search_index(db_conn)
+
+    if parquet_mode == 'export':
+        from data_processing.export_publication_data import export_publications_to_parquet
+        # the export is generated afresh, as Parquet files cannot be updated in place
+        if parquet_dir.exists():
+            shutil.rmtree(parquet_dir)
+        with metrics.stage('parquet_export'):
+            export_publications_to_parquet(db_conn, parquet_dir)
+
+    db_conn.close()
+    _emit_run_summary(metrics, n_workers, totals[0])
+
+
+def main(argv: list = None):
+    """
+    Runs the data processing pipeline with the config file given as the only argument.
+
+    :param argv: command line arguments without the program name, sys.argv[1:] if None
+    :type argv: list
+    :return: exit status, 0 if the run completed and 1 if the config file is missing or invalid
+    :rtype: int
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("No config file provided. Program will abort")
+        return 1
+    elif argv[0] in ('-h', '--help'):
+        print(USAGE)
+        return 0
+    elif not str(argv[0]).endswith(".yml"):
+        print("Config file is not in the correct format -- yaml file needed. Program will abort")
+        return 1
+
+    from protein_score_utilities.convenience_functions_files import read_config
+    try:
+        config = read_config(argv[0])
+    except (OSError, ValueError) as error:
+        print(f"Config file could not be read -- {error}")
+        print("Program will abort")
+        return 1
+
+    from pathlib import Path
+    from protein_score_utilities.run_metrics import MetricsRecorder
+    from protein_score_utilities.run_metrics import profiling
+
+    processed = Path(config['data_processed'])
+    # events of the ingestion are appended as JSON lines, while the profile (if any) is written afresh for every run
+    metrics_file = processed / config['metrics_file'] if config.get('metrics_file') else None
+    with MetricsRecorder.open(metrics_file, run=config.get('config_for')) as metrics, \
+            profiling(config.get('profiler', 'off'), processed / config.get('profile_file', 'ingestion_profile')):
+        run_data_processing(config, metrics)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
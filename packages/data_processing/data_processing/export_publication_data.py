@@ -0,0 +1,441 @@
+"""
+Module that provides functionality to store publications as Parquet files, so that downstream analyses can read the
+columns they need through Arrow rather than fetching every publication row by row from the SQLite database. The
+publications are partitioned by publication year into folders named pub_year=<year> (Hive partitioning), so that
+analyses restricted to some years only read the files of these years. Publications without a four digit year are
+stored in the folder pub_year=__HIVE_DEFAULT_PARTITION__.
+
+The Parquet files can either be exported from an existing publication database (see
+:func:~`export_publications_to_parquet`) or be written directly while the XML files are parsed, by passing a
+:class:~`PublicationParquetWriter` to :func:~`data_processing.ingest_publication_data.ingest_xml_files` or
+:func:~`data_processing.extract_publication_data.extract_publication_data_from_xml` instead of a database writer.
+Parquet files cannot be updated in place: publications found again are appended, while the PMIDs of deleted
+publications are recorded in separate files. Every row and deletion is therefore stored with the run that wrote it and
+its position within the run, from which :func:~`read_publications` resolves the dataset as the database stores it when
+upserting: the version of a publication written last is returned, unless the publication has been deleted afterwards.
+A publication deleted and found again later is thus returned again.
+
+pyarrow is an optional dependency, which is only imported once the functionality of this module is used.
+"""
+
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from data_processing.extract_publication_data import parse_year
+from protein_score_utilities.convenience_functions_database import DEFAULT_READ_CHUNK_SIZE
+from protein_score_utilities.convenience_functions_database import iterate_publications
+
+# number of publications of one year that are buffered before they are written as record batch
+DEFAULT_RECORD_BATCH_ROWS = 10000
+# number of publications after which the file of a year is closed and a new one is started
+DEFAULT_ROWS_PER_FILE = 1000000
+# name of the partitioning column, which is not stored within the files themselves
+PARTITION_COLUMN = 'pub_year'
+# folder of publications without a valid year, as expected by pyarrow for Hive partitioning
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+# prefix of the files holding the PMIDs of deleted publications, which is skipped when reading the dataset
+_DELETED_FILE_PREFIX = '_deleted_pmids'
+# columns holding the number of the run, counted up by every writer to the folder, and the position within the run of
+# every row and deletion, which order the versions of a publication
+_RUN_COLUMN = '_run'
+_POSITION_COLUMN = '_position'
+_VERSION_COLUMNS = ['pmid', _RUN_COLUMN, _POSITION_COLUMN]
+# columns of the publications returned by read_publications
+PUBLICATION_COLUMNS = ['pmid', 'pub_abstract', 'title', 'journal', PARTITION_COLUMN]
+
+
+def _publication_schema():
+    """
+    Returns the Arrow schema of the publications stored within the Parquet files.
+
+    :return: schema with the columns pmid, pub_abstract, title and journal, as well as the version of the row
+    :rtype: pyarrow.Schema
+    """
+    import pyarrow as pa
+    return pa.schema([('pmid', pa.int64()), ('pub_abstract', pa.string()), ('title', pa.string()),
+                      ('journal', pa.string()), (_RUN_COLUMN, pa.int64()), (_POSITION_COLUMN, pa.int64())])
+
+
+def _latest_versions(table):
+    """
+    Returns the row of the latest version of every PMID, ordered by run and position within the run.
+
+    :param table: table with the columns pmid, _run and _position
+    :type table: pyarrow.Table
+    :return: table with one row per PMID
+    :rtype: pyarrow.Table
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    table = table.sort_by([('pmid', 'ascending'), (_RUN_COLUMN, 'descending'), (_POSITION_COLUMN, 'descending')])
+    if table.num_rows < 2:
+        return table
+    pmids = table['pmid'].combine_chunks()
+    return table.filter(pa.concat_arrays([pa.array([True]), pc.not_equal(pmids[1:], pmids[:-1])]))
+
+
+def _current_versions(dataset_dir, dataset=None):
+    """
+    Returns the version of the publication stored last for every PMID that has not been deleted afterwards.
+
+    :param dataset_dir: folder holding the partitioned Parquet files
+    :type dataset_dir: Path
+    :param dataset: dataset of the folder, opened if None
+    :type dataset: pyarrow.dataset.Dataset
+    :return: table with the columns pmid, _run and _position
+    :rtype: pyarrow.Table
+    """
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    dataset = dataset if dataset is not None else _open_dataset(dataset_dir)
+    current = _latest_versions(dataset.to_table(columns=_VERSION_COLUMNS))
+    deleted_files = [str(path) for path in sorted(Path(dataset_dir).glob(f"{_DELETED_FILE_PREFIX}-*.parquet"))]
+    if not deleted_files or current.num_rows == 0:
+        return current
+    deletions = _latest_versions(ds.dataset(deleted_files, format='parquet').to_table(columns=_VERSION_COLUMNS))
+    deletions = deletions.rename_columns(['pmid', 'deleted_run', 'deleted_position'])
+    joined = current.join(deletions, 'pmid', join_type='left outer')
+    # a publication is deleted if the deletion was recorded after the version was written
+    deleted_later = pc.or_(pc.greater(joined['deleted_run'], joined[_RUN_COLUMN]),
+                           pc.and_(pc.equal(joined['deleted_run'], joined[_RUN_COLUMN]),
+                                   pc.greater(joined['deleted_position'], joined[_POSITION_COLUMN])))
+    return joined.filter(pc.invert(pc.fill_null(deleted_later, False))).select(_VERSION_COLUMNS)
+
+
+def _next_run(dataset_dir):
+    """
+    Returns the number of the next run writing to the folder, i.e. the highest run stored in the publication and
+    deletion files plus one, so that the order of the runs does not depend on the clock of the machine writing them.
+
+    :param dataset_dir: folder holding the partitioned Parquet files
+    :type dataset_dir: Path
+    :return: number of the next run, 1 for an empty folder
+    :rtype: int
+    """
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    files = [str(path) for path in sorted(Path(dataset_dir).glob("*/*.parquet"))] + \
+        [str(path) for path in sorted(Path(dataset_dir).glob(f"{_DELETED_FILE_PREFIX}-*.parquet"))]
+    if not files:
+        return 1
+    last_run = pc.max(ds.dataset(files, format='parquet').to_table(columns=[_RUN_COLUMN])[_RUN_COLUMN]).as_py()
+    return 1 if last_run is None else last_run + 1
+
+
+def _open_dataset(dataset_dir):
+    """
+    Opens the Parquet files of a folder as dataset partitioned by publication year, memory-mapping the files.
+
+    :param dataset_dir: folder holding the partitioned Parquet files
+    :type dataset_dir: Path
+    :return: dataset of the publications
+    :rtype: pyarrow.dataset.Dataset
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+
+    return ds.dataset(str(dataset_dir), format='parquet', filesystem=fs.LocalFileSystem(use_mmap=True),
+                      partitioning=ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.int32())]), flavor='hive'))
+
+
+class PublicationParquetWriter:
+    """
+    Writer taking publication records as returned by
+    :meth:~`data_processing.extract_publication_data.Publication.to_record` without codec and writing them to Parquet
+    files partitioned by publication year. The writer provides the methods of
+    :class:~`protein_score_utilities.convenience_functions_database.BulkInsertWriter` used while extracting
+    publications, so that it can be used in its place.
+
+    The records of each year are buffered and written as Arrow record batches to a file per year, which stays open
+    until the number of rows per file is reached or the writer is closed. Parquet files can only be read once they
+    are closed, which happens as well if the writer is used as context manager and an exception is raised within the
+    block, so that the publications written up to then are kept.
+
+    Publications found again, either within the run or stored by an earlier run in the folder, are counted as
+    duplicates and written nonetheless, as the version written last is the one read by :func:~`read_publications`.
+    Every writer takes the run following the highest run stored in the folder, so writers to the same folder need to
+    run one after the other.
+    """
+
+    def __init__(self, output_dir, batch_size: int = DEFAULT_RECORD_BATCH_ROWS,
+                 rows_per_file: int = DEFAULT_ROWS_PER_FILE, compression: str = 'zstd'):
+        """
+        Setting up the writer for the given folder, which is created if it does not exist.
+
+        :param output_dir: folder the partitioned Parquet files are written to
+        :type output_dir: str or Path
+        :param batch_size: number of publications of one year buffered before they are written as record batch
+        :type batch_size: int
+        :param rows_per_file: number of publications after which a new file is started for a year
+        :type rows_per_file: int
+        :param compression: compression codec of the Parquet files, e.g. 'zstd', 'snappy' or 'none'
+        :type compression: str
+        """
+        import pyarrow  # noqa: F401 raising the ImportError when setting up the writer rather than when writing
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.rows_per_file = rows_per_file
+        self.compression = compression
+        # the database connection of a database writer, which is not used by this writer
+        self.db_conn = None
+
+        # files of different runs writing to the same folder are told apart by the identifier of the run, while the
+        # versions of a publication are ordered by the number of the run and the position within the run
+        self._run_id = uuid.uuid4().hex[:12]
+        self._run = _next_run(self.output_dir)
+        self._position = 0
+        self._schema = _publication_schema()
+        self._buffers = {}
+        self._files = {}
+        self._file_numbers = {}
+        self._deleted_pmids = []
+        # PMIDs of the publications stored, as flags indexed by PMID, to count the publications found again
+        self._stored_pmids = np.zeros(0, dtype=bool)
+        if any(self.output_dir.glob("*/*.parquet")):
+            self._mark_stored(_current_versions(self.output_dir)['pmid'].to_numpy(), True)
+
+        # counters for summary stats
+        self.rows_received = 0
+        self.rows_written = 0
+        self.rows_duplicated = 0
+        self.rows_deleted = 0
+        self.seconds_inserting = 0.0
+        self.seconds_committing = 0.0
+
+    def add(self, row: tuple):
+        """
+        Adds a publication record to the buffer of its year, which is written once the batch size is reached.
+
+        :param row: pmid, abstract text, title, journal and publication year of the publication
+        :type row: tuple
+        """
+        year = parse_year(row[4]) if isinstance(row[4], str) else row[4]
+        pmid = int(row[0])
+        if pmid < len(self._stored_pmids) and self._stored_pmids[pmid]:
+            self.rows_duplicated += 1
+        else:
+            self._mark_stored([pmid], True)
+        buffer = self._buffers.get(year)
+        if buffer is None:
+            buffer = self._buffers[year] = []
+        self._position += 1
+        buffer.append((pmid, row[1], row[2], row[3], self._position))
+        if len(buffer) >= self.batch_size:
+            self._write_batch(year)
+
+    def add_many(self, rows):
+        """
+        Adds multiple publication records to the buffers, see :meth:~`add`.
+
+        :param rows: iterable of publication records
+        :type rows: iterable
+        """
+        for row in rows:
+            self.add(row)
+
+    def _mark_stored(self, pmids, stored: bool):
+        """
+        Sets the flags of the given PMIDs, growing the flags if needed.
+
+        :param pmids: PMIDs of the publications
+        :type pmids: list or numpy.ndarray
+        :param stored: whether the publications are stored
+        :type stored: bool
+        """
+        pmids = np.asarray(pmids, dtype=np.int64)
+        if len(pmids) == 0:
+            return
+        if not stored:
+            pmids = pmids[pmids < len(self._stored_pmids)]
+        elif pmids.max() >= len(self._stored_pmids):
+            # the flags are grown at least twofold, so that PMIDs increasing one by one do not copy them every time
+            size = max(int(pmids.max()) + 1, 2 * len(self._stored_pmids))
+            self._stored_pmids = np.concatenate([self._stored_pmids,
+                                                 np.zeros(size - len(self._stored_pmids), dtype=bool)])
+        self._stored_pmids[pmids] = stored
+
+    def _write_batch(self, year):
+        """
+        Writes the buffered publications of a year as one record batch to the open file of the year.
+
+        :param year: publication year of the buffered publications, None for publications without year
+        :type year: int
+        """
+        import pyarrow as pa
+
+        rows = self._buffers.pop(year, None)
+        if not rows:
+            return
+        start = time.perf_counter()
+        batch = pa.RecordBatch.from_arrays([pa.array([row[0] for row in rows], pa.int64()),
+                                            pa.array([row[1] for row in rows], pa.string()),
+                                            pa.array([row[2] for row in rows], pa.string()),
+                                            pa.array([row[3] for row in rows], pa.string()),
+                                            pa.array([self._run] * len(rows), pa.int64()),
+                                            pa.array([row[4] for row in rows], pa.int64())], schema=self._schema)
+        self._open_file(year).write_batch(batch)
+        self.rows_received += len(rows)
+        self.rows_written += len(rows)
+        self.seconds_inserting += time.perf_counter() - start
+        file_rows = self._file_numbers[year][1] + len(rows)
+        self._file_numbers[year][1] = file_rows
+        if file_rows >= self.rows_per_file:
+            self._close_file(year)
+
+    def _open_file(self, year):
+        """
+        Returns the open Parquet file of a year, starting a new file if none is open.
+
+        :param year: publication year of the file
+        :type year: int
+        :return: writer of the Parquet file
+        :rtype: pyarrow.parquet.ParquetWriter
+        """
+        import pyarrow.parquet as pq
+
+        file = self._files.get(year)
+        if file is None:
+            number = self._file_numbers[year][0] + 1 if year in self._file_numbers else 0
+            self._file_numbers[year] = [number, 0]
+            partition_dir = self.output_dir / f"{PARTITION_COLUMN}={NULL_PARTITION if year is None else year}"
+            partition_dir.mkdir(exist_ok=True)
+            file = self._files[year] = pq.ParquetWriter(partition_dir / f"part-{self._run_id}-{number:05d}.parquet",
+                                                        self._schema, compression=self.compression)
+        return file
+
+    def _close_file(self, year):
+        """
+        Closes the open Parquet file of a year, so that it can be read.
+
+        :param year: publication year of the file
+        :type year: int
+        """
+        file = self._files.pop(year, None)
+        if file is not None:
+            start = time.perf_counter()
+            file.close()
+            self.seconds_committing += time.perf_counter() - start
+
+    def flush(self):
+        """
+        Writes the buffered publications of all years to their files.
+        """
+        for year in list(self._buffers):
+            self._write_batch(year)
+
+    def delete(self, key_column: str, keys):
+        """
+        Records the PMIDs of deleted publications, which are written to a separate file when the writer is closed.
+        Publications already written cannot be removed from the Parquet files, but are left out when the files are read
+        with :func:~`read_publications`, unless they are found again after the deletion.
+
+        :param key_column: name of the column the keys refer to, needs to be pmid
+        :type key_column: str
+        :param keys: PMIDs of the publications to be deleted
+        :type keys: iterable
+        :return: number of PMIDs recorded
+        :rtype: int
+        """
+        if key_column != 'pmid':
+            raise ValueError(f"Publications can only be deleted by pmid, not by {key_column}.")
+        keys = [int(key) for key in keys]
+        for key in keys:
+            self._position += 1
+            self._deleted_pmids.append((key, self._position))
+        self._mark_stored(keys, False)
+        self.rows_deleted += len(keys)
+        return len(keys)
+
+    def commit(self):
+        """
+        Writes the buffered publications of all years. The files are kept open for further publications.
+        """
+        self.flush()
+
+    def close(self):
+        """
+        Writes the buffered publications, closes all files and writes the PMIDs of deleted publications.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        try:
+            self.flush()
+        finally:
+            for year in list(self._files):
+                self._close_file(year)
+        if self._deleted_pmids:
+            pq.write_table(pa.table({'pmid': pa.array([pmid for pmid, _ in self._deleted_pmids], pa.int64()),
+                                     _RUN_COLUMN: pa.array([self._run] * len(self._deleted_pmids), pa.int64()),
+                                     _POSITION_COLUMN: pa.array([position for _, position in self._deleted_pmids],
+                                                                pa.int64())}),
+                           self.output_dir / f"{_DELETED_FILE_PREFIX}-{self._run_id}.parquet")
+            self._deleted_pmids = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+def export_publications_to_parquet(db_conn, output_dir, chunk_size: int = DEFAULT_READ_CHUNK_SIZE, **kwargs):
+    """
+    Exports all publications of the database to Parquet files partitioned by publication year. The publications are
+    read in chunks ordered by PMID, so that only one chunk and the buffers of the writer are held in memory. Both the
+    plain and the compact schema of the table publications are supported.
+
+    :param db_conn: connection to the database holding the table publications
+    :type db_conn: sqlite3.Connection
+    :param output_dir: folder the partitioned Parquet files are written to
+    :type output_dir: str or Path
+    :param chunk_size: number of publications read from the database at once
+    :type chunk_size: int
+    :param kwargs: further settings passed on to :class:~`PublicationParquetWriter`
+    :return: number of publications exported
+    :rtype: int
+    """
+    with PublicationParquetWriter(output_dir, **kwargs) as writer:
+        for chunk in iterate_publications(db_conn, chunk_size=chunk_size):
+            # the rows hold pmid, abstract, title, journal and year as expected by the writer
+            writer.add_many(chunk)
+    print(f"Exported {writer.rows_written} publications to {output_dir}")
+    return writer.rows_written
+
+
+def read_publications(dataset_dir, columns: list = None, years: list = None):
+    """
+    Reads the publications stored in Parquet files by :class:~`PublicationParquetWriter` as Arrow table. Only the
+    requested columns and the files of the requested years are read, where the files are memory-mapped rather than
+    copied into memory. Of a publication written more than once, the version written last is returned, while deleted
+    publications are left out unless they have been written again after the deletion; to tell these apart, the PMIDs
+    and versions of all years are read. The table can be converted with its method to_pandas, e.g. for notebooks.
+
+    :param dataset_dir: folder holding the partitioned Parquet files
+    :type dataset_dir: str or Path
+    :param columns: columns to be read out of pmid, pub_abstract, title, journal and pub_year, None for all columns
+    :type columns: list
+    :param years: publication years to be read, None for all years
+    :type years: list
+    :return: table of the publications
+    :rtype: pyarrow.Table
+    """
+    import pyarrow.dataset as ds
+
+    dataset_dir = Path(dataset_dir)
+    dataset = _open_dataset(dataset_dir)
+    columns = list(columns) if columns is not None else PUBLICATION_COLUMNS
+    condition = ds.field(PARTITION_COLUMN).isin(list(years)) if years is not None else None
+    table = dataset.to_table(columns=columns + [column for column in _VERSION_COLUMNS if column not in columns],
+                             filter=condition)
+    current = _current_versions(dataset_dir, dataset)
+    return table.join(current, _VERSION_COLUMNS, join_type='left semi').select(columns)
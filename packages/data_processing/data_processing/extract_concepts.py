@@ -0,0 +1,426 @@
+"""
+Module that provides the extraction of semantic concepts from the publications held in the SQLite database and their
+clustering into concept groups.
+
+Concepts are candidate noun phrases, i.e. sequences of up to three words that neither span punctuation nor stop words
+(e.g. "tumor necrosis factor" in "levels of tumor necrosis factor were increased"). The concepts of each publication are
+mapped into a sparse term matrix through the hashing trick, so that no vocabulary needs to be held in memory and
+publications added later are mapped into the same feature space. Publications are clustered on these vectors with
+mini-batch k-means, which is updated chunk by chunk: the first run clusters all publications in the database, later
+runs (e.g. after ingesting Pubmed update files) only update the clusters with the publications added since, rather than
+clustering the whole corpus anew. The memory needed depends on the chunk size, the number of hashed features and the
+number of clusters only.
+
+The model is kept in a file next to the database and the progress is recorded as watermark in the table
+cluster_progress, like the one of the annotation (see :mod:~`data_processing.annotation_pipeline`), but apart from it,
+so that annotating anew does not affect the clusters. Triggers on the table publications (see
+:func:~`create_cluster_tracking`) remove the clusters of deleted publications and queue publications ingested at or
+below the watermark, e.g. records completed by an update file, in the table cluster_queue, so that they are clustered at
+the start of the next run.
+
+The clusters of the publications are written to the table publication_clusters, the concepts found with the number of
+publications they occur in to the table concepts, which allows to describe each cluster by its most prominent concepts.
+As only the most frequent concept of a feature is used to describe the clusters, the table keeps the most frequent few
+concepts of each feature only, so that it is bounded by the number of hashed features rather than growing with every
+distinct n-gram of the corpus. The counts of the concepts kept are therefore approximate: a concept pruned once is
+counted again from the next publication it occurs in.
+
+Requires numpy, scipy and scikit-learn.
+"""
+
+import re
+
+import numpy as np
+from sklearn.utils import murmurhash3_32
+
+from data_processing.annotate_text_data import iterate_publication_texts
+from protein_score_utilities.convenience_functions_database import decompress_text
+
+SQL_CREATE_CONCEPTS_TABLE = "CREATE TABLE IF NOT EXISTS concepts (concept text PRIMARY KEY, " \
+                            "feature integer NOT NULL, publication_count integer NOT NULL);"
+SQL_CREATE_CONCEPTS_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS concepts_feature ON concepts(feature, publication_count);",
+)
+SQL_CREATE_PUBLICATION_CLUSTERS_TABLE = "CREATE TABLE IF NOT EXISTS publication_clusters (" \
+                                        "pmid integer PRIMARY KEY, cluster integer NOT NULL);"
+SQL_CREATE_CLUSTER_PROGRESS_TABLE = "CREATE TABLE IF NOT EXISTS cluster_progress (name text PRIMARY KEY, " \
+                                    "last_pmid integer NOT NULL, updated_at text);"
+SQL_CREATE_CLUSTER_QUEUE_TABLE = "CREATE TABLE IF NOT EXISTS cluster_queue (pmid integer PRIMARY KEY);"
+SQL_CREATE_CLUSTER_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS publications_clusters_delete AFTER DELETE ON publications "
+    "BEGIN DELETE FROM publication_clusters WHERE pmid=old.pmid; DELETE FROM cluster_queue WHERE pmid=old.pmid; END;",
+    "CREATE TRIGGER IF NOT EXISTS publications_clusters_insert AFTER INSERT ON publications "
+    "BEGIN INSERT OR IGNORE INTO cluster_queue(pmid) SELECT new.pmid FROM cluster_progress "
+    "WHERE last_pmid >= new.pmid; END;",
+)
+# removes all but the most frequent concepts of the features holding more than the given number of concepts
+SQL_PRUNE_CONCEPTS = "DELETE FROM concepts WHERE concept IN (SELECT concept FROM (" \
+                     "SELECT concept, row_number() OVER (PARTITION BY feature " \
+                     "ORDER BY publication_count DESC, concept) AS concept_rank FROM concepts WHERE feature IN (" \
+                     "SELECT feature FROM concepts GROUP BY feature HAVING count(*) > ?)) WHERE concept_rank > ?);"
+
+# progress of the clustering is recorded in the table cluster_progress under this name
+CONCEPT_PROGRESS_NAME = 'concept_cluster'
+
+# number of publications clustered together, needs to be at least the number of clusters
+DEFAULT_CONCEPT_CHUNK_SIZE = 5000
+DEFAULT_N_CLUSTERS = 50
+# size of the hashed feature space, the memory needed by the cluster centers is n_clusters * n_features * 4 bytes
+DEFAULT_N_FEATURES = 2 ** 18
+DEFAULT_MAX_NGRAM = 3
+# number of concepts kept in the table concepts for each hashed feature, bounding it to n_features times this number
+DEFAULT_CONCEPTS_PER_FEATURE = 3
+
+_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9\-]*|[^\sA-Za-z0-9]")
+STOP_WORDS = frozenset("""
+a about above after again against all also although among an and another any are as at be because been before being
+below between both but by can could did do does doing done down due during each either et etc few for from further had
+has have having here however how if in into is it its itself may might more most much must no nor not of off on once
+only or other our over own per same several should since so some such than that the their them then there these they
+this those through thus to too under until up upon us using via was we were what when where whether which while who
+whom why will with within without would yet
+""".split())
+
+
+def extract_concepts(text: str, max_ngram: int = DEFAULT_MAX_NGRAM):
+    """
+    Extracts the candidate concepts of a text: all word n-grams of up to max_ngram words that do not span punctuation
+    or stop words, in lower case. Single words need to be at least three characters long and numbers are ignored.
+
+    :param text: text the concepts are extracted from, e.g. title and abstract of a publication
+    :type text: str
+    :param max_ngram: maximal number of words of a concept
+    :type max_ngram: int
+    :return: concepts in the order of their occurrence, repeated if they occur multiple times
+    :rtype: list
+    """
+    concepts = []
+    phrase = []
+    for token in _TOKEN_PATTERN.findall((text or "").lower()) + ["."]:
+        if token[0].isalnum() and token not in STOP_WORDS:
+            phrase.append(token)
+            continue
+        for start in range(len(phrase)):
+            for end in range(start + 1, min(start + max_ngram, len(phrase)) + 1):
+                words = phrase[start:end]
+                if end - start == 1 and (len(words[0]) < 3 or words[0].replace("-", "").isdigit()):
+                    continue
+                concepts.append(" ".join(words))
+        phrase = []
+    return concepts
+
+
+def concept_feature(concept: str, n_features: int = DEFAULT_N_FEATURES):
+    """
+    Returns the index of the hashed feature a concept is mapped to, as done by :class:~`ConceptClusterer`.
+
+    :param concept: concept as returned by :func:~`extract_concepts`
+    :type concept: str
+    :param n_features: size of the hashed feature space
+    :type n_features: int
+    :return: index of the feature
+    :rtype: int
+    """
+    # same mapping as in the hashing vectorizer of scikit-learn
+    return abs(murmurhash3_32(concept, seed=0)) % n_features
+
+
+def _identity(concepts):
+    """
+    Analyzer of the hashing vectorizer for texts whose concepts have been extracted already.
+    """
+    return concepts
+
+
+class ConceptClusterer:
+    """
+    Clusters publications by the concepts mentioned in them, using mini-batch k-means on hashed concept vectors. The
+    clusterer can be updated incrementally and stored in a file between runs.
+
+    :param n_clusters: number of clusters
+    :type n_clusters: int
+    :param n_features: size of the hashed feature space
+    :type n_features: int
+    :param max_ngram: maximal number of words of a concept
+    :type max_ngram: int
+    :param random_state: seed of the initialisation of the clusters
+    :type random_state: int
+    """
+    def __init__(self, n_clusters: int = DEFAULT_N_CLUSTERS, n_features: int = DEFAULT_N_FEATURES,
+                 max_ngram: int = DEFAULT_MAX_NGRAM, random_state: int = 0):
+        from sklearn.cluster import MiniBatchKMeans
+
+        self.n_features = n_features
+        self.max_ngram = max_ngram
+        self.model = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state, n_init=1)
+        self.n_publications_seen = 0
+
+    @property
+    def n_clusters(self):
+        """
+        Number of clusters.
+        """
+        return self.model.n_clusters
+
+    def _vectorizer(self):
+        """
+        Returns the vectorizer mapping lists of concepts to l2 normalised hashed concept counts.
+        """
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        # the vectorizer is stateless and therefore rebuilt rather than stored
+        return HashingVectorizer(analyzer=_identity, n_features=self.n_features, alternate_sign=False,
+                                 dtype=np.float32)
+
+    def transform(self, concept_lists: list):
+        """
+        Maps the concepts of each publication into the hashed feature space.
+
+        :param concept_lists: concepts of each publication as returned by :func:~`extract_concepts`
+        :type concept_lists: list
+        :return: publication x feature matrix with l2 normalised rows
+        :rtype: scipy.sparse.csr_matrix
+        """
+        return self._vectorizer().transform(concept_lists)
+
+    def partial_fit_predict(self, concept_lists: list):
+        """
+        Updates the clusters with a batch of publications and returns the clusters assigned to them.
+
+        :param concept_lists: concepts of each publication as returned by :func:~`extract_concepts`
+        :type concept_lists: list
+        :return: cluster of each publication
+        :rtype: numpy.ndarray
+        """
+        if self.n_publications_seen == 0 and len(concept_lists) < self.n_clusters:
+            raise ValueError(f"The first batch needs to hold at least as many publications as there are clusters "
+                             f"({len(concept_lists)} < {self.n_clusters}).")
+        term_matrix = self.transform(concept_lists)
+        self.model.partial_fit(term_matrix)
+        self.n_publications_seen += len(concept_lists)
+        return self.model.predict(term_matrix)
+
+    def top_features(self, n_features: int = 10):
+        """
+        Returns the features with the highest positive weight in the center of each cluster.
+
+        :param n_features: maximal number of features per cluster
+        :type n_features: int
+        :return: list of feature indices for each cluster, the highest weight first
+        :rtype: list
+        """
+        centers = self.model.cluster_centers_
+        n_features = min(n_features, centers.shape[1])
+        top = np.argpartition(-centers, n_features - 1, axis=1)[:, :n_features]
+        weights = np.take_along_axis(centers, top, axis=1)
+        order = np.argsort(-weights, axis=1)
+        top, weights = np.take_along_axis(top, order, axis=1), np.take_along_axis(weights, order, axis=1)
+        return [features[feature_weights > 0].tolist() for features, feature_weights in zip(top, weights)]
+
+    def save(self, file_path):
+        """
+        Stores the clusterer in a file. The file is replaced atomically, so that an interrupted save keeps the previous
+        version.
+
+        :param file_path: path to the model file
+        :type file_path: str or Path
+        """
+        import os
+        import pickle
+
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, file_path)
+
+    @staticmethod
+    def load(file_path):
+        """
+        Loads a clusterer stored with :meth:~`save`.
+
+        :param file_path: path to the model file
+        :type file_path: str or Path
+        :return: clusterer
+        :rtype: :class:~`ConceptClusterer`
+        """
+        import pickle
+
+        with open(file_path, "rb") as file:
+            return pickle.load(file)
+
+
+def _write_concept_counts(db_conn, concept_lists: list, n_features: int,
+                          concepts_per_feature: int = DEFAULT_CONCEPTS_PER_FEATURE):
+    """
+    Adds the number of publications each concept occurs in to the table concepts and prunes the concepts of each feature
+    to the most frequent ones, without committing.
+    """
+    from collections import Counter
+
+    counts = Counter(concept for concepts in concept_lists for concept in set(concepts))
+    db_conn.executemany("INSERT INTO concepts(concept, feature, publication_count) VALUES(?,?,?) ON CONFLICT(concept) "
+                        "DO UPDATE SET publication_count=publication_count+excluded.publication_count",
+                        ((concept, concept_feature(concept, n_features), count) for concept, count in counts.items()))
+    db_conn.execute(SQL_PRUNE_CONCEPTS, (concepts_per_feature, concepts_per_feature))
+
+
+def create_cluster_tracking(db_conn):
+    """
+    Creates the tables cluster_progress and cluster_queue as well as the triggers keeping the clusters in line with
+    publications deleted or ingested at or below the watermark, if they do not exist yet. The tables publications and
+    publication_clusters need to exist. A watermark recorded in the table annotation_progress by earlier versions is
+    moved to the table cluster_progress.
+
+    :param db_conn: connection to the database holding the tables publications and publication_clusters
+    :type db_conn: sqlite3.Connection
+    """
+    for statement in (SQL_CREATE_CLUSTER_PROGRESS_TABLE, SQL_CREATE_CLUSTER_QUEUE_TABLE) + SQL_CREATE_CLUSTER_TRIGGERS:
+        db_conn.execute(statement)
+    if db_conn.execute("SELECT 1 FROM sqlite_master WHERE name='annotation_progress'").fetchone():
+        db_conn.execute("INSERT OR IGNORE INTO cluster_progress(name, last_pmid, updated_at) SELECT entity_type, "
+                        "last_pmid, updated_at FROM annotation_progress WHERE entity_type=?", (CONCEPT_PROGRESS_NAME,))
+        db_conn.execute("DELETE FROM annotation_progress WHERE entity_type=?", (CONCEPT_PROGRESS_NAME,))
+    if db_conn.execute("SELECT 1 FROM sqlite_master WHERE name='annotation_queue'").fetchone():
+        db_conn.execute("DELETE FROM annotation_queue WHERE entity_type=?", (CONCEPT_PROGRESS_NAME,))
+    db_conn.commit()
+
+
+def reset_clustering(db_conn):
+    """
+    Removes the clusters, the concepts, the watermark and the queued publications of the clustering, so that the
+    clusters are trained anew on all publications, without committing. A model file left is discarded by the next run
+    of :func:~`cluster_publications`, as no progress is recorded for it.
+
+    :param db_conn: connection to the database holding the tables of the clustering
+    :type db_conn: sqlite3.Connection
+    """
+    for table_name in ('concepts', 'publication_clusters', 'cluster_progress', 'cluster_queue'):
+        db_conn.execute(f"DELETE FROM {table_name}")
+
+
+def get_cluster_watermark(db_conn):
+    """
+    Returns the highest PMID up to which all publications have been clustered.
+
+    :param db_conn: connection to the database holding the table cluster_progress
+    :type db_conn: sqlite3.Connection
+    :return: PMID of the watermark, None if no publication has been clustered yet
+    :rtype: int
+    """
+    row = db_conn.execute("SELECT last_pmid FROM cluster_progress WHERE name=?", (CONCEPT_PROGRESS_NAME,)).fetchone()
+    return row[0] if row is not None else None
+
+
+def _cluster_chunk(db_conn, model_file, clusterer: ConceptClusterer, chunk: list, concepts_per_feature: int):
+    """
+    Updates the clusters with a chunk of publications and writes their clusters and concepts, without committing.
+    """
+    concept_lists = [extract_concepts(f"{title}. {abstract}", clusterer.max_ngram) for _, title, abstract in chunk]
+    clusters = clusterer.partial_fit_predict(concept_lists)
+    # the model is stored before the clusters are committed, so that an interruption at worst leads to a chunk
+    # being learnt twice, rather than not at all
+    clusterer.save(model_file)
+    db_conn.executemany("INSERT OR REPLACE INTO publication_clusters(pmid, cluster) VALUES(?,?)",
+                        zip((pmid for pmid, _, _ in chunk), clusters.tolist()))
+    _write_concept_counts(db_conn, concept_lists, clusterer.n_features, concepts_per_feature)
+
+
+def cluster_publications(db_conn, model_file, clusterer: ConceptClusterer = None,
+                         chunk_size: int = DEFAULT_CONCEPT_CHUNK_SIZE, restart: bool = False,
+                         concepts_per_feature: int = DEFAULT_CONCEPTS_PER_FEATURE):
+    """
+    Extracts the concepts of the publications not clustered yet and updates the clusters with them chunk by chunk. The
+    clusterer is loaded from the model file if it exists, otherwise the one provided (or a default one) is trained from
+    scratch. After each chunk, the clusterer is stored and the clusters of the publications are committed together with
+    the progress, so that an interrupted run resumes after the last chunk stored. Publications queued after they have
+    been ingested at or below the watermark are clustered first. The tables concepts and publication_clusters need to
+    exist, the tables and triggers tracking the progress are created if needed (see :func:~`create_cluster_tracking`).
+
+    Publications updated in place keep their cluster until the clustering is restarted.
+
+    :param db_conn: connection to the database holding the publications
+    :type db_conn: sqlite3.Connection
+    :param model_file: path to the file the clusterer is stored in
+    :type model_file: str or Path
+    :param clusterer: clusterer to be trained if there is no model file yet
+    :type clusterer: :class:~`ConceptClusterer`
+    :param chunk_size: number of publications clustered together
+    :type chunk_size: int
+    :param restart: whether the clusters should be trained anew on all publications
+    :type restart: bool
+    :param concepts_per_feature: number of concepts kept in the table concepts for each hashed feature
+    :type concepts_per_feature: int
+    :return: number of publications clustered in this run
+    :rtype: int
+    """
+    from pathlib import Path
+
+    create_cluster_tracking(db_conn)
+    if restart:
+        Path(model_file).unlink(missing_ok=True)
+        reset_clustering(db_conn)
+        db_conn.commit()
+
+    watermark = get_cluster_watermark(db_conn)
+    if Path(model_file).exists() and watermark is None:
+        # the model stems from a rewritten database or from a first chunk that has not been committed
+        print(f"Discarding model file {model_file}, as no progress of the clustering is recorded")
+        Path(model_file).unlink()
+    if Path(model_file).exists():
+        clusterer = ConceptClusterer.load(model_file)
+        print(f"Updating concept clusters trained on {clusterer.n_publications_seen} publications")
+    elif watermark is not None:
+        raise FileNotFoundError(f"Model file {model_file} not found, although publications have been clustered "
+                                f"before. Restart the clustering to train the clusters anew.")
+    else:
+        clusterer = clusterer or ConceptClusterer()
+
+    counter_publications = 0
+    while True:
+        pmids = [pmid for pmid, in db_conn.execute("SELECT pmid FROM cluster_queue ORDER BY pmid LIMIT ?",
+                                                   (chunk_size,))]
+        if not pmids:
+            break
+        placeholders = ",".join("?" for _ in pmids)
+        chunk = [(pmid, title, decompress_text(abstract)) for pmid, title, abstract in db_conn.execute(
+            f"SELECT pmid, title, pub_abstract FROM publications WHERE pmid IN ({placeholders}) ORDER BY pmid", pmids)]
+        if chunk:
+            _cluster_chunk(db_conn, model_file, clusterer, chunk, concepts_per_feature)
+        db_conn.execute(f"DELETE FROM cluster_queue WHERE pmid IN ({placeholders})", pmids)
+        db_conn.commit()
+        counter_publications += len(chunk)
+    if counter_publications:
+        print(f"Clustered {counter_publications} publications ingested below the watermark since the last run")
+
+    for chunk in iterate_publication_texts(db_conn, chunk_size, after_pmid=watermark):
+        _cluster_chunk(db_conn, model_file, clusterer, chunk, concepts_per_feature)
+        db_conn.execute("INSERT INTO cluster_progress(name, last_pmid, updated_at) VALUES(?,?,datetime('now')) "
+                        "ON CONFLICT(name) DO UPDATE SET last_pmid=excluded.last_pmid, updated_at=excluded.updated_at",
+                        (CONCEPT_PROGRESS_NAME, chunk[-1][0]))
+        db_conn.commit()
+        counter_publications += len(chunk)
+
+    print(f"Total number of publications clustered: {counter_publications}")
+    return counter_publications
+
+
+def describe_clusters(db_conn, clusterer: ConceptClusterer, n_concepts: int = 10):
+    """
+    Describes each cluster by the concepts of the features with the highest weight in its center. As multiple concepts
+    can be hashed to the same feature, the concept occurring in the most publications is taken for each feature.
+
+    :param db_conn: connection to the database holding the table concepts
+    :type db_conn: sqlite3.Connection
+    :param clusterer: trained clusterer
+    :type clusterer: :class:~`ConceptClusterer`
+    :param n_concepts: number of concepts per cluster
+    :type n_concepts: int
+    :return: list of concepts for each cluster
+    :rtype: list
+    """
+    stm = "SELECT concept FROM concepts WHERE feature=? ORDER BY publication_count DESC, concept LIMIT 1"
+    descriptions = []
+    for features in clusterer.top_features(n_concepts):
+        rows = (db_conn.execute(stm, (feature,)).fetchone() for feature in features)
+        descriptions.append([row[0] for row in rows if row is not None])
+    return descriptions
@@ -6,9 +6,321 @@ Pubmed XML files <https://pubmed.ncbi.nlm.nih.gov/help/#download-pubmed-data>`_.
 These XML files contain references for a large number of publications, where each publication may hold more or less
 specifying data. As a first attempt, the data that will be extracted for each publication, if present, are Pubmed ID,
 title, abstract, journal and publication year. The data will be held temporarily in SQLite database for easier querying.
+
+Besides the yearly baseline, Pubmed provides daily update files, which contain new publications, revised versions of
+publications already part of the baseline and a list of publications to be deleted (DeleteCitation). To maintain the
+database from these files, publications can be upserted, so that a publication found in a later file replaces the
+version stored before, and the deletions are applied in bulk at the end of each file.
+
+Optionally, the publications are stored in a compact schema, in which each journal title is stored once in the table
+journals, the publication year is an integer and the abstracts are compressed. This reduces the size of the database
+by a multiple and speeds up scans of the table publications, which are mostly bound by reading the pages from disk.
+Abstracts are compressed by the processes parsing the XML files. Existing databases can be migrated to the compact
+schema through :func:~`migrate_to_compact_schema`.
+
+Besides the five fields stored in the table publications, further details of the publications can be extracted, i.e.
+MeSH headings, keywords, chemicals, article identifiers (e.g. the DOI) and authors. Each of these is described by a
+:class:~`FieldSpec` in :data:~`DETAIL_FIELDS` and stored in a child table of the table publications with one row per
+item, written in bulk alongside the publications by a :class:~`PublicationDetailWriter`. Which details are extracted is
+configurable, as every detail adds to the time needed for parsing.
+
+The XML files are parsed as a stream, so that the memory needed does not depend on the size of the file: every element
+directly below the root (PubmedArticle, PubmedBookArticle and DeleteCitation) is removed from the tree once it has been
+processed, together with any other element preceding it, and entities declared within a file are not expanded. If a
+file turns out to be malformed or truncated, the publications found up to the error are kept and the position of the
+error within the (decompressed) XML is reported, see :func:~`describe_parse_error`.
 """
 
+import lzma
+import re
+import zlib
+import time
+from functools import lru_cache
+from pathlib import PurePath
+
+from protein_score_utilities.convenience_functions_database import DEFAULT_COMPRESSION_CODEC
+from protein_score_utilities.convenience_functions_database import BulkInsertWriter
+from protein_score_utilities.convenience_functions_database import compress_text
 from protein_score_utilities.convenience_functions_database import execute_insert_statement
+from protein_score_utilities.convenience_functions_database import has_compact_publication_schema
+from protein_score_utilities.convenience_functions_database import register_compression_functions
+from protein_score_utilities.convenience_functions_files import open_data_file
+
+# SQL statements for the table publication data extracted is written to
+SQL_CREATE_PUBLICATIONS_TABLE = "CREATE TABLE IF NOT EXISTS publications (pmid integer PRIMARY KEY, " \
+                                "pub_abstract text NOT NULL, journal text NOT NULL, title text NOT NULL, " \
+                                "pub_year text NOT NULL);"
+SQL_INSERT_PUBLICATION = "INSERT INTO publications(pmid,pub_abstract,title,journal,pub_year) VALUES(?,?,?,?,?)"
+PUBLICATION_COLUMNS = ('pmid', 'pub_abstract', 'title', 'journal', 'pub_year')
+
+# SQL statements for the compact schema, where the abstract is compressed and the journal refers to the table journals
+SQL_CREATE_JOURNALS_TABLE = "CREATE TABLE IF NOT EXISTS journals (journal_id integer PRIMARY KEY, " \
+                            "journal text NOT NULL UNIQUE);"
+_SQL_CREATE_COMPACT_PUBLICATIONS_TABLE = "CREATE TABLE IF NOT EXISTS {table_name} (pmid integer PRIMARY KEY, " \
+                                         "pub_abstract blob NOT NULL, journal_id integer NOT NULL " \
+                                         "REFERENCES journals(journal_id), title text NOT NULL, pub_year integer);"
+SQL_CREATE_COMPACT_PUBLICATIONS_TABLE = _SQL_CREATE_COMPACT_PUBLICATIONS_TABLE.format(table_name='publications')
+# view with the same columns as the plain schema, requires the compression functions registered with the connection
+SQL_CREATE_PUBLICATIONS_TEXT_VIEW = "CREATE VIEW IF NOT EXISTS publications_text AS SELECT p.pmid AS pmid, " \
+                                    "decompress_text(p.pub_abstract) AS pub_abstract, j.journal AS journal, " \
+                                    "p.title AS title, p.pub_year AS pub_year FROM publications p " \
+                                    "JOIN journals j ON j.journal_id = p.journal_id;"
+COMPACT_PUBLICATION_COLUMNS = ('pmid', 'pub_abstract', 'title', 'journal_id', 'pub_year')
+
+# SQL statements for the child tables holding the details of publications, one row per item in the order found
+SQL_CREATE_MESH_TERMS_TABLE = "CREATE TABLE IF NOT EXISTS publication_mesh_terms (pmid integer NOT NULL, " \
+                              "position integer NOT NULL, descriptor_ui text, descriptor text NOT NULL, " \
+                              "major_topic integer NOT NULL, qualifiers text, PRIMARY KEY (pmid, position)) " \
+                              "WITHOUT ROWID;"
+SQL_CREATE_KEYWORDS_TABLE = "CREATE TABLE IF NOT EXISTS publication_keywords (pmid integer NOT NULL, " \
+                            "position integer NOT NULL, keyword text NOT NULL, major_topic integer NOT NULL, " \
+                            "PRIMARY KEY (pmid, position)) WITHOUT ROWID;"
+SQL_CREATE_CHEMICALS_TABLE = "CREATE TABLE IF NOT EXISTS publication_chemicals (pmid integer NOT NULL, " \
+                             "position integer NOT NULL, registry_number text, substance_ui text, " \
+                             "substance text NOT NULL, PRIMARY KEY (pmid, position)) WITHOUT ROWID;"
+SQL_CREATE_ARTICLE_IDS_TABLE = "CREATE TABLE IF NOT EXISTS publication_article_ids (pmid integer NOT NULL, " \
+                               "position integer NOT NULL, id_type text NOT NULL, article_id text NOT NULL, " \
+                               "PRIMARY KEY (pmid, position)) WITHOUT ROWID;"
+SQL_CREATE_AUTHORS_TABLE = "CREATE TABLE IF NOT EXISTS publication_authors (pmid integer NOT NULL, " \
+                           "position integer NOT NULL, last_name text, fore_name text, initials text, " \
+                           "collective_name text, PRIMARY KEY (pmid, position)) WITHOUT ROWID;"
+
+_YEAR_PATTERN = re.compile(r"\d{4}")
+
+# elements directly below the root of Pubmed XML files, of which only PubmedArticle elements hold publications
+_TOP_LEVEL_TAGS = ("PubmedArticle", "PubmedBookArticle", "DeleteCitation")
+# errors raised while reading truncated or otherwise corrupted (compressed) files
+READ_ERRORS = (OSError, EOFError, zlib.error, lzma.LZMAError)
+
+# fields that are required for each extracted publication in order to be stored
+# key is the internal reference and value the path of the element within the PubmedArticle element
+ELEM_OF_INTEREST = {
+    'pmid': 'MedlineCitation/PMID',
+    'abstract_text': 'MedlineCitation/Article/Abstract/AbstractText',
+    'title': 'MedlineCitation/Article/ArticleTitle',
+    'journal': 'MedlineCitation/Article/Journal/Title',
+    'pub_year': 'MedlineCitation/Article/Journal/JournalIssue/PubDate/Year'
+}
+
+
+def _element_text(elem):
+    """
+    Returns the text of an element including the text of nested elements, e.g. for formatting such as <i>.
+
+    :param elem: element of the XML file
+    :type elem: lxml.etree._Element
+    :return: text of the element, None if the element has no text
+    :rtype: str
+    """
+    if elem is None:
+        return None
+    text = elem.text if len(elem) == 0 else "".join(elem.itertext())
+    return text or None
+
+
+def _first_text(elems: list):
+    """
+    Returns the text of the first element found for a field.
+
+    :param elems: elements found for the field
+    :type elems: list
+    :return: text of the first element, None if it has no text
+    :rtype: str
+    """
+    return _element_text(elems[0])
+
+
+def _abstract_text(elems: list):
+    """
+    Joins the sections of an abstract, where the label of structured abstracts (e.g. BACKGROUND or METHODS) is kept in
+    front of each section.
+
+    :param elems: AbstractText elements of the abstract
+    :type elems: list
+    :return: text of all sections separated by line breaks, None if none of the sections has any text
+    :rtype: str
+    """
+    if len(elems) == 1 and elems[0].get('Label') is None:
+        return _element_text(elems[0])
+    sections = []
+    for elem in elems:
+        text = _element_text(elem)
+        if text is not None:
+            label = elem.get('Label')
+            sections.append(f"{label}: {text}" if label else text)
+    return "\n".join(sections) or None
+
+
+# functions returning the value of the fields in ELEM_OF_INTEREST from the elements found, the first text by default
+_FIELD_TEXT = {
+    'abstract_text': _abstract_text,
+}
+
+
+# the items of a detail are collected by walking once through the list element holding them, where lxml only returns
+# the elements of the tags needed; this is considerably faster than looking up the elements of every item by its path,
+# as the elements skipped (e.g. the affiliations of authors) are never handed to Python
+
+def _mesh_heading_items(list_elem):
+    """
+    Returns descriptor UI, descriptor, whether the descriptor or one of its qualifiers is a major topic and the
+    qualifiers separated by | of each MeshHeading element of a MeshHeadingList element.
+    """
+    items = []
+    descriptor = None
+    for child in list_elem.iter('MeshHeading', 'DescriptorName', 'QualifierName'):
+        tag = child.tag
+        if tag == 'MeshHeading':
+            if descriptor:
+                items.append((descriptor_ui, descriptor, major_topic, "|".join(qualifiers) or None))
+            descriptor = descriptor_ui = None
+            major_topic = 0
+            qualifiers = []
+            continue
+        if tag == 'DescriptorName':
+            descriptor = child.text
+            descriptor_ui = child.get('UI')
+        elif child.text:
+            qualifiers.append(child.text)
+        else:
+            continue
+        if child.get('MajorTopicYN') == 'Y':
+            major_topic = 1
+    if descriptor:
+        items.append((descriptor_ui, descriptor, major_topic, "|".join(qualifiers) or None))
+    return items
+
+
+def _keyword_items(list_elem):
+    """
+    Returns the keyword and whether it is a major topic of each Keyword element of a KeywordList element.
+    """
+    items = []
+    for elem in list_elem.iterchildren('Keyword'):
+        keyword = _element_text(elem)
+        if keyword is not None:
+            items.append((keyword, int(elem.get('MajorTopicYN') == 'Y')))
+    return items
+
+
+def _chemical_items(list_elem):
+    """
+    Returns registry number (None for the placeholder 0), substance UI and substance name of each Chemical element of a
+    ChemicalList element.
+    """
+    items = []
+    substance = None
+    for child in list_elem.iter('Chemical', 'RegistryNumber', 'NameOfSubstance'):
+        tag = child.tag
+        if tag == 'Chemical':
+            if substance:
+                items.append((registry_number, substance_ui, substance))
+            registry_number = substance = substance_ui = None
+        elif tag == 'NameOfSubstance':
+            substance = child.text
+            substance_ui = child.get('UI')
+        elif child.text != '0':
+            registry_number = child.text
+    if substance:
+        items.append((registry_number, substance_ui, substance))
+    return items
+
+
+def _article_id_items(list_elem):
+    """
+    Returns the type of the identifier (e.g. doi or pmc) and the identifier of each ArticleId element of an
+    ArticleIdList element.
+    """
+    return [(elem.get('IdType', 'unknown'), elem.text) for elem in list_elem.iterchildren('ArticleId') if elem.text]
+
+
+# position of the values of an author by tag of the child element, only collective names may contain formatting
+_AUTHOR_NAME_TAGS = {'LastName': 0, 'ForeName': 1, 'Initials': 2, 'CollectiveName': 3}
+
+
+def _author_items(list_elem):
+    """
+    Returns last name, fore name, initials and the name of a collective of each Author element of an AuthorList
+    element.
+    """
+    items = []
+    values = None
+    for child in list_elem.iter('Author', *_AUTHOR_NAME_TAGS):
+        tag = child.tag
+        if tag == 'Author':
+            if values is not None and any(values):
+                items.append(tuple(values))
+            values = [None, None, None, None]
+        elif values is not None:
+            position = _AUTHOR_NAME_TAGS[tag]
+            values[position] = child.text if position < 3 else _element_text(child)
+    if values is not None and any(values):
+        items.append(tuple(values))
+    return items
+
+
+class FieldSpec:
+    """
+    Data capsule for the specification of a detail of publications that can occur any number of times per publication
+    and is stored in a child table of the table publications.
+    """
+
+    def __init__(self, path: str, table_name: str, columns: tuple, sql_create_table: str, extract_items):
+        """
+        Setting up the specification.
+
+        :param path: path of the list elements holding the items of the detail within the PubmedArticle element
+        :type path: str
+        :param table_name: name of the child table the items are stored in
+        :type table_name: str
+        :param columns: columns of the child table the values of an item are stored in, besides pmid and position
+        :type columns: tuple
+        :param sql_create_table: SQL statement creating the child table
+        :type sql_create_table: str
+        :param extract_items: function returning the values of every item of a list element in the order of the
+            columns, where items without values are skipped
+        :type extract_items: callable
+        """
+        self.path = path
+        self.table_name = table_name
+        self.columns = columns
+        self.sql_create_table = sql_create_table
+        self.extract_items = extract_items
+
+
+# details of publications that can be extracted in addition to the fields in ELEM_OF_INTEREST
+DETAIL_FIELDS = {
+    'mesh_terms': FieldSpec('MedlineCitation/MeshHeadingList', 'publication_mesh_terms',
+                            ('descriptor_ui', 'descriptor', 'major_topic', 'qualifiers'), SQL_CREATE_MESH_TERMS_TABLE,
+                            _mesh_heading_items),
+    'keywords': FieldSpec('MedlineCitation/KeywordList', 'publication_keywords', ('keyword', 'major_topic'),
+                          SQL_CREATE_KEYWORDS_TABLE, _keyword_items),
+    'chemicals': FieldSpec('MedlineCitation/ChemicalList', 'publication_chemicals',
+                           ('registry_number', 'substance_ui', 'substance'), SQL_CREATE_CHEMICALS_TABLE,
+                           _chemical_items),
+    'article_ids': FieldSpec('PubmedData/ArticleIdList', 'publication_article_ids', ('id_type', 'article_id'),
+                             SQL_CREATE_ARTICLE_IDS_TABLE, _article_id_items),
+    'authors': FieldSpec('MedlineCitation/Article/AuthorList', 'publication_authors',
+                         ('last_name', 'fore_name', 'initials', 'collective_name'), SQL_CREATE_AUTHORS_TABLE,
+                         _author_items),
+}
+
+
+def check_detail_fields(fields):
+    """
+    Checks whether all details requested are known.
+
+    :param fields: names of details in :data:~`DETAIL_FIELDS`
+    :type fields: iterable
+    :return: names of the details in the order given
+    :rtype: tuple
+    :raises ValueError: if one of the details is not known
+    """
+    fields = tuple(fields or ())
+    unknown = [field for field in fields if field not in DETAIL_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown publication details {unknown}, expected any of {list(DETAIL_FIELDS)}.")
+    return fields
 
 
 class Publication:
@@ -25,6 +337,8 @@ class Publication:
         self.title = str(_title) if _title is not None else _title
         self.journal = str(_journal) if _journal is not None else _journal
         self.pub_year = str(_pub_year) if _pub_year is not None else _pub_year
+        # values of the items of each detail extracted, by name of the detail
+        self.details = {}
 
     def _has_all_attributes(self):
         """
@@ -35,6 +349,34 @@ class Publication:
         """
         return all(k is not None for k in (self.pmid, self.abstract_text, self.title, self.journal, self.pub_year))
 
+    def to_record(self, codec: str = None):
+        """
+        Returns the attributes of the publication in the order of the columns of :data:~`SQL_INSERT_PUBLICATION`.
+        If a codec is given, the record is prepared for the compact schema: the abstract is compressed and the year
+        converted to an integer, while the journal is kept as title to be looked up by the
+        :class:~`CompactPublicationWriter`.
+
+        :param codec: codec the abstract is compressed with, None to keep the abstract as text
+        :type codec: str
+        :return: pmid, abstract text, title, journal and publication year of the publication
+        :rtype: tuple
+        """
+        if codec is not None:
+            return self.pmid, compress_text(self.abstract_text, codec), self.title, self.journal, \
+                   parse_year(self.pub_year)
+        return self.pmid, self.abstract_text, self.title, self.journal, self.pub_year
+
+    def to_detail_rows(self):
+        """
+        Returns the rows of the child tables for the details extracted, each starting with pmid and position.
+
+        :return: rows by name of the detail
+        :rtype: dict
+        """
+        pmid = int(self.pmid)
+        return dict((field, [(pmid, position) + values for position, values in enumerate(items)])
+                    for field, items in self.details.items())
+
     def save_publication_to_database(self, db_conn):
         """
         Save data extracted about a publication from one of the data sources to the publication database.
@@ -47,76 +389,775 @@ class Publication:
         :rtype: bool
         """
 
-        stm = "INSERT INTO publications(pmid,pub_abstract,title,journal,pub_year) VALUES(?,?,?,?,?)"
-
         if self._has_all_attributes():
-            execute_insert_statement(db_conn, stm, (self.pmid, self.abstract_text, self.title, self.journal,
-                                                    self.pub_year))
+            execute_insert_statement(db_conn, SQL_INSERT_PUBLICATION, self.to_record())
             return True
         else:
             return False
 
 
-def extract_publication_data_from_xml(file_path: str, db_conn):
+def parse_year(pub_year: str):
     """
-    Extracts title, abstract, journal and so on for a publication contained in the Pubmed XML file.
-    Provides summary information at the end about how many publications have been identified.
+    Returns the year of a publication date as integer.
 
-    :param file_path: path to XML file from which publication data is to be extracted
-    :type file_path: str
-    :param db_conn: connection to the database extracted publication information should be written to
-    :type db_conn: :class:~`sqlite3.Connection`
+    :param pub_year: year as found in the XML file
+    :type pub_year: str
+    :return: year, None if the text does not contain a four digit year
+    :rtype: int
+    """
+    match = _YEAR_PATTERN.search(pub_year or "")
+    return int(match.group()) if match else None
+
+
+class CompactPublicationWriter(BulkInsertWriter):
+    """
+    Writer for the compact schema, taking publication records as returned by :meth:~`Publication.to_record` with a
+    codec. The journal titles are replaced by their identifier in the table journals, where journals not seen before
+    are added within the transaction of the writer. The identifiers are cached, as the number of journals is small
+    compared to the number of publications.
     """
-    # todo: the approach for identifying relevant parts of the publication is very simplistic and 
-    #  not very foolproof for now and should be changed going forward
+
+    def __init__(self, db_conn, codec: str = DEFAULT_COMPRESSION_CODEC, **kwargs):
+        """
+        Setting up the writer for the table publications and reading the journals stored already.
+
+        :param db_conn: connection to the database holding the tables publications and journals
+        :type db_conn: sqlite3.Connection
+        :param codec: codec the abstracts are compressed with
+        :type codec: str
+        :param kwargs: further settings passed on to :class:~`BulkInsertWriter`
+        """
+        super().__init__(db_conn, 'publications', COMPACT_PUBLICATION_COLUMNS, **kwargs)
+        self.codec = codec
+        # the triggers of the full-text index need to decompress the abstracts
+        register_compression_functions(db_conn, codec)
+        self._journal_ids = dict((journal, journal_id) for journal_id, journal in
+                                 db_conn.execute("SELECT journal_id, journal FROM journals"))
+
+    def journal_id(self, journal: str):
+        """
+        Returns the identifier of a journal, adding the journal to the table journals if it is not stored yet.
+
+        :param journal: title of the journal
+        :type journal: str
+        :return: identifier of the journal
+        :rtype: int
+        """
+        journal_id = self._journal_ids.get(journal)
+        if journal_id is None:
+            if not self.db_conn.in_transaction:
+                self.db_conn.execute("BEGIN")
+            journal_id = self.db_conn.execute("INSERT INTO journals(journal) VALUES(?)", (journal,)).lastrowid
+            self._journal_ids[journal] = journal_id
+        return journal_id
+
+    def add(self, row: tuple):
+        """
+        Adds a publication record to the buffer with the journal replaced by its identifier.
+
+        :param row: pmid, compressed abstract, title, journal and publication year of the publication
+        :type row: tuple
+        """
+        super().add((row[0], row[1], row[2], self.journal_id(row[3]), row[4]))
+
+    def add_many(self, rows):
+        """
+        Adds multiple publication records to the buffer with the journals replaced by their identifier, see
+        :meth:~`add`.
+
+        :param rows: iterable of publication records
+        :type rows: iterable
+        """
+        journal_id = self.journal_id
+        super().add_many([(row[0], row[1], row[2], journal_id(row[3]), row[4]) for row in rows])
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            # journals added within the transaction rolled back are gone
+            self._journal_ids = dict((journal, journal_id) for journal_id, journal in
+                                     self.db_conn.execute("SELECT journal_id, journal FROM journals"))
+        return super().__exit__(exc_type, exc_val, exc_tb)
+
+
+class PublicationDetailWriter:
+    """
+    Writer for the publications together with their details, which are written in bulk to the child tables by one
+    :class:~`protein_score_utilities.convenience_functions_database.BulkInsertWriter` per detail, while the
+    publications are written by the writer for the table publications wrapped. All writers share the connection to
+    the database, so that the details are committed together with the publications.
+
+    Publications found again keep the details of the version stored before, unless the publications are upserted, in
+    which case the details stored before are deleted ahead of writing the details of the new version. Without upsert,
+    the details of a publication are only written if its record is inserted, i.e. if its PMID is neither stored nor
+    buffered before; the publications are therefore only written together with their details.
+    """
+
+    def __init__(self, publication_writer, fields: tuple, upsert: bool = False):
+        """
+        Setting up a writer for the child table of every detail.
+
+        :param publication_writer: writer for the table publications
+        :type publication_writer: :class:~`protein_score_utilities.convenience_functions_database.BulkInsertWriter`
+        :param fields: names of the details in :data:~`DETAIL_FIELDS` to be written
+        :type fields: tuple
+        :param upsert: whether the details of publications found again should replace the details stored before
+        :type upsert: bool
+        """
+        self.publication_writer = publication_writer
+        self.db_conn = publication_writer.db_conn
+        self.batch_size = publication_writer.batch_size
+        self.upsert = upsert
+        # the details are only written by flush, so that the details stored before can be deleted beforehand
+        self.detail_writers = dict(
+            (field, BulkInsertWriter(self.db_conn, DETAIL_FIELDS[field].table_name,
+                                     ('pmid', 'position') + DETAIL_FIELDS[field].columns, batch_size=float('inf'),
+                                     transaction_size=publication_writer.transaction_size))
+            for field in check_detail_fields(fields))
+        self._pending_pmids = set()
+        self._seconds_deleting = 0.0
+        if not upsert:
+            # publications are written by flush only, once the details of publications found again have been dropped
+            publication_writer.batch_size = float('inf')
+
+    def __getattr__(self, name):
+        # counters and settings are the ones of the writer for the table publications
+        return getattr(self.publication_writer, name)
+
+    @property
+    def seconds_inserting(self):
+        """
+        Seconds spent writing publications and details, including the deletion of details replaced.
+        """
+        return self.publication_writer.seconds_inserting + self._seconds_deleting + \
+            sum(detail_writer.seconds_inserting for detail_writer in self.detail_writers.values())
+
+    @property
+    def seconds_committing(self):
+        """
+        Seconds spent committing the transactions shared by the publications and details.
+        """
+        return self.publication_writer.seconds_committing + \
+            sum(detail_writer.seconds_committing for detail_writer in self.detail_writers.values())
+
+    def add(self, row: tuple):
+        """
+        Adds a publication record to the buffer of the writer for the table publications.
+
+        :param row: publication record as returned by :meth:~`Publication.to_record`
+        :type row: tuple
+        """
+        self.publication_writer.add(row)
+
+    def add_many(self, rows):
+        """
+        Adds multiple publication records to the buffer of the writer for the table publications.
+
+        :param rows: iterable of publication records
+        :type rows: iterable
+        """
+        self.publication_writer.add_many(rows)
+
+    def add_details(self, pmids: list, detail_rows: dict):
+        """
+        Adds the rows of the details of publications to the buffers of the writers for the child tables, which are
+        written once the batch size is reached.
+
+        :param pmids: PMIDs of all publications the details belong to, including the ones without any details
+        :type pmids: list
+        :param detail_rows: rows as returned by :meth:~`Publication.to_detail_rows` by name of the detail
+        :type detail_rows: dict
+        """
+        pmids = [int(pmid) for pmid in pmids]
+        if self.upsert:
+            if not self._pending_pmids.isdisjoint(pmids):
+                # the rows buffered belong to an earlier version of the same publication
+                self._flush_details()
+        else:
+            # the records of publications buffered before are ignored when inserted, as are their details
+            ignored = self._pending_pmids.intersection(pmids)
+            if ignored:
+                detail_rows = dict((field, [row for row in rows if row[0] not in ignored])
+                                   for field, rows in detail_rows.items())
+        self._pending_pmids.update(pmids)
+        for field, rows in detail_rows.items():
+            self.detail_writers[field].add_many(rows)
+        if len(self._pending_pmids) >= self.batch_size or \
+                any(len(detail_writer._buffer) >= self.batch_size for detail_writer in self.detail_writers.values()):
+            if self.upsert:
+                self._flush_details()
+            else:
+                self.flush()
+
+    def _flush_details(self):
+        """
+        Writes the buffered details to the child tables, after deleting the details stored before for the publications
+        if upserting, or dropping the details of publications stored before otherwise.
+        """
+        if self._pending_pmids and self.upsert:
+            self._delete_details(list(self._pending_pmids))
+        elif self._pending_pmids:
+            stored = self._stored_pmids(list(self._pending_pmids))
+            if stored:
+                for detail_writer in self.detail_writers.values():
+                    detail_writer._buffer = [row for row in detail_writer._buffer if row[0] not in stored]
+        self._pending_pmids = set()
+        for detail_writer in self.detail_writers.values():
+            detail_writer.flush()
+
+    def _stored_pmids(self, pmids: list):
+        """
+        Returns the PMIDs among the given ones that are stored in the table publications, i.e. the PMIDs whose records
+        still buffered are counted as duplicates and ignored when the publications are written.
+
+        :param pmids: PMIDs of the publications
+        :type pmids: list
+        :return: PMIDs stored
+        :rtype: set
+        """
+        start = time.perf_counter()
+        stored = set()
+        # the number of parameters per statement is limited in older SQLite versions
+        for i in range(0, len(pmids), 500):
+            chunk = pmids[i:i + 500]
+            stored.update(pmid for pmid, in self.db_conn.execute(
+                f"SELECT pmid FROM publications WHERE pmid IN ({','.join('?' for _ in chunk)})", chunk))
+        self._seconds_deleting += time.perf_counter() - start
+        return stored
+
+    def _delete_details(self, pmids: list):
+        """
+        Deletes the details stored for the given publications from all child tables.
+
+        :param pmids: PMIDs of the publications
+        :type pmids: list
+        """
+        if not pmids:
+            return
+        start = time.perf_counter()
+        if not self.db_conn.in_transaction:
+            self.db_conn.execute("BEGIN")
+        # the number of parameters per statement is limited in older SQLite versions
+        for i in range(0, len(pmids), 500):
+            chunk = pmids[i:i + 500]
+            for detail_writer in self.detail_writers.values():
+                self.db_conn.execute(f"DELETE FROM {detail_writer.table_name} WHERE pmid IN "
+                                     f"({','.join('?' for _ in chunk)})", chunk)
+        self._seconds_deleting += time.perf_counter() - start
+
+    def flush(self):
+        """
+        Writes all buffered publications and details to the database.
+        """
+        self._flush_details()
+        self.publication_writer.flush()
+
+    def delete(self, key_column: str, keys):
+        """
+        Deletes the publications whose PMID is among the keys provided together with their details.
+
+        :param key_column: name of the column the keys refer to, needs to be pmid
+        :type key_column: str
+        :param keys: PMIDs of the publications to be deleted
+        :type keys: iterable
+        :return: number of publications deleted
+        :rtype: int
+        """
+        keys = list(keys)
+        self._flush_details()
+        self._delete_details([int(key) for key in keys])
+        return self.publication_writer.delete(key_column, keys)
+
+    def commit(self):
+        """
+        Writes all buffered publications and details and commits the open transaction.
+        """
+        self._flush_details()
+        self.publication_writer.commit()
+
+    def close(self):
+        """
+        Writes all buffered publications and details and commits the open transaction.
+        """
+        self.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self._pending_pmids = set()
+            for detail_writer in self.detail_writers.values():
+                detail_writer._buffer = []
+        return self.publication_writer.__exit__(exc_type, exc_val, exc_tb)
+
+
+def writer_codec(writer):
+    """
+    Returns the codec the publication records need to be prepared with for the given writer.
+
+    :param writer: writer for the table publications
+    :type writer: :class:~`protein_score_utilities.convenience_functions_database.BulkInsertWriter`
+    :return: codec for :meth:~`Publication.to_record`, None for the plain schema
+    :rtype: str
+    """
+    if isinstance(writer, PublicationDetailWriter):
+        writer = writer.publication_writer
+    return writer.codec if isinstance(writer, CompactPublicationWriter) else None
+
+
+@lru_cache(maxsize=None)
+def _compiled_elem_of_interest():
+    """
+    Compiles the XPath expressions of :data:~`ELEM_OF_INTEREST` once, so that they do not have to be parsed again for
+    every publication.
+
+    :return: internal reference, compiled XPath expression and function returning the value from the elements found
+        for each field
+    :rtype: tuple
+    """
+    from lxml import etree
+    return tuple((key, etree.XPath(value), _FIELD_TEXT.get(key, _first_text))
+                 for key, value in ELEM_OF_INTEREST.items())
+
+
+@lru_cache(maxsize=None)
+def _compiled_detail_fields(fields: tuple):
+    """
+    Compiles a single XPath expression finding the list elements of all details requested, so that the PubmedArticle
+    element is searched once rather than once per detail.
+
+    :param fields: names of details in :data:~`DETAIL_FIELDS`
+    :type fields: tuple
+    :return: compiled XPath expression (None if no details are requested) and, by tag of the list elements, the name
+        of the detail and the function returning the values of the items of a list element
+    :rtype: tuple
+    """
+    if not fields:
+        return None, {}
     from lxml import etree
+    return etree.XPath(" | ".join(DETAIL_FIELDS[field].path for field in fields)), \
+        dict((DETAIL_FIELDS[field].path.rsplit('/', 1)[-1], (field, DETAIL_FIELDS[field].extract_items))
+             for field in fields)
+
+
+def _bytes_read(file):
+    """
+    Returns the number of bytes read from a file object so far, i.e. of the decompressed content for compressed files.
+
+    :param file: file object the XML is parsed from
+    :type file: file object
+    :return: position within the file, 0 if it cannot be determined
+    :rtype: int
+    """
     try:
-        context = etree.iterparse(file_path, events=('end',), tag="PubmedArticle")
+        return file.tell()
+    except (AttributeError, OSError, ValueError):
+        return 0
 
-        print(f"Starting data extraction for file {file_path}")
 
-        # fields that are required for each extracted publication in order to be stored
-        # key is the internal reference and value the path of the element within the XML element
-        elem_of_interest = {
-            'pmid': 'MedlineCitation/PMID',
-            'abstract_text': 'MedlineCitation/Article/Abstract/AbstractText',
-            'title': 'MedlineCitation/Article/ArticleTitle',
-            'journal': 'MedlineCitation/Article/Journal/Title',
-            'pub_year': 'MedlineCitation/Article/Journal/JournalIssue/PubDate/Year'
-        }
+def _release_element(elem):
+    """
+    Clears an element that has been processed and removes it from the tree together with all elements preceding it,
+    so that neither the element nor siblings without a tag of interest accumulate below the root.
+
+    :param elem: element directly below the root of the XML file
+    :type elem: :class:~`lxml.etree._Element`
+    """
+    elem.clear(keep_tail=False)
+    parent = elem.getparent()
+    if parent is not None:
+        del parent[:parent.index(elem) + 1]
+
 
-        # add counters for summary stats
-        counter_publications = 0
-        counter_publications_incomplete = 0  # does not account for publications that might
+def _line_offset(file_path, line: int):
+    """
+    Returns the byte offset at which a line starts within the (decompressed) content of a file.
+
+    :param file_path: path to the file
+    :type file_path: str or Path
+    :param line: number of the line, starting at 1
+    :type line: int
+    :return: byte offset of the line, None if the file cannot be read up to the line
+    :rtype: int
+    """
+    offset = 0
+    try:
+        with open_data_file(file_path) as file:
+            for _ in range(line - 1):
+                content = file.readline()
+                if not content:
+                    return None
+                offset += len(content)
+    except READ_ERRORS:
+        return None
+    return offset
+
+
+def describe_parse_error(file_path, error: Exception, stats: dict = None):
+    """
+    Returns a message describing why a file could not be parsed completely and where the parsing stopped. For syntax
+    errors, the line and column reported by the parser are converted into the byte offset within the (decompressed)
+    XML, for truncated or corrupted files the number of bytes that could be read is given. The byte offset is added to
+    the stats as error_offset, if provided.
 
+    :param file_path: path to the XML file that could not be parsed
+    :type file_path: str or Path
+    :param error: error raised while parsing the file, i.e. :class:~`lxml.etree.XMLSyntaxError` or one of
+        :data:~`READ_ERRORS`
+    :type error: Exception
+    :param stats: stats of the parsing as collected by :func:~`iterate_publications_from_xml`
+    :type stats: dict
+    :return: message describing the error
+    :rtype: str
+    """
+    stats = {} if stats is None else stats
+    position = getattr(error, 'position', None)
+    if position is not None:
+        line, column = position
+        line_offset = _line_offset(file_path, line) if isinstance(file_path, (str, PurePath)) else None
+        offset = line_offset + max(column - 1, 0) if line_offset is not None else stats.get('bytes_read')
+        # the message of the parser ends with the position already
+        reason = error.msg.split(f", line {line}, column", 1)[0]
+        message = f"Provided XML could not be parsed: {reason} (line {line}, column {column}, byte offset {offset})."
+    else:
+        offset = stats.get('bytes_read')
+        message = f"Provided XML could not be read completely: {error} (after {offset} bytes)."
+    stats['error_offset'] = offset
+    return message + " Publications found before the error are kept."
+
+
+def iterate_publications_from_xml(file_path, deleted_pmids: list = None, fields: tuple = (), stats: dict = None):
+    """
+    Generator that walks through a Pubmed XML file and yields one :class:~`Publication` for every PubmedArticle
+    element found. The publications are yielded whether or not all of the required attributes could be identified, so
+    that the caller can decide how incomplete records are to be handled. Elements that have been processed are deleted
+    straight away, together with any element preceding them, so that the memory needed stays the same however large
+    the file is. Entities declared within the file are not expanded. Compressed files (e.g. .xml.gz) are decompressed
+    while being parsed.
+
+    If a dictionary for the stats is provided, the seconds spent parsing the XML (parse_seconds) and extracting the
+    fields from the elements parsed (extract_seconds) as well as the number of bytes of XML read (bytes_read) are
+    added to it. The time the caller spends between two publications is not included.
+
+    :param file_path: path to XML file (or binary file object) from which publication data is to be extracted
+    :type file_path: str or Path
+    :param deleted_pmids: list to which the PMIDs listed in DeleteCitation elements are appended, if provided
+    :type deleted_pmids: list
+    :param fields: names of the details in :data:~`DETAIL_FIELDS` to be extracted into the attribute details of each
+        publication
+    :type fields: tuple
+    :param stats: dictionary the timings and the number of bytes read are added to, if provided
+    :type stats: dict
+    :return: generator of publications found in the XML file
+    :rtype: generator
+    :raises lxml.etree.XMLSyntaxError: if the provided XML could not be parsed
+    :raises OSError: if a compressed file is truncated or corrupted, see :data:~`READ_ERRORS` for the errors raised
+        by the different formats
+    """
+    if isinstance(file_path, (str, PurePath)):
+        with open_data_file(file_path) as file:
+            yield from iterate_publications_from_xml(file, deleted_pmids, fields, stats)
+        return
+
+    from lxml import etree
+    context = etree.iterparse(file_path, events=('end',), tag=_TOP_LEVEL_TAGS, resolve_entities=False,
+                              remove_comments=True, remove_pis=True)
+    elem_of_interest = _compiled_elem_of_interest()
+    fields = check_detail_fields(fields)
+    detail_xpath, detail_fields = _compiled_detail_fields(fields)
+    parse_seconds = 0.0
+    extract_seconds = 0.0
+
+    try:
         # go through all the publications found in the XML file
+        parse_start = time.perf_counter()
         for event, elem in context:
-            counter_publications += 1
+            extract_start = time.perf_counter()
+            parse_seconds += extract_start - parse_start
+            if elem.tag != "PubmedArticle":
+                if elem.tag == "DeleteCitation" and deleted_pmids is not None:
+                    deleted_pmids.extend(pmid.text for pmid in elem.iterfind("PMID"))
+                _release_element(elem)
+                parse_start = time.perf_counter()
+                continue
+
             publication = Publication()
 
-            # attempt to extract all the relevant fields for each publication
-            for key, value in elem_of_interest.items():
-                eoi = elem.xpath(value)
-                # only take first entry found
-                # todo: this needs to be expanded, handled more carefully and details logged once logger is in place
-                if len(eoi) > 0:
-                    if eoi[0].text is not None:
-                        publication.__setattr__(key, eoi[0].text)
-                else:
-                    break
-
-            # todo: there are a number of integrity errors raised through duplicated PMIDs that would need to be
-            #  further investigated
-            if not publication.save_publication_to_database(db_conn):
-                counter_publications_incomplete += 1
+            # attempt to extract all the relevant fields for each publication, fields not found are left unset
+            for key, xpath, field_text in elem_of_interest:
+                eoi = xpath(elem)
+                if eoi:
+                    setattr(publication, key, field_text(eoi))
+            if detail_xpath is not None:
+                details = publication.details = dict((field, []) for field in fields)
+                for list_elem in detail_xpath(elem):
+                    field, extract_items = detail_fields[list_elem.tag]
+                    details[field].extend(extract_items(list_elem))
+            extract_seconds += time.perf_counter() - extract_start
+
+            yield publication
 
             # deleting the element and any references to it to speed up the process of extraction
-            elem.clear()
-            while elem.getprevious() is not None:
-                del elem.getparent()[0]
-
-        # print summary statistics
-        print(f"Total number of publications found: {counter_publications}")
-        print(f"Total number of incomplete publications found: {counter_publications_incomplete}")
-    except etree.XMLSyntaxError as e:
-        print("Provided XML could not be parsed.")
+            parse_start = time.perf_counter()
+            _release_element(elem)
+        parse_seconds += time.perf_counter() - parse_start
+    finally:
+        if stats is not None:
+            stats['parse_seconds'] = stats.get('parse_seconds', 0.0) + parse_seconds
+            stats['extract_seconds'] = stats.get('extract_seconds', 0.0) + extract_seconds
+            stats['bytes_read'] = stats.get('bytes_read', 0) + _bytes_read(file_path)
+
+
+def create_publication_writer(db_conn, upsert: bool = False, codec: str = DEFAULT_COMPRESSION_CODEC,
+                              fields: tuple = (), **kwargs):
+    """
+    Creates a writer that inserts publication records as returned by :meth:~`Publication.to_record` in bulk into the
+    publications table. Publications with an already existing PMID are counted as duplicates and either skipped or, if
+    upserting, replace the publication stored before. If the table publications uses the compact schema, a
+    :class:~`CompactPublicationWriter` is used, whose records need to be prepared with the codec of the writer (see
+    :func:~`writer_codec`). If details are to be written as well, the writer is wrapped by a
+    :class:~`PublicationDetailWriter`.
+
+    :param db_conn: connection to the database extracted publication information should be written to
+    :type db_conn: :class:~`sqlite3.Connection`
+    :param upsert: whether publications with an already existing PMID should replace the stored publication
+    :type upsert: bool
+    :param codec: codec the abstracts are compressed with in the compact schema
+    :type codec: str
+    :param fields: names of the details in :data:~`DETAIL_FIELDS` to be written to their child tables
+    :type fields: tuple
+    :param kwargs: further settings passed on to the writer, e.g. batch_size and transaction_size
+    :return: writer for the publications table
+    :rtype: :class:~`protein_score_utilities.convenience_functions_database.BulkInsertWriter`
+    """
+    if upsert:
+        kwargs.update(on_conflict='update', conflict_columns=('pmid',))
+    if has_compact_publication_schema(db_conn):
+        writer = CompactPublicationWriter(db_conn, codec, **kwargs)
+    else:
+        writer = BulkInsertWriter(db_conn, 'publications', PUBLICATION_COLUMNS, **kwargs)
+    return PublicationDetailWriter(writer, fields, upsert) if fields else writer
+
+
+def create_publication_tables(db_conn, compact: bool = False, codec: str = DEFAULT_COMPRESSION_CODEC,
+                              fields: tuple = ()):
+    """
+    Creates the table publications, either in the plain or in the compact schema together with the table journals and
+    the view publications_text. If the compact schema is requested for a database holding the table publications in the
+    plain schema, the table is migrated (see :func:~`migrate_to_compact_schema`), otherwise existing tables are kept as
+    they are. The child tables of the details requested are created as well.
+
+    :param db_conn: connection to the database
+    :type db_conn: sqlite3.Connection
+    :param compact: whether the compact schema should be used
+    :type compact: bool
+    :param codec: codec the abstracts are compressed with when migrating to the compact schema
+    :type codec: str
+    :param fields: names of the details in :data:~`DETAIL_FIELDS` whose child tables are to be created
+    :type fields: tuple
+    """
+    exists = db_conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='publications'").fetchone()
+    if compact and exists and not has_compact_publication_schema(db_conn):
+        migrate_to_compact_schema(db_conn, codec)
+    elif compact:
+        db_conn.execute(SQL_CREATE_JOURNALS_TABLE)
+        db_conn.execute(SQL_CREATE_COMPACT_PUBLICATIONS_TABLE)
+        db_conn.execute(SQL_CREATE_PUBLICATIONS_TEXT_VIEW)
+    else:
+        db_conn.execute(SQL_CREATE_PUBLICATIONS_TABLE)
+    for field in check_detail_fields(fields):
+        db_conn.execute(DETAIL_FIELDS[field].sql_create_table)
+    db_conn.commit()
+
+
+def migrate_to_compact_schema(db_conn, codec: str = DEFAULT_COMPRESSION_CODEC, vacuum: bool = True):
+    """
+    Migrates the table publications from the plain to the compact schema within one transaction: the journal titles
+    are moved to the table journals, the years are converted to integers and the abstracts are compressed. A full-text
+    index on the publications is rebuilt for the compact schema. Databases using the compact schema already are left
+    unchanged.
+
+    :param db_conn: connection to the database holding the table publications
+    :type db_conn: sqlite3.Connection
+    :param codec: codec the abstracts are compressed with
+    :type codec: str
+    :param vacuum: whether the database file should be rebuilt afterwards to release the space freed
+    :type vacuum: bool
+    :return: number of publications migrated
+    :rtype: int
+    """
+    from protein_score_utilities.publication_search import create_publication_search_index
+    from protein_score_utilities.publication_search import drop_publication_search_index
+    from protein_score_utilities.publication_search import has_publication_search_index
+
+    if has_compact_publication_schema(db_conn):
+        return 0
+
+    register_compression_functions(db_conn, codec)
+    db_conn.create_function("parse_year", 1, parse_year, deterministic=True)
+    search_index = has_publication_search_index(db_conn)
+    db_conn.commit()
+    try:
+        db_conn.execute("BEGIN")
+        if search_index:
+            drop_publication_search_index(db_conn)
+        # further triggers on the table, e.g. the ones tracking the annotations, are dropped with it and created again
+        triggers = [sql for sql, in db_conn.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND "
+                                                    "tbl_name='publications'")]
+        db_conn.execute(SQL_CREATE_JOURNALS_TABLE)
+        db_conn.execute("INSERT OR IGNORE INTO journals(journal) SELECT DISTINCT journal FROM publications "
+                        "ORDER BY journal")
+        db_conn.execute(_SQL_CREATE_COMPACT_PUBLICATIONS_TABLE.format(table_name='publications_compact'))
+        n_publications = db_conn.execute(
+            "INSERT INTO publications_compact(pmid, pub_abstract, title, journal_id, pub_year) "
+            "SELECT p.pmid, compress_text(p.pub_abstract), p.title, j.journal_id, parse_year(p.pub_year) "
+            "FROM publications p JOIN journals j ON j.journal = p.journal ORDER BY p.pmid").rowcount
+        db_conn.execute("DROP TABLE publications")
+        db_conn.execute("ALTER TABLE publications_compact RENAME TO publications")
+        db_conn.execute(SQL_CREATE_PUBLICATIONS_TEXT_VIEW)
+        for sql in triggers:
+            db_conn.execute(sql)
+        db_conn.commit()
+    except BaseException:
+        db_conn.rollback()
+        raise
+
+    if search_index:
+        create_publication_search_index(db_conn)
+    if vacuum:
+        db_conn.execute("VACUUM")
+    print(f"Migrated {n_publications} publications to the compact schema")
+    return n_publications
+
+
+def record_file_metrics(metrics, file_path, counters: tuple, stats: dict, insert_seconds: float,
+                        commit_seconds: float, seconds: float, error: str = None):
+    """
+    Adds the timings and counters of an ingested file to the metrics and emits an event for the file.
+
+    :param metrics: recorder the file is reported to
+    :type metrics: :class:~`protein_score_utilities.run_metrics.MetricsRecorder`
+    :param file_path: path to the XML file ingested
+    :type file_path: str
+    :param counters: number of publications found, of incomplete publications, of duplicated publications and of
+        deleted publications
+    :type counters: tuple
+    :param stats: stats of the parsing as collected by :func:~`iterate_publications_from_xml`, possibly together with
+        the peak memory of the process parsing the file (peak_rss_bytes)
+    :type stats: dict
+    :param insert_seconds: seconds spent writing the publications of the file
+    :type insert_seconds: float
+    :param commit_seconds: seconds spent committing the publications of the file
+    :type commit_seconds: float
+    :param seconds: seconds spent on the file in total
+    :type seconds: float
+    :param error: error message if the file could not be parsed completely, where the byte offset of the error is
+        taken from the stats (error_offset)
+    :type error: str
+    :return: the event emitted
+    :rtype: dict
+    """
+    timings = {'parse': stats.get('parse_seconds', 0.0), 'extract': stats.get('extract_seconds', 0.0),
+               'insert': insert_seconds, 'commit': commit_seconds}
+    for stage, stage_seconds in timings.items():
+        metrics.add_time(stage, stage_seconds)
+    bytes_read = stats.get('bytes_read', 0)
+    n_publications, n_incomplete, n_duplicated, n_deleted = counters
+    metrics.count('files')
+    metrics.count('files_failed', error is not None)
+    metrics.count('publications', n_publications)
+    metrics.count('publications_incomplete', n_incomplete)
+    metrics.count('publications_duplicated', n_duplicated)
+    metrics.count('publications_deleted', n_deleted)
+    metrics.count('bytes_read', bytes_read)
+    stage_timings = dict((f"{stage}_seconds", round(stage_seconds, 4)) for stage, stage_seconds in timings.items())
+    return metrics.emit('file', file=str(file_path), publications=n_publications,
+                        publications_incomplete=n_incomplete, publications_duplicated=n_duplicated,
+                        publications_deleted=n_deleted, bytes_read=bytes_read, **stage_timings,
+                        seconds=round(seconds, 4),
+                        publications_per_second=round(n_publications / seconds, 1) if seconds > 0 else None,
+                        worker_peak_rss_bytes=stats.get('peak_rss_bytes'), error=error,
+                        error_offset=stats.get('error_offset'))
+
+
+def extract_publication_data_from_xml(file_path: str, db_conn, writer=None, upsert: bool = False,
+                                      fields: tuple = (), metrics=None):
+    """
+    Extracts title, abstract, journal and so on for a publication contained in the Pubmed XML file.
+    Provides summary information at the end about how many publications have been identified.
+
+    :param file_path: path to XML file (optionally compressed, e.g. .xml.gz) from which publication data is to be
+        extracted
+    :type file_path: str
+    :param db_conn: connection to the database extracted publication information should be written to
+    :type db_conn: :class:~`sqlite3.Connection`
+    :param writer: writer for the publications table to be used, e.g. to share one writer across multiple files; if
+        not provided, a writer is created and all publications are committed at the end of the file
+    :type writer: :class:~`protein_score_utilities.convenience_functions_database.BulkInsertWriter`
+    :param upsert: whether publications with an already existing PMID should replace the stored publication, only
+        used if no writer is provided
+    :type upsert: bool
+    :param fields: names of the details in :data:~`DETAIL_FIELDS` to be extracted, which requires a writer for the
+        details, e.g. created by :func:~`create_publication_writer` with the same fields
+    :type fields: tuple
+    :param metrics: recorder the timings and counters of the file are reported to, see
+        :func:~`record_file_metrics`
+    :type metrics: :class:~`protein_score_utilities.run_metrics.MetricsRecorder`
+    :return: number of publications found, of incomplete publications, of duplicated publications and of deleted
+        publications
+    :rtype: tuple
+    """
+    from lxml import etree
+
+    started = time.perf_counter()
+    own_writer = writer is None
+    if own_writer:
+        writer = create_publication_writer(db_conn, upsert=upsert, fields=fields)
+    if fields and not hasattr(writer, 'add_details'):
+        raise ValueError("Publication details can only be extracted with a writer for the details.")
+    duplicates_before = writer.rows_duplicated
+    seconds_inserting_before = writer.seconds_inserting
+    seconds_committing_before = writer.seconds_committing
+    codec = writer_codec(writer)
+    deleted_pmids = []
+    stats = {}
+    error = None
+
+    # add counters for summary stats
+    counter_publications = 0
+    counter_publications_incomplete = 0
+
+    print(f"Starting data extraction for file {file_path}")
+    try:
+        for publication in iterate_publications_from_xml(file_path, deleted_pmids, fields, stats):
+            counter_publications += 1
+            if publication._has_all_attributes():
+                writer.add(publication.to_record(codec))
+                if fields:
+                    writer.add_details([publication.pmid], publication.to_detail_rows())
+            else:
+                counter_publications_incomplete += 1
+    except (etree.XMLSyntaxError,) + READ_ERRORS as e:
+        error = describe_parse_error(file_path, e, stats)
+        print(error)
+    # publications found up to a syntax error or the end of a truncated file are kept
+    counter_publications_deleted = writer.delete('pmid', deleted_pmids)
+    if own_writer:
+        writer.close()
+
+    # todo: there are a number of duplicated PMIDs that would need to be further investigated
+    counter_publications_duplicated = writer.rows_duplicated - duplicates_before
+
+    # print summary statistics
+    print(f"Total number of publications found: {counter_publications}")
+    print(f"Total number of incomplete publications found: {counter_publications_incomplete}")
+    print(f"Total number of duplicated publications found: {counter_publications_duplicated}")
+    print(f"Total number of deleted publications: {counter_publications_deleted}")
+
+    counters = (counter_publications, counter_publications_incomplete, counter_publications_duplicated,
+                counter_publications_deleted)
+    if metrics is not None:
+        record_file_metrics(metrics, file_path, counters, stats, writer.seconds_inserting - seconds_inserting_before,
+                            writer.seconds_committing - seconds_committing_before, time.perf_counter() - started,
+                            error)
+    return counters
@@ -0,0 +1,370 @@
+"""
+Module that provides functionality to ingest a larger number of Pubmed XML files into the publication database. The
+files can either be processed one after the other or in parallel, where a number of worker processes parse the XML
+files and hand over the extracted publication records through bounded queues to a single writer (the calling process)
+that owns the database connection. SQLite only allows one writer at a time, so having only one process writing avoids
+lock contention, while the parsing of the XML, which takes by far the most time, is spread across multiple cores.
+
+Files are distributed to the workers in a round-robin fashion and the writer consumes the records strictly in the
+order of the file list, so that the content of the database after a parallel run is identical to the one of a serial
+run.
+
+Pubmed update files are supported by upserting publications, so that the version of a publication found in the file
+processed last is kept, and by deleting the publications listed in DeleteCitation elements after all publications of
+the file have been written.
+
+A file that turns out to be malformed or truncated does not stop the ingestion: the publications found up to the error
+are written and committed, the error is reported with its byte offset within the XML and the file is marked as failed
+in the manifest, so that it is processed again in the next run.
+
+Optionally, the ingested files are recorded in a manifest (see :mod:~`data_processing.ingestion_manifest`), so that
+files already ingested in a previous run are skipped.
+
+The progress of an ingestion can be followed through a
+:class:~`protein_score_utilities.run_metrics.MetricsRecorder`, which receives an event for every file with the time
+spent per stage (parse, extract, insert, commit), the publications per second, the bytes read and the counters, an
+event whenever the writer has been waiting for a worker for a while, and a summary at the end of the run.
+"""
+
+import queue
+import time
+
+from data_processing.extract_publication_data import check_detail_fields
+from data_processing.extract_publication_data import READ_ERRORS
+from data_processing.extract_publication_data import create_publication_writer
+from data_processing.extract_publication_data import describe_parse_error
+from data_processing.extract_publication_data import iterate_publications_from_xml
+from data_processing.extract_publication_data import record_file_metrics
+from data_processing.extract_publication_data import writer_codec
+from data_processing.ingestion_manifest import mark_file_completed
+from data_processing.ingestion_manifest import mark_file_started
+from data_processing.ingestion_manifest import select_files_to_ingest
+from protein_score_utilities.convenience_functions_database import DEFAULT_COMPRESSION_CODEC
+from protein_score_utilities.convenience_functions_database import DEFAULT_INSERT_BATCH_SIZE
+from protein_score_utilities.convenience_functions_database import DEFAULT_TRANSACTION_SIZE
+from protein_score_utilities.convenience_functions_files import DECOMPRESSORS
+from protein_score_utilities.convenience_functions_files import register_decompressor
+from protein_score_utilities.run_metrics import MetricsRecorder
+from protein_score_utilities.run_metrics import peak_rss_bytes
+
+# number of publication records that are sent together from a worker to the writer
+DEFAULT_RECORD_BATCH_SIZE = 1000
+# number of record batches each worker can have in flight before it waits for the writer
+DEFAULT_QUEUE_SIZE = 64
+# seconds the writer waits for a message before checking whether the worker is still alive
+_WORKER_POLL_TIMEOUT = 5
+
+
+def _iterate_file_messages(file_path: str, batch_size: int, codec: str = None, fields: tuple = ()):
+    """
+    Parses an XML file and yields the complete publication records found in batches. After the last batch, the PMIDs
+    of publications to be deleted are yielded, followed by a summary message with the number of publications found and
+    the number of incomplete publications, as well as an error message if the file could not be parsed completely
+    (in which case the publications found before the error are yielded nonetheless) and the stats of the parsing
+    (see :func:~`data_processing.extract_publication_data.iterate_publications_from_xml`) together with the peak memory
+    of the process.
+
+    :param file_path: path to XML file to be parsed
+    :type file_path: str
+    :param batch_size: number of publication records yielded together in one message
+    :type batch_size: int
+    :param codec: codec the abstracts are compressed with for the compact schema, None for the plain schema
+    :type codec: str
+    :param fields: names of the details in :data:~`data_processing.extract_publication_data.DETAIL_FIELDS` to be
+        extracted
+    :type fields: tuple
+    :return: generator of messages, either ('records', list of records, rows of the details by name of the detail),
+        ('deleted', list of PMIDs) or ('done', found, incomplete, error, stats)
+    :rtype: generator
+    """
+    from lxml import etree
+
+    counter_publications = 0
+    counter_publications_incomplete = 0
+    error = None
+    records = []
+    detail_rows = dict((field, []) for field in fields)
+    batch_pmids = set()
+    deleted_pmids = []
+    stats = {}
+    try:
+        for publication in iterate_publications_from_xml(file_path, deleted_pmids, fields, stats):
+            counter_publications += 1
+            if publication._has_all_attributes():
+                if fields and publication.pmid in batch_pmids:
+                    # every message holds a publication at most once, so that the writer can tell the details of its
+                    # versions apart
+                    yield 'records', records, detail_rows
+                    records = []
+                    detail_rows = dict((field, []) for field in fields)
+                    batch_pmids = set()
+                records.append(publication.to_record(codec))
+                batch_pmids.add(publication.pmid)
+                for field, rows in publication.to_detail_rows().items():
+                    detail_rows[field].extend(rows)
+                if len(records) >= batch_size:
+                    yield 'records', records, detail_rows
+                    records = []
+                    detail_rows = dict((field, []) for field in fields)
+                    batch_pmids = set()
+            else:
+                counter_publications_incomplete += 1
+    except (etree.XMLSyntaxError,) + READ_ERRORS as e:
+        error = describe_parse_error(file_path, e, stats)
+    except Exception as e:
+        error = f"Unexpected error while parsing file: {e!r}"
+
+    if records:
+        yield 'records', records, detail_rows
+    if deleted_pmids:
+        yield 'deleted', deleted_pmids
+    stats['peak_rss_bytes'] = peak_rss_bytes()
+    yield 'done', counter_publications, counter_publications_incomplete, error, stats
+
+
+def _parse_xml_files_worker(file_paths: list, out_queue, batch_size: int, codec: str = None, fields: tuple = (),
+                            decompressors: dict = None):
+    """
+    Worker function that parses the given XML files one after the other and puts the messages of
+    :func:~`_iterate_file_messages` onto the queue. The decompressors registered in the calling process are registered
+    again first, as workers started with spawn or forkserver do not inherit them.
+
+    :param file_paths: paths to XML files to be parsed by the worker, in the order they are consumed by the writer
+    :type file_paths: list
+    :param out_queue: bounded queue the worker sends its messages to
+    :type out_queue: :class:~`multiprocessing.Queue`
+    :param batch_size: number of publication records sent together in one message
+    :type batch_size: int
+    :param codec: codec the abstracts are compressed with for the compact schema, None for the plain schema
+    :type codec: str
+    :param fields: names of the details to be extracted
+    :type fields: tuple
+    :param decompressors: functions opening compressed files keyed by the file extension, as registered in the calling
+        process
+    :type decompressors: dict
+    """
+    for extension, opener in (decompressors or {}).items():
+        register_decompressor(extension, opener)
+    for file_path in file_paths:
+        for message in _iterate_file_messages(file_path, batch_size, codec, fields):
+            out_queue.put(message)
+
+
+def _iterate_worker_messages(worker_queue, worker, metrics=None):
+    """
+    Yields the messages a worker sends for one file, up to and including the summary message. Should the worker have
+    died without sending any further messages, an error is raised rather than waiting forever. Whenever no message has
+    arrived within the poll timeout, an event is emitted to the metrics, so that stalling workers can be spotted.
+
+    :param worker_queue: queue the worker sends its messages to
+    :type worker_queue: :class:~`multiprocessing.Queue`
+    :param worker: process of the worker
+    :type worker: :class:~`multiprocessing.Process`
+    :param metrics: recorder the waiting for the worker is reported to
+    :type metrics: :class:~`protein_score_utilities.run_metrics.MetricsRecorder`
+    :return: generator of messages sent by the worker for one file
+    :rtype: generator
+    """
+    wait_start = time.perf_counter()
+    while True:
+        try:
+            message = worker_queue.get(timeout=_WORKER_POLL_TIMEOUT)
+        except queue.Empty:
+            if not worker.is_alive() and worker_queue.empty():
+                raise RuntimeError(f"Worker process {worker.name} terminated unexpectedly "
+                                   f"(exit code {worker.exitcode})")
+            if metrics is not None:
+                metrics.count('worker_waits')
+                metrics.emit('worker_waiting', worker=worker.name,
+                             seconds_waited=round(time.perf_counter() - wait_start, 3))
+            continue
+        wait_start = time.perf_counter()
+        yield message
+        if message[0] == 'done':
+            return
+
+
+def _write_file_messages(file_path: str, messages, writer, signature=None, metrics=None):
+    """
+    Writes the publication records of one file to the database and commits them. If the file is recorded in the
+    manifest, its completion is committed together with the last records. The counters and timings of the file are
+    reported to the metrics, if provided.
+
+    :param file_path: path to the XML file the messages belong to
+    :type file_path: str
+    :param messages: messages for the file as generated by :func:~`_iterate_file_messages`
+    :type messages: iterable
+    :param writer: writer for the publications table
+    :type writer: :class:~`protein_score_utilities.convenience_functions_database.BulkInsertWriter`
+    :param signature: signature of the file if the manifest is used, otherwise None
+    :type signature: :class:~`data_processing.ingestion_manifest.FileSignature`
+    :param metrics: recorder the counters and timings of the file are reported to
+    :type metrics: :class:~`protein_score_utilities.run_metrics.MetricsRecorder`
+    :return: number of publications found, of incomplete publications, of duplicated publications and of deleted
+        publications
+    :rtype: tuple
+    """
+    print(f"Starting data extraction for file {file_path}")
+    started = time.perf_counter()
+    seconds_inserting_before = writer.seconds_inserting
+    seconds_committing_before = writer.seconds_committing
+    if signature is not None:
+        mark_file_started(writer.db_conn, signature)
+
+    duplicates_before = writer.rows_duplicated
+    counter_publications_deleted = 0
+    for message in messages:
+        if message[0] == 'records':
+            writer.add_many(message[1])
+            if message[2]:
+                writer.add_details([record[0] for record in message[1]], message[2])
+        elif message[0] == 'deleted':
+            counter_publications_deleted += writer.delete('pmid', message[1])
+        else:
+            _, counter_publications, counter_publications_incomplete, error, stats = message
+    writer.flush()
+    if signature is not None:
+        mark_file_completed(writer.db_conn, signature, counter_publications, failed=error is not None)
+    writer.commit()
+    counter_publications_duplicated = writer.rows_duplicated - duplicates_before
+
+    # print summary statistics
+    if error is not None:
+        print(error)
+    print(f"Total number of publications found: {counter_publications}")
+    print(f"Total number of incomplete publications found: {counter_publications_incomplete}")
+    print(f"Total number of duplicated publications found: {counter_publications_duplicated}")
+    print(f"Total number of deleted publications: {counter_publications_deleted}")
+
+    counters = (counter_publications, counter_publications_incomplete, counter_publications_duplicated,
+                counter_publications_deleted)
+    if metrics is not None:
+        record_file_metrics(metrics, file_path, counters, stats, writer.seconds_inserting - seconds_inserting_before,
+                            writer.seconds_committing - seconds_committing_before, time.perf_counter() - started,
+                            error)
+    return counters
+
+
+def ingest_xml_files(file_paths: list, db_conn, n_workers: int = 1, queue_size: int = DEFAULT_QUEUE_SIZE,
+                     batch_size: int = DEFAULT_RECORD_BATCH_SIZE, insert_batch_size: int = DEFAULT_INSERT_BATCH_SIZE,
+                     transaction_size: int = DEFAULT_TRANSACTION_SIZE, upsert: bool = False,
+                     use_manifest: bool = False, with_checksum: bool = False,
+                     codec: str = DEFAULT_COMPRESSION_CODEC, writer=None, fields: tuple = (), metrics=None,
+                     summary: bool = True):
+    """
+    Extracts the publication data from all the XML files provided and writes it in bulk to the database, committing at
+    the latest after each file. With one worker, the files are processed serially within the calling process. With more
+    than one worker, the files are parsed in worker processes while the calling process is the only one writing to the
+    database.
+
+    If the manifest is used, files that have been ingested completely in a previous run and have not changed since are
+    skipped. This requires the table ingestion_manifest to exist in the database.
+
+    Instead of the database, the publications can be written by another writer, e.g. directly to Parquet files by a
+    :class:~`data_processing.export_publication_data.PublicationParquetWriter`. The manifest can only be used with
+    writers to the database, as the files need to be recorded in the same transaction as their publications.
+
+    :param file_paths: paths to XML files from which publication data is to be extracted
+    :type file_paths: list
+    :param db_conn: connection to the database extracted publication information should be written to
+    :type db_conn: :class:~`sqlite3.Connection`
+    :param n_workers: number of worker processes parsing XML files
+    :type n_workers: int
+    :param queue_size: maximal number of record batches each worker can have waiting for the writer
+    :type queue_size: int
+    :param batch_size: number of publication records sent together from a worker to the writer
+    :type batch_size: int
+    :param insert_batch_size: number of publication records inserted with one executemany call
+    :type insert_batch_size: int
+    :param transaction_size: number of publication records after which the transaction is committed
+    :type transaction_size: int
+    :param upsert: whether publications with an already existing PMID should replace the stored publication, as needed
+        for Pubmed update files
+    :type upsert: bool
+    :param use_manifest: whether files already ingested should be skipped and ingested files recorded
+    :type use_manifest: bool
+    :param with_checksum: whether the manifest should compare files by the checksum of their content rather than by
+        size and modification time only
+    :type with_checksum: bool
+    :param codec: codec the abstracts are compressed with if the table publications uses the compact schema
+    :type codec: str
+    :param writer: writer the publications are written with instead of a writer for the table publications of db_conn,
+        the settings for writing to the database are ignored then and the writer is not closed
+    :type writer: :class:~`data_processing.export_publication_data.PublicationParquetWriter`
+    :param fields: names of the details in :data:~`data_processing.extract_publication_data.DETAIL_FIELDS` to be
+        extracted and written to their child tables, which need to exist in the database
+    :type fields: tuple
+    :param metrics: recorder an event is emitted to for every file and at the end of the run, see
+        :mod:~`protein_score_utilities.run_metrics`
+    :type metrics: :class:~`protein_score_utilities.run_metrics.MetricsRecorder`
+    :param summary: whether the summary of the run is emitted to the metrics at the end, False if the caller emits it
+        once further stages of the run have completed
+    :type summary: bool
+    :return: total number of publications found, of incomplete publications, of duplicated publications and of deleted
+        publications
+    :rtype: tuple
+    """
+    file_paths = [str(x) for x in file_paths]
+    if metrics is None:
+        metrics = MetricsRecorder()
+    started = time.perf_counter()
+    if use_manifest and writer is not None and writer.db_conn is None:
+        raise ValueError("The manifest can only be used when writing the publications to the database.")
+    if use_manifest:
+        signatures = select_files_to_ingest(db_conn, file_paths, with_checksum)
+        print(f"Skipping {len(file_paths) - len(signatures)} files that have been ingested before")
+        file_paths = [signature.file_path for signature in signatures]
+    else:
+        signatures = [None] * len(file_paths)
+
+    n_workers = max(1, min(n_workers, len(file_paths)))
+    fields = check_detail_fields(fields)
+    if writer is None:
+        writer = create_publication_writer(db_conn, upsert=upsert, codec=codec, fields=fields,
+                                           batch_size=insert_batch_size, transaction_size=transaction_size)
+    elif fields and not hasattr(writer, 'add_details'):
+        raise ValueError("Publication details can only be extracted with a writer for the details.")
+    # for the compact schema, the abstracts are compressed while parsing, i.e. in the worker processes
+    codec = writer_codec(writer)
+
+    workers = []
+    if n_workers == 1:
+        file_messages = (_iterate_file_messages(file_path, batch_size, codec, fields) for file_path in file_paths)
+    else:
+        import multiprocessing
+
+        # each worker gets its own bounded queue and every n-th file, so that the records can be consumed in the
+        # order of the file list
+        ctx = multiprocessing.get_context()
+        worker_queues = [ctx.Queue(maxsize=queue_size) for _ in range(n_workers)]
+        workers = [ctx.Process(target=_parse_xml_files_worker, name=f"xml-parser-{i}",
+                               args=(file_paths[i::n_workers], worker_queues[i], batch_size, codec, fields,
+                                     dict(DECOMPRESSORS)),
+                               daemon=True)
+                   for i in range(n_workers)]
+        for worker in workers:
+            worker.start()
+        file_messages = (_iterate_worker_messages(worker_queues[i % n_workers], workers[i % n_workers], metrics)
+                         for i in range(len(file_paths)))
+
+    totals = [0, 0, 0, 0]
+    completed = False
+    try:
+        for file_path, signature, messages in zip(file_paths, signatures, file_messages):
+            counters = _write_file_messages(file_path, messages, writer, signature, metrics)
+            totals = [total + counter for total, counter in zip(totals, counters)]
+        completed = True
+    finally:
+        for worker in workers:
+            if completed:
+                worker.join(timeout=_WORKER_POLL_TIMEOUT)
+            if worker.is_alive():
+                # workers still running at this point are blocked on a queue nobody is reading from anymore
+                worker.terminate()
+            worker.join()
+
+    seconds = time.perf_counter() - started
+    if summary:
+        metrics.emit_summary('run', n_workers=n_workers, seconds=round(seconds, 3),
+                             publications_per_second=round(totals[0] / seconds, 1) if seconds > 0 else None)
+    return tuple(totals)
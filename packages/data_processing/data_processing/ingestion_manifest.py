@@ -0,0 +1,146 @@
+"""
+Module that keeps track of which data files have been ingested into the publication database. For every file, a record
+is held in the table ingestion_manifest with the file name, size, modification time, optionally a checksum of the
+content, the number of articles found and whether the ingestion of the file was completed. This allows to only process
+files that are new or have changed since the last run, e.g. the daily update files provided by Pubmed, and to pick up
+files again whose ingestion was interrupted.
+
+Files are identified by their name only, so that the folder holding the raw data can be moved without all files being
+processed again.
+"""
+
+SQL_CREATE_MANIFEST_TABLE = "CREATE TABLE IF NOT EXISTS ingestion_manifest (file_name text PRIMARY KEY, " \
+                            "file_size integer NOT NULL, file_mtime real NOT NULL, checksum text, " \
+                            "article_count integer, status text NOT NULL, started_at text, completed_at text);"
+
+STATUS_STARTED = 'started'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+
+# size of the chunks in which files are read to compute their checksum
+_CHECKSUM_CHUNK_SIZE = 1 << 20
+
+
+class FileSignature:
+    """
+    Data capsule for holding the properties of a file that are used to decide whether it has changed.
+    """
+
+    def __init__(self, file_path, with_checksum: bool = False):
+        """
+        Reading size and modification time of the file and computing the checksum of its content if requested.
+
+        :param file_path: path to the file
+        :type file_path: str or Path
+        :param with_checksum: whether the MD5 checksum of the file content should be computed
+        :type with_checksum: bool
+        """
+        from pathlib import Path
+        path = Path(file_path)
+        stat = path.stat()
+        self.file_path = str(file_path)
+        self.file_name = path.name
+        self.file_size = stat.st_size
+        self.file_mtime = stat.st_mtime
+        self.checksum = _compute_checksum(path) if with_checksum else None
+
+    def matches(self, file_size: int, file_mtime: float, checksum: str):
+        """
+        Checks whether the signature matches the one recorded in the manifest. If checksums are available for both,
+        only the checksums are compared, so that e.g. a file downloaded again is not processed a second time.
+
+        :param file_size: file size recorded in the manifest
+        :type file_size: int
+        :param file_mtime: modification time recorded in the manifest
+        :type file_mtime: float
+        :param checksum: checksum recorded in the manifest, if any
+        :type checksum: str
+        :return: True if the file is considered unchanged, otherwise False
+        :rtype: bool
+        """
+        if self.checksum is not None and checksum is not None:
+            return self.checksum == checksum
+        return self.file_size == file_size and self.file_mtime == file_mtime
+
+
+def _compute_checksum(path):
+    """
+    Computes the MD5 checksum of the content of a file, reading it in chunks.
+
+    :param path: path to the file
+    :type path: Path
+    :return: hexadecimal MD5 checksum
+    :rtype: str
+    """
+    import hashlib
+    md5 = hashlib.md5()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(_CHECKSUM_CHUNK_SIZE), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def select_files_to_ingest(db_conn, file_paths: list, with_checksum: bool = False):
+    """
+    Determines which of the given files still need to be ingested, which are files that are not in the manifest yet,
+    that have changed since they were ingested or whose ingestion has not been completed.
+
+    :param db_conn: connection to the database holding the manifest table
+    :type db_conn: sqlite3.Connection
+    :param file_paths: paths to the files that are candidates for the ingestion
+    :type file_paths: list
+    :param with_checksum: whether files should be compared by the checksum of their content
+    :type with_checksum: bool
+    :return: signatures of the files to be ingested, in the order of the file paths provided
+    :rtype: list
+    """
+    manifest = {row[0]: row[1:] for row in db_conn.execute(
+        "SELECT file_name, file_size, file_mtime, checksum, status FROM ingestion_manifest")}
+
+    signatures = []
+    for file_path in file_paths:
+        signature = FileSignature(file_path, with_checksum)
+        entry = manifest.get(signature.file_name)
+        if entry is not None and entry[3] == STATUS_COMPLETED and signature.matches(*entry[:3]):
+            continue
+        signatures.append(signature)
+    return signatures
+
+
+def mark_file_started(db_conn, signature: FileSignature):
+    """
+    Records in the manifest that the ingestion of a file has started and commits this straight away, so that the file
+    is picked up again should the ingestion be interrupted.
+
+    :param db_conn: connection to the database holding the manifest table
+    :type db_conn: sqlite3.Connection
+    :param signature: signature of the file
+    :type signature: FileSignature
+    """
+    db_conn.execute("INSERT INTO ingestion_manifest(file_name,file_size,file_mtime,checksum,status,started_at) "
+                    "VALUES(?,?,?,?,?,datetime('now')) ON CONFLICT(file_name) DO UPDATE SET "
+                    "file_size=excluded.file_size, file_mtime=excluded.file_mtime, checksum=excluded.checksum, "
+                    "article_count=NULL, status=excluded.status, started_at=excluded.started_at, completed_at=NULL",
+                    (signature.file_name, signature.file_size, signature.file_mtime, signature.checksum,
+                     STATUS_STARTED))
+    db_conn.commit()
+
+
+def mark_file_completed(db_conn, signature: FileSignature, article_count: int, failed: bool = False):
+    """
+    Records in the manifest that the ingestion of a file has been completed. The change is not committed, so that it
+    can be committed together with the last publication records of the file. Files that could not be parsed entirely
+    are marked as failed and will be processed again in the next run.
+
+    :param db_conn: connection to the database holding the manifest table
+    :type db_conn: sqlite3.Connection
+    :param signature: signature of the file
+    :type signature: FileSignature
+    :param article_count: number of articles found in the file
+    :type article_count: int
+    :param failed: whether the file could only be parsed partially
+    :type failed: bool
+    """
+    db_conn.execute("UPDATE ingestion_manifest SET article_count=?, status=?, completed_at=datetime('now') "
+                    "WHERE file_name=?", (article_count, STATUS_FAILED if failed else STATUS_COMPLETED,
+                                          signature.file_name))
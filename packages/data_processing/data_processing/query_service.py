@@ -0,0 +1,426 @@
+"""
+Module that provides a lightweight HTTP service answering search and ranking queries over the publication database,
+so that consumers do not each have to open the SQLite file, load the co-occurrence matrices or compile a lexicon
+themselves. The service is built on asyncio streams of the standard library: a single event loop accepts the requests,
+while the queries are run on a pool of read-only connections in executor threads, one query per connection at a time.
+SQLite releases the GIL while it executes a statement, so that lookups of many clients proceed concurrently, and the
+database can be written by an ingestion at the same time (with write-ahead logging, see the profile 'read_mostly' of
+:func:~`protein_score_utilities.convenience_functions_database.create_database_connection`).
+
+All endpoints answer GET requests with JSON:
+
+* /health returns the status, the content version of the database and the number of requests served,
+* /search?q=<term>[&q=<term>...][&limit=20][&match_all=true] returns the publications ranked by relevance, see
+  :func:~`protein_score_utilities.publication_search.search_publications`,
+* /publications/<pmid> returns a single publication,
+* /rankings?disease=<term>[&k=20][&method=pmi][&source=search] returns the top-k proteins for a disease term, cached
+  by a :class:~`protein_score_utilities.protein_rankings.ProteinRankingCache`,
+* /annotate?text=<text> returns the proteins mentioned in a text, if the service was started with an annotator.
+
+Lists of publications are sent in batches with chunked transfer encoding. The results of a search are read and encoded
+as JSON before the first batch is sent, so that the pooled connection is returned before writing to the client and
+slow clients cannot take up the pool; a search without limit therefore holds its encoded results in memory (about
+100 bytes per publication) until they have been sent. Connections are kept alive between requests (HTTP/1.1), which
+saves clients establishing a connection for every lookup. Errors raised by an endpoint are logged and answered with
+the status 500.
+
+The statements of the endpoints are run once on every connection when the service is started, so that they are
+prepared and held in the statement cache of the connection, the pages of the full-text index are read into the page
+cache and the co-occurrence matrices are loaded before the first request arrives.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from urllib.parse import unquote
+from urllib.parse import urlsplit
+
+from protein_score_utilities.convenience_functions_database import create_database_connection
+from protein_score_utilities.convenience_functions_database import get_publication
+from protein_score_utilities.protein_rankings import ProteinRankingCache
+from protein_score_utilities.protein_rankings import database_content_version
+from protein_score_utilities.publication_search import has_publication_search_index
+from protein_score_utilities.publication_search import search_publications_cursor
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+# number of read-only connections, and of threads running queries on them
+DEFAULT_CONNECTIONS = 4
+# number of publications read from the database and sent to the client in one chunk
+DEFAULT_STREAM_BATCH_SIZE = 500
+# number of results returned by searches and rankings if the client does not ask for a number
+DEFAULT_LIMIT = 20
+# seconds an idle keep-alive connection is held open
+_KEEP_ALIVE_TIMEOUT = 15
+# number of header lines accepted per request
+_MAX_HEADERS = 100
+
+_logger = logging.getLogger(__name__)
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    """
+    Error answered with the given HTTP status and message as JSON.
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _query_value(query: dict, name: str, default=None, convert=str):
+    """
+    Returns a parameter of the query string converted to the given type, raising an HTTPError for invalid values.
+    """
+    values = query.get(name)
+    if not values:
+        if default is None:
+            raise HTTPError(400, f"Parameter '{name}' is required.")
+        return default
+    try:
+        return convert(values[-1])
+    except ValueError:
+        raise HTTPError(400, f"Invalid value '{values[-1]}' of parameter '{name}'.")
+
+
+def _parse_bool(value: str):
+    """
+    Converts a boolean parameter of the query string.
+    """
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(value)
+
+
+def _parse_limit(value: str):
+    """
+    Converts the limit of a search, where 'all' returns all publications found.
+    """
+    if value.lower() == 'all':
+        return None
+    limit = int(value)
+    if limit < 1:
+        raise ValueError(value)
+    return limit
+
+
+def _parse_count(value: str):
+    """
+    Converts a positive number of results.
+    """
+    count = int(value)
+    if count < 1:
+        raise ValueError(value)
+    return count
+
+
+class QueryService:
+    """
+    HTTP service answering queries over the publication database, see the module description for the endpoints.
+    """
+
+    def __init__(self, db_file, n_connections: int = DEFAULT_CONNECTIONS, ranking_cache: ProteinRankingCache = None,
+                 annotator=None, stream_batch_size: int = DEFAULT_STREAM_BATCH_SIZE):
+        """
+        Setting up the service, without opening any connection yet.
+
+        :param db_file: path to the publication database, which needs to exist
+        :type db_file: str or Path
+        :param n_connections: number of read-only connections queries are run on concurrently
+        :type n_connections: int
+        :param ranking_cache: cache the rankings are taken from, an in-process cache is used if None
+        :type ranking_cache: :class:~`protein_score_utilities.protein_rankings.ProteinRankingCache`
+        :param annotator: annotator with a compiled lexicon for the endpoint /annotate, which is not offered if None
+        :type annotator: :class:~`data_processing.annotate_text_data.LexiconAnnotator`
+        :param stream_batch_size: number of publications read from the database and sent to the client in one chunk
+        :type stream_batch_size: int
+        """
+        self.db_file = db_file
+        self.n_connections = n_connections
+        self.ranking_cache = ranking_cache if ranking_cache is not None else ProteinRankingCache()
+        self.annotator = annotator
+        self.stream_batch_size = stream_batch_size
+        self.requests_served = 0
+        self._connections = None
+        self._all_connections = []
+        self._executor = None
+        self._server = None
+        self._client_writers = set()
+        self._routes = {
+            '/health': self._health,
+            '/search': self._search,
+            '/rankings': self._rankings,
+            '/annotate': self._annotate,
+        }
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        """
+        Opens the connections, warms them up and starts listening for requests.
+
+        :param host: address the service listens on
+        :type host: str
+        :param port: port the service listens on, 0 to pick a free port
+        :type port: int
+        :return: address and port the service listens on
+        :rtype: tuple
+        """
+        loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.n_connections, thread_name_prefix='query')
+        self._connections = asyncio.Queue()
+        for _ in range(self.n_connections):
+            db_conn = await loop.run_in_executor(self._executor, self._open_connection)
+            self._all_connections.append(db_conn)
+            self._connections.put_nowait(db_conn)
+        self._server = await asyncio.start_server(self._handle_client, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    def _open_connection(self):
+        """
+        Opens a read-only connection and runs the statements of the endpoints once, so that they are prepared and the
+        pages they need are cached.
+        """
+        db_conn = create_database_connection(self.db_file, profile='read_mostly', read_only=True,
+                                             check_same_thread=False)
+        database_content_version(db_conn)
+        get_publication(db_conn, 0)
+        if has_publication_search_index(db_conn):
+            search_publications_cursor(db_conn, "warm up", limit=1).fetchall()
+        tables = set(row[0] for row in db_conn.execute("SELECT name FROM sqlite_master WHERE type='table'"))
+        if 'annotations' in tables:
+            self.ranking_cache.warm_up(db_conn)
+        return db_conn
+
+    async def serve_forever(self):
+        """
+        Answers requests until the service is closed or the task is cancelled.
+        """
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        """
+        Stops listening for requests and closes the connections.
+        """
+        if self._server is not None:
+            self._server.close()
+            # clients idling on a kept-alive connection would otherwise hold up the shutdown
+            for writer in list(self._client_writers):
+                writer.close()
+            await self._server.wait_closed()
+        for db_conn in self._all_connections:
+            db_conn.close()
+        self._all_connections = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def _run_query(self, function, *args):
+        """
+        Runs a function taking a connection as first argument on one of the pooled connections in an executor thread,
+        waiting for a connection to become available if all of them are in use.
+        """
+        db_conn = await self._connections.get()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, db_conn, *args)
+        finally:
+            self._connections.put_nowait(db_conn)
+
+    async def _handle_client(self, reader, writer):
+        """
+        Answers the requests of a client connection one after the other until the client closes the connection, asks
+        for it to be closed or stays idle for too long.
+        """
+        self._client_writers.add(writer)
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), _KEEP_ALIVE_TIMEOUT)
+                if not request_line.strip():
+                    break
+                headers = {}
+                for _ in range(_MAX_HEADERS):
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                parts = request_line.decode('latin-1').split()
+                keep_alive = len(parts) == 3 and parts[2] == 'HTTP/1.1' and \
+                    headers.get('connection', '').lower() != 'close'
+                # requests are not expected to have a body, which would otherwise be taken as the next request
+                if headers.get('content-length', '0') not in ('', '0') or 'transfer-encoding' in headers:
+                    keep_alive = False
+                await self._answer(parts, writer, keep_alive)
+                self.requests_served += 1
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._client_writers.discard(writer)
+            writer.close()
+
+    async def _answer(self, parts: list, writer, keep_alive: bool):
+        """
+        Dispatches a request to the handler of its endpoint and writes errors as JSON.
+        """
+        try:
+            if len(parts) != 3:
+                raise HTTPError(400, "Malformed request line.")
+            if parts[0] != 'GET':
+                raise HTTPError(405, f"Method {parts[0]} is not supported, only GET.")
+            url = urlsplit(parts[1])
+            path = unquote(url.path).rstrip('/') or '/'
+            query = parse_qs(url.query)
+            if path.startswith('/publications/'):
+                await self._publication(writer, keep_alive, path[len('/publications/'):])
+                return
+            handler = self._routes.get(path)
+            if handler is None:
+                raise HTTPError(404, f"Unknown endpoint {path}.")
+            await handler(writer, keep_alive, query)
+        except HTTPError as e:
+            await self._send_json(writer, e.status, {'error': e.message}, keep_alive)
+        except sqlite3.Error as e:
+            await self._send_json(writer, 500, {'error': f"Database error: {e}"}, keep_alive)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            _logger.exception("Request %s failed", ' '.join(parts))
+            await self._send_json(writer, 500, {'error': f"Internal error: {e!r}"}, keep_alive)
+
+    async def _health(self, writer, keep_alive: bool, query: dict):
+        content_version = await self._run_query(database_content_version)
+        await self._send_json(writer, 200, {'status': 'ok', 'content_version': content_version,
+                                            'connections': self.n_connections,
+                                            'requests_served': self.requests_served}, keep_alive)
+
+    async def _publication(self, writer, keep_alive: bool, pmid: str):
+        try:
+            pmid = int(pmid)
+        except ValueError:
+            raise HTTPError(400, f"Invalid PMID '{pmid}'.")
+        row = await self._run_query(get_publication, pmid)
+        if row is None:
+            raise HTTPError(404, f"Publication {pmid} not found.")
+        publication = dict(zip(('pmid', 'abstract', 'title', 'journal', 'pub_year'), row))
+        await self._send_json(writer, 200, publication, keep_alive)
+
+    async def _search(self, writer, keep_alive: bool, query: dict):
+        terms = query.get('q')
+        if not terms:
+            raise HTTPError(400, "Parameter 'q' is required.")
+        limit = _query_value(query, 'limit', DEFAULT_LIMIT, _parse_limit)
+        match_all = _query_value(query, 'match_all', False, _parse_bool)
+        try:
+            chunks = await self._run_query(self._read_search_results, terms, limit, match_all)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        self._start_response(writer, 200, keep_alive, chunked=True)
+        for chunk in chunks:
+            await self._write_chunk(writer, chunk)
+        await self._write_chunk(writer, b'')
+
+    def _read_search_results(self, db_conn, terms: list, limit: int, match_all: bool):
+        """
+        Reads the results of a search in batches and returns them encoded as chunks of a JSON list.
+        """
+        chunks = []
+        cursor = search_publications_cursor(db_conn, terms, limit, match_all)
+        try:
+            separator = b'['
+            while True:
+                rows = cursor.fetchmany(self.stream_batch_size)
+                if not rows:
+                    break
+                results = (json.dumps({'pmid': pmid, 'title': title, 'score': score}) for pmid, title, score in rows)
+                chunks.append(separator + ','.join(results).encode('UTF-8'))
+                separator = b','
+        finally:
+            # an unfinished statement would keep the snapshot of the database it reads from
+            cursor.close()
+        chunks.append(b'[]' if separator == b'[' else b']')
+        return chunks
+
+    async def _rankings(self, writer, keep_alive: bool, query: dict):
+        disease_term = _query_value(query, 'disease')
+        k = _query_value(query, 'k', DEFAULT_LIMIT, _parse_count)
+        method = _query_value(query, 'method', 'pmi')
+        source = _query_value(query, 'source', 'search')
+        try:
+            rankings = await self._run_query(self.ranking_cache.top_proteins, disease_term, k, method, source)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        await self._send_json(writer, 200, {'disease': disease_term, 'method': method, 'source': source,
+                                            'proteins': [{'protein_id': protein_id, 'score': score}
+                                                         for protein_id, score in rankings]}, keep_alive)
+
+    async def _annotate(self, writer, keep_alive: bool, query: dict):
+        if self.annotator is None:
+            raise HTTPError(404, "The service has been started without a lexicon.")
+        text = _query_value(query, 'text')
+        mentions = await asyncio.get_running_loop().run_in_executor(self._executor, self.annotator.find_mentions, text)
+        await self._send_json(writer, 200, {'mentions': [
+            {'start': start, 'end': end, 'text': text[start:end], 'entity_ids': sorted(entity_ids)}
+            for start, end, entity_ids in mentions]}, keep_alive)
+
+    @staticmethod
+    def _start_response(writer, status: int, keep_alive: bool, content_length: int = None,
+                        chunked: bool = False):
+        """
+        Writes the status line and the headers of a JSON response.
+        """
+        headers = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", "Content-Type: application/json",
+                   f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if chunked:
+            headers.append("Transfer-Encoding: chunked")
+        else:
+            headers.append(f"Content-Length: {content_length}")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode('latin-1'))
+
+    @staticmethod
+    async def _write_chunk(writer, data: bytes):
+        """
+        Writes a chunk of a response with chunked transfer encoding, where an empty chunk ends the response, and waits
+        until the client has taken up the data if the buffer is full.
+        """
+        writer.write(f"{len(data):X}\r\n".encode('latin-1') + data + b"\r\n")
+        await writer.drain()
+
+    async def _send_json(self, writer, status: int, content, keep_alive: bool):
+        """
+        Writes a complete JSON response.
+        """
+        body = json.dumps(content).encode('UTF-8')
+        self._start_response(writer, status, keep_alive, content_length=len(body))
+        writer.write(body)
+        await writer.drain()
+
+
+async def run_query_service(db_file, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, **kwargs):
+    """
+    Starts a :class:~`QueryService` and answers requests until the task is cancelled, e.g. by pressing Ctrl+C when
+    run through asyncio.run.
+
+    :param db_file: path to the publication database
+    :type db_file: str or Path
+    :param host: address the service listens on
+    :type host: str
+    :param port: port the service listens on
+    :type port: int
+    :param kwargs: further settings of :class:~`QueryService`
+    """
+    service = QueryService(db_file, **kwargs)
+    bound_host, bound_port = await service.start(host, port)
+    print(f"Serving queries over {db_file} on http://{bound_host}:{bound_port}")
+    try:
+        await service.serve_forever()
+    finally:
+        await service.close()
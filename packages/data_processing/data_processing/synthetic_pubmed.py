@@ -0,0 +1,162 @@
+"""
+Module that generates synthetic Pubmed XML files following the structure of the Pubmed baseline and update files, so
+that the extraction and ingestion can be tested and benchmarked offline without downloading any data. The files are
+deterministic: the same settings and seed always result in the same content, byte for byte also for gzip compressed
+files, so that measurements taken at different times can be compared.
+
+Besides the number of articles and the length of the abstracts, the share of articles repeating the PMID of an earlier
+article (as revised versions in update files do) and the share of articles lacking one of the fields required for the
+table publications can be configured. :func:~`write_synthetic_pubmed_xml` returns the counters an ingestion of the
+file into an empty database is expected to report, so that a run over generated data can be checked for correctness.
+"""
+
+import gzip
+import io
+import random
+from contextlib import contextmanager
+from pathlib import Path
+
+_WORDS = ("protein", "kinase", "receptor", "expression", "cell", "tumour", "signalling", "pathway", "patients",
+          "increased", "inhibition", "the", "of", "and", "in", "with", "was", "were", "disease", "binding")
+# words occurring in a small share of the abstracts, e.g. with characters outside of ASCII
+_RARE_WORDS = ("α-synuclein", "β-catenin", "TNF-α", "IL-1β", "µM", "Alzheimer's", "p53", "HER2/neu", "5'-UTR")
+_LABELS = ("BACKGROUND", "METHODS", "RESULTS", "CONCLUSIONS")
+# fields of the table publications of which one is left out of the incomplete articles
+MISSING_FIELDS = ('abstract', 'title', 'journal', 'year')
+
+
+def _abstract_xml(rnd: random.Random, n_words: int, structured: bool):
+    """
+    Returns the Abstract element of an article, either as one text or as sections labelled like structured abstracts,
+    with inline markup and rare words in some of the abstracts.
+    """
+    words = rnd.choices(_WORDS, k=n_words)
+    if rnd.random() < 0.1:
+        words[rnd.randrange(n_words)] = rnd.choice(_RARE_WORDS)
+    if rnd.random() < 0.1:
+        position = rnd.randrange(n_words)
+        words[position] = f"<i>{words[position]}</i>"
+    if not structured:
+        return f'<Abstract><AbstractText>{" ".join(words)}</AbstractText></Abstract>'
+    step = -(-n_words // len(_LABELS))
+    return "<Abstract>" + "".join(f'<AbstractText Label="{label}" NlmCategory="{label}">'
+                                  f'{" ".join(words[i * step:(i + 1) * step])}</AbstractText>'
+                                  for i, label in enumerate(_LABELS)) + "</Abstract>"
+
+
+@contextmanager
+def _open_output(file_path: Path):
+    """
+    Opens the file the XML is written to as text stream, gzip compressed if the file name ends in .gz. The time stamp
+    within the gzip header is left out, so that the compressed file is deterministic as well.
+    """
+    if file_path.suffix != '.gz':
+        with open(file_path, 'w', encoding='UTF-8') as file:
+            yield file
+        return
+    with open(file_path, 'wb') as raw, \
+            gzip.GzipFile(filename='', mode='wb', fileobj=raw, compresslevel=6, mtime=0) as compressed, \
+            io.TextIOWrapper(compressed, encoding='UTF-8') as file:
+        yield file
+
+
+def write_synthetic_pubmed_xml(file_path, n_articles: int, abstract_words: int = 200, seed: int = 42,
+                               n_items: int = 1, n_references: int = 0, duplicate_rate: float = 0.0,
+                               missing_rate: float = 0.0, first_pmid: int = 1, deleted_pmids: tuple = (),
+                               complete_pmids: set = None):
+    """
+    Writes a Pubmed XML file with the given number of articles, following the structure of the Pubmed baseline files.
+    Files whose name ends in .gz are gzip compressed. The articles are numbered consecutively from the first PMID,
+    apart from the duplicated articles, which repeat the PMID of an earlier article of the file with another title.
+
+    :param file_path: path the XML file is written to
+    :type file_path: str or Path
+    :param n_articles: number of articles in the file
+    :type n_articles: int
+    :param abstract_words: average number of words of the abstracts, where the length of each abstract varies around it
+    :type abstract_words: int
+    :param seed: seed for the random number generator, so that the same file is generated every time
+    :type seed: int
+    :param n_items: number of authors and MeSH headings of each article, of which half the number of keywords and
+        chemicals are added; with more than one item, the abstracts are structured into labelled sections and the
+        authors have affiliations
+    :type n_items: int
+    :param n_references: number of references of each article
+    :type n_references: int
+    :param duplicate_rate: share of the articles repeating the PMID of an earlier article
+    :type duplicate_rate: float
+    :param missing_rate: share of the articles lacking one of abstract, title, journal and year
+    :type missing_rate: float
+    :param first_pmid: PMID of the first article
+    :type first_pmid: int
+    :param deleted_pmids: PMIDs listed in a DeleteCitation element at the end of the file
+    :type deleted_pmids: tuple
+    :param complete_pmids: set the PMIDs of the articles with all fields required are added to, if provided
+    :type complete_pmids: set
+    :return: number of publications, of incomplete publications, of duplicated publications and of deleted
+        publications an ingestion of the file into an empty database reports
+    :rtype: tuple
+    """
+    rnd = random.Random(seed)
+    pmids = []
+    stored_pmids = set()
+    counter_incomplete = 0
+    counter_duplicated = 0
+    with _open_output(Path(file_path)) as file:
+        file.write('<?xml version="1.0" encoding="utf-8"?>\n<PubmedArticleSet>\n')
+        for i in range(n_articles):
+            if pmids and rnd.random() < duplicate_rate:
+                pmid = rnd.choice(pmids)
+            else:
+                pmid = first_pmid + len(pmids)
+                pmids.append(pmid)
+            missing = rnd.choice(MISSING_FIELDS) if rnd.random() < missing_rate else None
+            if missing is not None:
+                counter_incomplete += 1
+            elif pmid in stored_pmids:
+                counter_duplicated += 1
+            else:
+                stored_pmids.add(pmid)
+
+            n_words = max(10, int(rnd.gauss(abstract_words, abstract_words / 4)))
+            abstract = "" if missing == 'abstract' else _abstract_xml(rnd, n_words, n_items > 1)
+            title = " ".join(rnd.choices(_WORDS, k=12))
+            article_title = "" if missing == 'title' else f'<ArticleTitle>{title} ({i})</ArticleTitle>'
+            journal_title = "" if missing == 'journal' else f'<Title>Journal {pmid % 500}</Title>'
+            year = "" if missing == 'year' else f'<Year>{1980 + pmid % 40}</Year>'
+            affiliation = '<AffiliationInfo><Affiliation>Department of Biochemistry, University, City, Country.' \
+                          '</Affiliation></AffiliationInfo>' if n_items > 1 else ''
+            authors = "".join(f'<Author ValidYN="Y"><LastName>Doe{j}</LastName><ForeName>Jane</ForeName>'
+                              f'<Initials>J</Initials>{affiliation}</Author>' for j in range(n_items))
+            mesh_terms = "".join(f'<MeshHeading><DescriptorName UI="D{j:06d}" MajorTopicYN="N">Proteins {j}'
+                                 f'</DescriptorName><QualifierName UI="Q000378" MajorTopicYN="Y">metabolism'
+                                 f'</QualifierName></MeshHeading>' for j in range(n_items))
+            chemicals = "".join(f'<Chemical><RegistryNumber>{j}-00-0</RegistryNumber>'
+                                f'<NameOfSubstance UI="D{j:06d}">Substance {j}</NameOfSubstance></Chemical>'
+                                for j in range(n_items // 2))
+            keywords = "".join(f'<Keyword MajorTopicYN="N">{rnd.choice(_WORDS)}</Keyword>' for _ in range(n_items // 2))
+            references = "".join(f'<Reference><Citation>Doe J. {title[:40]}. Journal {j}. 2019;{j}:1-10.</Citation>'
+                                 f'<ArticleIdList><ArticleId IdType="pubmed">{pmid + j}</ArticleId></ArticleIdList>'
+                                 f'</Reference>' for j in range(n_references))
+            file.write(f'<PubmedArticle><MedlineCitation Status="MEDLINE" Owner="NLM">'
+                       f'<PMID Version="1">{pmid}</PMID>'
+                       f'<DateCompleted><Year>2020</Year><Month>01</Month><Day>01</Day></DateCompleted>'
+                       f'<Article PubModel="Print"><Journal><ISSN IssnType="Print">0000-0000</ISSN>'
+                       f'<JournalIssue CitedMedium="Print"><Volume>{pmid % 40}</Volume>'
+                       f'<PubDate>{year}<Month>Jan</Month></PubDate></JournalIssue>'
+                       f'{journal_title}</Journal>'
+                       f'{article_title}{abstract}'
+                       f'<AuthorList CompleteYN="Y">{authors}</AuthorList></Article>'
+                       f'<ChemicalList>{chemicals}</ChemicalList>'
+                       f'<MeshHeadingList>{mesh_terms}</MeshHeadingList>'
+                       f'<KeywordList Owner="NOTNLM">{keywords}</KeywordList></MedlineCitation>'
+                       f'<PubmedData><ArticleIdList><ArticleId IdType="pubmed">{pmid}</ArticleId>'
+                       f'<ArticleId IdType="doi">10.1000/{pmid}</ArticleId></ArticleIdList>'
+                       f'<ReferenceList>{references}</ReferenceList></PubmedData></PubmedArticle>\n')
+        if deleted_pmids:
+            pmid_elements = "".join(f'<PMID Version="1">{pmid}</PMID>' for pmid in deleted_pmids)
+            file.write(f'<DeleteCitation>{pmid_elements}</DeleteCitation>\n')
+        file.write('</PubmedArticleSet>\n')
+    if complete_pmids is not None:
+        complete_pmids.update(stored_pmids)
+    return n_articles, counter_incomplete, counter_duplicated, len(stored_pmids.intersection(deleted_pmids))
@@ -0,0 +1,116 @@
+import sqlite3
+import tempfile
+
+from unittest import TestCase
+from pathlib import Path
+
+from data_processing.annotate_text_data import LexiconAnnotator
+from data_processing.annotate_text_data import SQL_CREATE_ANNOTATIONS_TABLE
+from data_processing.annotate_text_data import annotate_publications
+from data_processing.annotate_text_data import read_lexicon
+from data_processing.annotation_pipeline import get_annotation_watermark
+from data_processing.extract_publication_data import SQL_CREATE_PUBLICATIONS_TABLE
+
+LEXICON = {
+    "TNF": {"P01375"},
+    "tumor necrosis factor": {"P01375"},
+    "necrosis factor receptor": {"P19438"},
+    "IL-6": {"P05231"},
+    "interleukin 6": {"P05231"},
+    "p53": {"P04637"},
+    "A": {"P00000"},
+}
+
+
+class TestLexiconAnnotator(TestCase):
+    """
+    All tests relating to class :class:~`data_processing.annotate_text_data.LexiconAnnotator` in the data_processing
+    package.
+    """
+    def setUp(self) -> None:
+        self.annotator = LexiconAnnotator(LEXICON)
+
+    def test_find_mentions_case_insensitive(self):
+        """
+        Checks whether synonyms are found regardless of their case with the correct offsets.
+        """
+        text = "Levels of Interleukin 6 and tnf were increased."
+        self.assertEqual([(10, 23, ("P05231",)), (28, 31, ("P01375",))], self.annotator.find_mentions(text))
+
+    def test_find_mentions_word_boundaries(self):
+        """
+        Checks whether synonyms within words are not reported.
+        """
+        self.assertEqual([], self.annotator.find_mentions("TNFa and IL-65 and sp53"))
+        self.assertEqual([(1, 4, ("P01375",))], self.annotator.find_mentions("(TNF)"))
+
+    def test_find_mentions_longest_only(self):
+        """
+        Checks whether only the longest of overlapping mentions is kept, unless all mentions are requested.
+        """
+        text = "Tumor necrosis factor receptor"
+        self.assertEqual([(6, 30, ("P19438",))], self.annotator.find_mentions(text))
+        all_mentions = LexiconAnnotator(LEXICON, longest_only=False).find_mentions(text)
+        self.assertEqual([(0, 21, ("P01375",)), (6, 30, ("P19438",))], sorted(all_mentions))
+
+    def test_find_mentions_short_synonyms_ignored(self):
+        """
+        Checks whether synonyms shorter than the minimal length are ignored.
+        """
+        self.assertEqual([], self.annotator.find_mentions("A protein"))
+
+    def test_find_mentions_empty_text(self):
+        """
+        Checks whether empty texts can be passed safely.
+        """
+        self.assertEqual([], self.annotator.find_mentions(""))
+        self.assertEqual([], self.annotator.find_mentions(None))
+
+
+class TestAnnotatePublications(TestCase):
+    """
+    All tests relating to :func:~`data_processing.annotate_text_data.annotate_publications` and
+    :func:~`data_processing.annotate_text_data.read_lexicon` in the data_processing package.
+    """
+    def setUp(self) -> None:
+        """
+        Creating a lexicon file and a database holding a few publications in a temporary folder.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.lexicon_file = Path(self.tmp_dir.name) / "lexicon.tsv"
+        self.lexicon_file.write_text("id\tsynonym\n" + "".join(f"{entity_id}\t{synonym}\n"
+                                                               for synonym, entity_ids in LEXICON.items()
+                                                               for entity_id in entity_ids), encoding="UTF-8")
+        self.test_db_conn = sqlite3.connect(Path(self.tmp_dir.name) / "annotations.db")
+        self.test_db_conn.execute(SQL_CREATE_PUBLICATIONS_TABLE)
+        self.test_db_conn.execute(SQL_CREATE_ANNOTATIONS_TABLE)
+        self.test_db_conn.executemany("INSERT INTO publications VALUES (?,?,?,?,?)", [
+            (pmid, f"Abstract {pmid} on p53 and IL-6.", "journal", "TNF" if pmid % 2 else "Other", "2020")
+            for pmid in range(1, 11)
+        ])
+
+    def test_read_lexicon(self):
+        """
+        Checks whether the lexicon is read with the header skipped.
+        """
+        self.assertEqual(LEXICON, read_lexicon(self.lexicon_file, has_header=True))
+
+    def test_annotate_publications(self):
+        """
+        Checks whether all publications are annotated across chunks and a second run replaces the annotations.
+        """
+        annotator = LexiconAnnotator(read_lexicon(self.lexicon_file, has_header=True))
+        for _ in range(2):
+            self.assertEqual((10, 25), annotate_publications(self.test_db_conn, annotator, chunk_size=3))
+        self.assertEqual((3, "P01375", "protein", "title", 0, 3, "TNF"), self.test_db_conn.execute(
+            "SELECT * FROM annotations WHERE pmid=3 AND section='title'").fetchone())
+        self.assertEqual(25, self.test_db_conn.execute("SELECT COUNT(*) FROM annotations").fetchone()[0])
+        # the progress is recorded as by the parallel annotation, so that later runs resume after the watermark
+        self.assertEqual(10, get_annotation_watermark(self.test_db_conn))
+
+    def tearDown(self) -> None:
+        """
+        Disconnecting from database and removing the temporary folder.
+        """
+        self.test_db_conn.close()
+        self.tmp_dir.cleanup()
@@ -0,0 +1,128 @@
+import sqlite3
+import tempfile
+
+from unittest import TestCase
+from pathlib import Path
+
+from data_processing.annotate_text_data import LexiconAnnotator
+from data_processing.annotate_text_data import SQL_CREATE_ANNOTATIONS_TABLE
+from data_processing.annotation_pipeline import SQL_CREATE_ANNOTATION_PROGRESS_TABLE
+from data_processing.annotation_pipeline import annotate_publications_parallel
+from data_processing.annotation_pipeline import get_annotation_watermark
+from data_processing.extract_publication_data import SQL_CREATE_PUBLICATIONS_TABLE
+
+LEXICON = {
+    "TNF": {"P01375"},
+    "IL-6": {"P05231"},
+    "p53": {"P04637"},
+}
+
+
+class TestAnnotatePublicationsParallel(TestCase):
+    """
+    All tests relating to :func:~`data_processing.annotation_pipeline.annotate_publications_parallel` in the
+    data_processing package.
+    """
+    def setUp(self) -> None:
+        """
+        Creating a database holding a few publications in a temporary folder.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.test_db_conn = sqlite3.connect(Path(self.tmp_dir.name) / "annotations.db")
+        self.test_db_conn.execute(SQL_CREATE_PUBLICATIONS_TABLE)
+        self.test_db_conn.execute(SQL_CREATE_ANNOTATIONS_TABLE)
+        self.test_db_conn.execute(SQL_CREATE_ANNOTATION_PROGRESS_TABLE)
+        self.add_publications(range(1, 51))
+        self.annotator = LexiconAnnotator(LEXICON)
+
+    def add_publications(self, pmids):
+        self.test_db_conn.executemany("INSERT INTO publications VALUES (?,?,?,?,?)", [
+            (pmid, f"Abstract {pmid} on p53 and IL-6.", "journal", "TNF" if pmid % 2 else "Other", "2020")
+            for pmid in pmids
+        ])
+        self.test_db_conn.commit()
+
+    def select_annotations(self):
+        return self.test_db_conn.execute("SELECT * FROM annotations ORDER BY pmid, section, start_offset").fetchall()
+
+    def test_parallel_equals_serial(self):
+        """
+        Checks whether annotating with several workers leads to the same annotations as annotating serially.
+        """
+        self.assertEqual((50, 125), annotate_publications_parallel(self.test_db_conn, self.annotator, n_workers=1,
+                                                                   chunk_size=7))
+        serial_annotations = self.select_annotations()
+        self.assertEqual((50, 125), annotate_publications_parallel(self.test_db_conn, self.annotator, n_workers=2,
+                                                                   chunk_size=7, restart=True, chunks_in_flight=1))
+        self.assertEqual(serial_annotations, self.select_annotations())
+        self.assertEqual(50, get_annotation_watermark(self.test_db_conn))
+
+    def test_resume_after_watermark(self):
+        """
+        Checks whether only publications beyond the watermark are annotated, replacing annotations left over from an
+        interrupted run, and whether a restart annotates all publications again.
+        """
+        annotate_publications_parallel(self.test_db_conn, self.annotator, n_workers=2, chunk_size=7)
+        self.add_publications(range(51, 61))
+        # leftover of an interrupted run beyond the watermark
+        self.test_db_conn.execute("INSERT INTO annotations VALUES (55, 'P04637', 'protein', 'abstract', 0, 3, 'p53')")
+        self.test_db_conn.commit()
+
+        self.assertEqual((10, 25), annotate_publications_parallel(self.test_db_conn, self.annotator, n_workers=2,
+                                                                  chunk_size=7))
+        self.assertEqual(60, get_annotation_watermark(self.test_db_conn))
+        self.assertEqual(150, len(self.select_annotations()))
+        self.assertEqual((0, 0), annotate_publications_parallel(self.test_db_conn, self.annotator, n_workers=2))
+        self.assertEqual((60, 150), annotate_publications_parallel(self.test_db_conn, self.annotator, n_workers=2,
+                                                                   restart=True))
+        self.assertEqual(150, len(self.select_annotations()))
+
+    def test_deleted_and_updated_publications(self):
+        """
+        Checks whether the annotations of deleted publications are removed and updated publications, as well as
+        publications deleted and ingested again, are annotated anew, leading to the annotations of a restart.
+        """
+        annotate_publications_parallel(self.test_db_conn, self.annotator, n_workers=2, chunk_size=7)
+        self.test_db_conn.execute("DELETE FROM publications WHERE pmid IN (4, 5)")
+        self.test_db_conn.executemany(
+            "INSERT INTO publications VALUES (?,?,?,?,?) ON CONFLICT(pmid) DO UPDATE SET "
+            "pub_abstract=excluded.pub_abstract, title=excluded.title",
+            [(3, "Abstract on TNF only.", "journal", "Other", "2020"),
+             (5, "Abstract on p53.", "journal", "TNF", "2020"),
+             (7, "Abstract 7 on p53 and IL-6.", "journal", "TNF", "2020")])
+        self.test_db_conn.commit()
+        self.assertEqual([], self.test_db_conn.execute("SELECT * FROM annotations WHERE pmid IN (3, 4, 5)").fetchall())
+        self.assertEqual([(3,), (4,), (5,)], self.test_db_conn.execute(
+            "SELECT pmid FROM annotation_queue ORDER BY pmid").fetchall())
+
+        self.assertEqual((2, 3), annotate_publications_parallel(self.test_db_conn, self.annotator, n_workers=2,
+                                                                chunk_size=2))
+        self.assertEqual([], self.test_db_conn.execute("SELECT * FROM annotation_queue").fetchall())
+        annotations = self.select_annotations()
+        self.assertEqual([(3, "TNF"), (5, "p53"), (5, "TNF")], [
+            (pmid, matched_text) for pmid, _, _, _, _, _, matched_text in annotations if pmid in (3, 4, 5)])
+        annotate_publications_parallel(self.test_db_conn, self.annotator, n_workers=1, restart=True)
+        self.assertEqual(annotations, self.select_annotations())
+
+    def test_inserted_below_watermark(self):
+        """
+        Checks whether a publication inserted at or below the watermark after the last run, e.g. a record completed by
+        an update file, is annotated by the next run.
+        """
+        self.test_db_conn.execute("DELETE FROM publications WHERE pmid=4")
+        self.test_db_conn.commit()
+        self.assertEqual((49, 123), annotate_publications_parallel(self.test_db_conn, self.annotator, n_workers=1))
+        self.add_publications([4])
+        self.assertEqual([("protein", 4)], self.test_db_conn.execute("SELECT * FROM annotation_queue").fetchall())
+
+        self.assertEqual((1, 2), annotate_publications_parallel(self.test_db_conn, self.annotator, n_workers=1))
+        self.assertEqual(["IL-6", "p53"], sorted(matched_text for *_, matched_text in self.test_db_conn.execute(
+            "SELECT * FROM annotations WHERE pmid=4")))
+        self.assertEqual([], self.test_db_conn.execute("SELECT * FROM annotation_queue").fetchall())
+
+    def tearDown(self) -> None:
+        """
+        Disconnecting from database and removing the temporary folder.
+        """
+        self.test_db_conn.close()
+        self.tmp_dir.cleanup()
@@ -0,0 +1,78 @@
+import contextlib
+import io
+import json
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+from unittest import TestCase
+from pathlib import Path
+
+from data_processing.cli import main
+from data_processing.synthetic_pubmed import write_synthetic_pubmed_xml
+
+
+class TestCommandLine(TestCase):
+    """
+    All tests relating to :mod:~`data_processing.cli` in the data_processing package.
+    """
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp_dir.name)
+        (self.tmp_path / "raw").mkdir()
+        (self.tmp_path / "processed").mkdir()
+        self.config_file = self.tmp_path / "config.yml"
+
+    def _main(self, argv: list):
+        """
+        Runs the entry point and returns the exit status and the output.
+        """
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            status = main(argv)
+        return status, output.getvalue()
+
+    def test_run(self):
+        """
+        Checks whether the files of data_raw are ingested into the configured database, with folders given without a
+        trailing slash, and are skipped in the next run.
+        """
+        complete_pmids = set()
+        write_synthetic_pubmed_xml(self.tmp_path / "raw" / "update.xml.gz", 30, abstract_words=20,
+                                   complete_pmids=complete_pmids)
+        self.config_file.write_text(f"data_raw: '{self.tmp_path / 'raw'}'\n"
+                                    f"data_processed: '{self.tmp_path / 'processed'}'\n"
+                                    "db_file: 'publications.db'\nmetrics_file: 'metrics.jsonl'\n")
+        self.assertEqual(0, self._main([str(self.config_file)])[0])
+        db_conn = sqlite3.connect(self.tmp_path / "processed" / "publications.db")
+        self.assertEqual(complete_pmids, set(pmid for pmid, in db_conn.execute("SELECT pmid FROM publications")))
+        db_conn.close()
+        self.assertEqual(0, self._main([str(self.config_file)])[0])
+        events = [json.loads(line)['event'] for line in
+                  (self.tmp_path / "processed" / "metrics.jsonl").read_text().splitlines()]
+        # one summary per run, emitted once all stages have completed
+        self.assertEqual(['file', 'run', 'run'], events)
+
+    def test_invalid_arguments(self):
+        """
+        Checks whether the run is aborted with exit status 1 if the config file is missing, not a yaml file or invalid.
+        """
+        self.config_file.write_text("database_rewrite: 'yes'\n")
+        for argv in ([], ["config.txt"], [str(self.tmp_path / "missing.yml")], [str(self.config_file)]):
+            status, output = self._main(argv)
+            self.assertEqual(1, status, argv)
+            self.assertIn("Program will abort", output)
+        self.assertIn("database_rewrite", self._main([str(self.config_file)])[1])
+        self.assertEqual(0, self._main(["--help"])[0])
+
+    def test_lazy_imports(self):
+        """
+        Checks whether importing the entry point does not import the parser, the database or the config file loader.
+        """
+        check = "import sys, data_processing.cli; print(sorted({'lxml', 'sqlite3', 'yaml'} & set(sys.modules)))"
+        output = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, check=True).stdout
+        self.assertEqual("[]", output.strip())
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
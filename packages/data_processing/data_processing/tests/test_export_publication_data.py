@@ -0,0 +1,161 @@
+import sqlite3
+import tempfile
+
+from unittest import TestCase
+from unittest import mock
+from unittest import skipUnless
+from pathlib import Path
+
+from data_processing.extract_publication_data import create_publication_tables
+from data_processing.extract_publication_data import extract_publication_data_from_xml
+from data_processing.extract_publication_data import parse_year
+from data_processing.ingest_publication_data import ingest_xml_files
+from protein_score_utilities.convenience_functions_database import iterate_publications
+
+try:
+    import pyarrow
+    from data_processing.export_publication_data import PublicationParquetWriter
+    from data_processing.export_publication_data import export_publications_to_parquet
+    from data_processing.export_publication_data import read_publications
+except ImportError:
+    pyarrow = None
+
+YEARS = ("2019", "2020", "Spring 2021", "unknown")
+
+
+def create_xml_file(file_path, pmids, deleted_pmids=()):
+    """
+    Writes a small Pubmed XML file containing one publication for each PMID provided, with the year taken from
+    :data:~`YEARS` in turn.
+    """
+    articles = [f"<PubmedArticle><MedlineCitation><PMID>{pmid}</PMID><Article>"
+                f"<ArticleTitle>title {pmid}</ArticleTitle>"
+                f"<Abstract><AbstractText>abstract {pmid}</AbstractText></Abstract>"
+                f"<Journal><Title>journal {pmid % 3}</Title>"
+                f"<JournalIssue><PubDate><Year>{YEARS[pmid % len(YEARS)]}</Year></PubDate></JournalIssue>"
+                "</Journal></Article></MedlineCitation></PubmedArticle>" for pmid in pmids]
+    if deleted_pmids:
+        articles.append(f"<DeleteCitation>{''.join(f'<PMID>{pmid}</PMID>' for pmid in deleted_pmids)}"
+                        "</DeleteCitation>")
+    file_path.write_text(f"<PubmedArticleSet>{''.join(articles)}</PubmedArticleSet>", encoding="UTF-8")
+
+
+@skipUnless(pyarrow, "pyarrow is not installed")
+class TestParquetExport(TestCase):
+    """
+    All tests relating to :mod:~`data_processing.export_publication_data` in the data_processing package.
+    """
+    def setUp(self) -> None:
+        """
+        Creating two XML files, the second one deleting publications of the first one, in a temporary folder.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp_dir.name)
+        self.file_paths = [self.tmp_path / "pubmed_0.xml", self.tmp_path / "pubmed_1.xml"]
+        create_xml_file(self.file_paths[0], range(1, 101))
+        create_xml_file(self.file_paths[1], range(101, 131), deleted_pmids=(3, 4, 5))
+
+    def _database_rows(self, compact=False):
+        db_conn = sqlite3.connect(self.tmp_path / f"publications_{compact}.db")
+        create_publication_tables(db_conn, compact=compact)
+        ingest_xml_files(self.file_paths, db_conn)
+        return db_conn, [row for chunk in iterate_publications(db_conn) for row in chunk]
+
+    @staticmethod
+    def _dataset_rows(dataset_dir, **kwargs):
+        table = read_publications(dataset_dir, **kwargs).sort_by('pmid')
+        return list(zip(*(table[column].to_pylist()
+                          for column in ('pmid', 'pub_abstract', 'title', 'journal', 'pub_year'))))
+
+    def test_export_publications(self):
+        """
+        Checks whether the publications of the plain and the compact schema are exported partitioned by year.
+        """
+        for compact in (False, True):
+            db_conn, rows = self._database_rows(compact)
+            dataset_dir = self.tmp_path / f"export_{compact}"
+            self.assertEqual(127, export_publications_to_parquet(db_conn, dataset_dir, chunk_size=10, batch_size=8,
+                                                                 rows_per_file=20))
+            db_conn.close()
+            self.assertEqual(["pub_year=2019", "pub_year=2020", "pub_year=2021", "pub_year=__HIVE_DEFAULT_PARTITION__"],
+                             sorted(path.name for path in dataset_dir.iterdir()))
+            self.assertEqual(2, len(list((dataset_dir / "pub_year=2020").glob("*.parquet"))))
+            self.assertEqual([row[:4] + (parse_year(row[4]) if isinstance(row[4], str) else row[4],) for row in rows],
+                             self._dataset_rows(dataset_dir))
+
+    def test_direct_write(self):
+        """
+        Checks whether publications written directly from the XML files are read alike, without the publications
+        deleted, and whether only the requested columns and years are read.
+        """
+        db_conn, rows = self._database_rows(compact=True)
+        db_conn.close()
+        dataset_dir = self.tmp_path / "direct"
+        with PublicationParquetWriter(dataset_dir, batch_size=16) as writer:
+            self.assertEqual((130, 0, 0, 3), ingest_xml_files(self.file_paths, None, n_workers=2, writer=writer))
+        self.assertEqual(rows, self._dataset_rows(dataset_dir))
+
+        # a second run appends the publications of the first file again, including the ones deleted by the second file
+        with PublicationParquetWriter(dataset_dir) as writer:
+            self.assertEqual((100, 0, 97, 0), extract_publication_data_from_xml(self.file_paths[0], None, writer))
+        table = read_publications(dataset_dir, columns=['pmid', 'pub_year'], years=[2019, 2021])
+        self.assertEqual(['pmid', 'pub_year'], table.column_names)
+        # every publication is read once, the ones deleted before included as they have been found again
+        self.assertEqual([pmid for pmid in range(1, 131) if pmid % 4 in (0, 2)], sorted(table['pmid'].to_pylist()))
+        self.assertEqual({2019, 2021}, set(table['pub_year'].to_pylist()))
+
+        self.assertRaises(ValueError, ingest_xml_files, self.file_paths, None, writer=writer, use_manifest=True)
+
+    def test_direct_write_versions(self):
+        """
+        Checks whether the version of a publication written last is read, also if its year has changed, and whether
+        publications are only left out if they were deleted after they had been written.
+        """
+        dataset_dir = self.tmp_path / "versions"
+        with PublicationParquetWriter(dataset_dir, batch_size=2) as writer:
+            writer.add_many([(1, "abstract", "first 1", "journal", "2020"),
+                             (2, "abstract", "first 2", "journal", "2020"),
+                             (1, "abstract", "second 1", "journal", "2021")])
+            writer.delete('pmid', [2, 3])
+            writer.add((3, "abstract", "first 3", "journal", "2020"))
+            self.assertEqual((1, 2), (writer.rows_duplicated, writer.rows_deleted))
+        self.assertEqual([(1, "second 1", 2021), (3, "first 3", 2020)],
+                         [(pmid, title, year) for pmid, _, title, _, year in self._dataset_rows(dataset_dir)])
+
+        with PublicationParquetWriter(dataset_dir) as writer:
+            writer.add((2, "abstract", "again 2", "journal", "2019"))
+            writer.add((1, "abstract", "third 1", "journal", "2021"))
+            writer.delete('pmid', [3])
+            self.assertEqual(1, writer.rows_duplicated)
+        self.assertEqual([(1, "third 1", 2021), (2, "again 2", 2019)],
+                         [(pmid, title, year) for pmid, _, title, _, year in self._dataset_rows(dataset_dir)])
+        self.assertEqual(0, read_publications(dataset_dir, years=[2020]).num_rows)
+
+    def test_direct_write_run_order(self):
+        """
+        Checks whether the runs are numbered by the runs stored in the folder, including runs that only deleted
+        publications, so that the version written last wins even if the clock has been set back in between.
+        """
+        import pyarrow.dataset as ds
+
+        dataset_dir = self.tmp_path / "runs"
+        with mock.patch("time.time_ns", return_value=2000):
+            with PublicationParquetWriter(dataset_dir) as writer:
+                writer.add((1, "abstract", "first 1", "journal", "2020"))
+        with mock.patch("time.time_ns", return_value=1000):
+            with PublicationParquetWriter(dataset_dir) as writer:
+                writer.add((1, "abstract", "second 1", "journal", "2020"))
+            with PublicationParquetWriter(dataset_dir) as writer:
+                writer.delete('pmid', [1])
+        self.assertEqual([], self._dataset_rows(dataset_dir))
+        with PublicationParquetWriter(dataset_dir) as writer:
+            writer.add((1, "abstract", "third 1", "journal", "2020"))
+        self.assertEqual([(1, "third 1")], [(pmid, title) for pmid, _, title, _, _ in self._dataset_rows(dataset_dir)])
+        runs = ds.dataset([str(path) for path in dataset_dir.rglob("*.parquet")]).to_table(columns=['_run'])
+        self.assertEqual([1, 2, 3, 4], sorted(runs['_run'].to_pylist()))
+
+    def tearDown(self) -> None:
+        """
+        Removing the temporary folder with all test files.
+        """
+        self.tmp_dir.cleanup()
@@ -0,0 +1,161 @@
+import sqlite3
+import tempfile
+
+from unittest import TestCase
+from pathlib import Path
+
+from data_processing.annotation_pipeline import SQL_CREATE_ANNOTATION_PROGRESS_TABLE
+from data_processing.extract_concepts import CONCEPT_PROGRESS_NAME
+from data_processing.extract_concepts import ConceptClusterer
+from data_processing.extract_concepts import SQL_CREATE_CONCEPTS_TABLE
+from data_processing.extract_concepts import SQL_CREATE_PUBLICATION_CLUSTERS_TABLE
+from data_processing.extract_concepts import cluster_publications
+from data_processing.extract_concepts import describe_clusters
+from data_processing.extract_concepts import extract_concepts
+from data_processing.extract_concepts import get_cluster_watermark
+from data_processing.extract_concepts import reset_clustering
+from data_processing.extract_publication_data import SQL_CREATE_PUBLICATIONS_TABLE
+
+TOPICS = (
+    ("Tumor necrosis factor in rheumatoid arthritis", "Tumor necrosis factor drives joint inflammation in rheumatoid "
+                                                      "arthritis patients."),
+    ("Insulin resistance in type 2 diabetes", "Insulin resistance and beta cell failure cause type 2 diabetes."),
+)
+
+
+class TestExtractConcepts(TestCase):
+    """
+    All tests relating to :func:~`data_processing.extract_concepts.extract_concepts` in the data_processing package.
+    """
+    def test_extract_concepts(self):
+        """
+        Checks whether n-grams are extracted without spanning stop words or punctuation.
+        """
+        self.assertEqual(["levels", "tumor", "tumor necrosis", "tumor necrosis factor", "necrosis", "necrosis factor",
+                          "factor", "il-6"], extract_concepts("Levels of tumor necrosis factor and IL-6."))
+        self.assertEqual(["type", "type 2", "type 2 diabetes", "2 diabetes", "diabetes"],
+                         extract_concepts("type 2 diabetes"))
+        self.assertEqual([], extract_concepts(None))
+
+
+class TestClusterPublications(TestCase):
+    """
+    All tests relating to :func:~`data_processing.extract_concepts.cluster_publications` in the data_processing
+    package.
+    """
+    def setUp(self) -> None:
+        """
+        Creating a database holding publications on two topics in a temporary folder.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.model_file = Path(self.tmp_dir.name) / "concept_model.pkl"
+        self.test_db_conn = sqlite3.connect(Path(self.tmp_dir.name) / "concepts.db")
+        for sql_create_table in (SQL_CREATE_PUBLICATIONS_TABLE, SQL_CREATE_CONCEPTS_TABLE,
+                                 SQL_CREATE_PUBLICATION_CLUSTERS_TABLE):
+            self.test_db_conn.execute(sql_create_table)
+        self.add_publications(range(1, 21))
+
+    def add_publications(self, pmids):
+        self.test_db_conn.executemany("INSERT INTO publications VALUES (?,?,?,?,?)", [
+            (pmid, TOPICS[pmid % 2][1], "journal", TOPICS[pmid % 2][0], "2020") for pmid in pmids
+        ])
+        self.test_db_conn.commit()
+
+    def select_clusters(self):
+        return dict(self.test_db_conn.execute("SELECT pmid, cluster FROM publication_clusters").fetchall())
+
+    def test_cluster_publications_incrementally(self):
+        """
+        Checks whether publications on the same topic end up in the same cluster and whether publications added later
+        are clustered with the stored model only.
+        """
+        clusterer = ConceptClusterer(n_clusters=2, n_features=2 ** 12)
+        self.assertEqual(20, cluster_publications(self.test_db_conn, self.model_file, clusterer, chunk_size=8))
+        clusters = self.select_clusters()
+        self.assertEqual(2, len(set(clusters.values())))
+        self.assertTrue(all(clusters[pmid] == clusters[pmid % 2 + 2] for pmid in clusters))
+
+        self.add_publications(range(21, 25))
+        self.assertEqual(4, cluster_publications(self.test_db_conn, self.model_file, chunk_size=8))
+        clusters = self.select_clusters()
+        self.assertEqual(24, len(clusters))
+        self.assertTrue(all(clusters[pmid] == clusters[pmid % 2 + 2] for pmid in range(21, 25)))
+        self.assertEqual(24, get_cluster_watermark(self.test_db_conn))
+        self.assertEqual(24, ConceptClusterer.load(self.model_file).n_publications_seen)
+
+        descriptions = describe_clusters(self.test_db_conn, ConceptClusterer.load(self.model_file), n_concepts=30)
+        self.assertIn("insulin resistance", descriptions[clusters[1]])
+        self.assertIn("tumor necrosis factor", descriptions[clusters[2]])
+        self.assertEqual(12, self.test_db_conn.execute(
+            "SELECT publication_count FROM concepts WHERE concept='type 2 diabetes'").fetchone()[0])
+
+    def test_deleted_and_inserted_publications(self):
+        """
+        Checks whether the clusters of deleted publications are removed, publications ingested below the watermark are
+        clustered in the next run and a model without recorded progress, e.g. after the database has been rewritten, is
+        trained anew.
+        """
+        cluster_publications(self.test_db_conn, self.model_file, ConceptClusterer(n_clusters=2), chunk_size=8)
+        self.test_db_conn.execute("DELETE FROM publications WHERE pmid IN (3, 4)")
+        self.test_db_conn.commit()
+        self.assertEqual(18, len(self.select_clusters()))
+        self.add_publications([3])
+        self.assertEqual([(3,)], self.test_db_conn.execute("SELECT pmid FROM cluster_queue").fetchall())
+
+        self.assertEqual(1, cluster_publications(self.test_db_conn, self.model_file, chunk_size=8))
+        clusters = self.select_clusters()
+        self.assertEqual(19, len(clusters))
+        self.assertEqual(clusters[1], clusters[3])
+        self.assertEqual([], self.test_db_conn.execute("SELECT pmid FROM cluster_queue").fetchall())
+        self.assertEqual(21, ConceptClusterer.load(self.model_file).n_publications_seen)
+        self.assertEqual(20, get_cluster_watermark(self.test_db_conn))
+
+        reset_clustering(self.test_db_conn)
+        self.test_db_conn.commit()
+        self.assertEqual(19, cluster_publications(self.test_db_conn, self.model_file, ConceptClusterer(n_clusters=2),
+                                                  chunk_size=8))
+        self.assertEqual(19, ConceptClusterer.load(self.model_file).n_publications_seen)
+
+    def test_watermark_moved_from_annotation_progress(self):
+        """
+        Checks whether a watermark recorded in the table annotation_progress by earlier versions is taken over.
+        """
+        cluster_publications(self.test_db_conn, self.model_file, ConceptClusterer(n_clusters=2), chunk_size=8)
+        self.test_db_conn.execute("DROP TABLE cluster_progress")
+        self.test_db_conn.execute(SQL_CREATE_ANNOTATION_PROGRESS_TABLE)
+        self.test_db_conn.execute("INSERT INTO annotation_progress VALUES (?, 20, NULL)", (CONCEPT_PROGRESS_NAME,))
+        self.test_db_conn.commit()
+        self.assertEqual(0, cluster_publications(self.test_db_conn, self.model_file))
+        self.assertEqual(20, get_cluster_watermark(self.test_db_conn))
+        self.assertEqual([], self.test_db_conn.execute("SELECT * FROM annotation_progress").fetchall())
+
+    def test_concepts_bounded(self):
+        """
+        Checks whether the table concepts keeps only the most frequent concepts of each hashed feature.
+        """
+        cluster_publications(self.test_db_conn, self.model_file, ConceptClusterer(n_clusters=2, n_features=4),
+                             chunk_size=8, concepts_per_feature=2)
+        self.assertEqual([2] * 4, [count for count, in self.test_db_conn.execute(
+            "SELECT count(*) FROM concepts GROUP BY feature ORDER BY feature")])
+        self.assertEqual(10, self.test_db_conn.execute(
+            "SELECT max(publication_count) FROM concepts").fetchone()[0])
+
+    def test_cluster_publications_restart(self):
+        """
+        Checks whether the clustering can be restarted and a first batch smaller than the number of clusters is refused.
+        """
+        self.assertRaises(ValueError, cluster_publications, self.test_db_conn, self.model_file,
+                          ConceptClusterer(n_clusters=5), chunk_size=4)
+        cluster_publications(self.test_db_conn, self.model_file, ConceptClusterer(n_clusters=2), chunk_size=10)
+        self.assertEqual(20, cluster_publications(self.test_db_conn, self.model_file, ConceptClusterer(n_clusters=3),
+                                                  chunk_size=10, restart=True))
+        self.assertEqual(3, ConceptClusterer.load(self.model_file).n_clusters)
+        self.assertEqual(10, self.test_db_conn.execute(
+            "SELECT publication_count FROM concepts WHERE concept='type 2 diabetes'").fetchone()[0])
+
+    def tearDown(self) -> None:
+        """
+        Disconnecting from database and removing the temporary folder.
+        """
+        self.test_db_conn.close()
+        self.tmp_dir.cleanup()
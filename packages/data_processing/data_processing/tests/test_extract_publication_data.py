@@ -1,11 +1,58 @@
+import json
 import sqlite3
+import tempfile
 
 from io import BytesIO
+from io import StringIO
 from unittest import TestCase
+from unittest import skipUnless
 from pathlib import Path
 
+from data_processing.extract_publication_data import DETAIL_FIELDS
+from data_processing.extract_publication_data import create_publication_tables
 from data_processing.extract_publication_data import extract_publication_data_from_xml
+from data_processing.extract_publication_data import iterate_publications_from_xml
 from data_processing.extract_publication_data import Publication
+from data_processing.ingest_publication_data import ingest_xml_files
+from protein_score_utilities.run_metrics import MetricsRecorder
+from protein_score_utilities.run_metrics import current_rss_bytes
+
+
+def create_detailed_article(pmid, abstract_sections=2, n_mesh_terms=2):
+    """
+    Returns a Pubmed article with a structured abstract and all details that can be extracted.
+    :param pmid: PMID of the publication
+    :type pmid: int
+    :param abstract_sections: number of labelled sections of the abstract
+    :type abstract_sections: int
+    :param n_mesh_terms: number of MeSH headings of the publication
+    :type n_mesh_terms: int
+    :return: PubmedArticle element
+    :rtype: str
+    """
+    sections = "".join(f"<AbstractText Label='SECTION {i}'>text <i>{i}</i> of {pmid}</AbstractText>"
+                       for i in range(abstract_sections))
+    mesh_terms = "".join(f"<MeshHeading><DescriptorName UI='D{i}' MajorTopicYN='N'>Term {i}</DescriptorName>"
+                         f"<QualifierName MajorTopicYN='{'Y' if i else 'N'}'>metabolism</QualifierName>"
+                         f"<QualifierName>genetics</QualifierName></MeshHeading>" for i in range(n_mesh_terms))
+    return ("<PubmedArticle><MedlineCitation>"
+            f"<PMID>{pmid}</PMID>"
+            "<Article>"
+            "<Journal><Title>journal name</Title>"
+            "<JournalIssue><PubDate><Year>2020</Year></PubDate></JournalIssue></Journal>"
+            "<ArticleTitle>Role of <i>TNF</i> in arthritis</ArticleTitle>"
+            f"<Abstract>{sections}<CopyrightInformation>none</CopyrightInformation></Abstract>"
+            "<AuthorList><Author><LastName>Doe</LastName><ForeName>Jane</ForeName><Initials>J</Initials></Author>"
+            "<Author><CollectiveName>Arthritis <i>Study</i> Group</CollectiveName></Author></AuthorList>"
+            "</Article>"
+            "<ChemicalList><Chemical><RegistryNumber>0</RegistryNumber>"
+            "<NameOfSubstance UI='D014409'>Tumor Necrosis Factor-alpha</NameOfSubstance></Chemical></ChemicalList>"
+            f"<MeshHeadingList>{mesh_terms}</MeshHeadingList>"
+            "<KeywordList><Keyword MajorTopicYN='Y'>TNF</Keyword><Keyword/></KeywordList>"
+            "</MedlineCitation>"
+            f"<PubmedData><ArticleIdList><ArticleId IdType='pubmed'>{pmid}</ArticleId>"
+            f"<ArticleId IdType='doi'>10.1000/{pmid}</ArticleId></ArticleIdList></PubmedData>"
+            "</PubmedArticle>")
 
 
 def setup_db_conn():
@@ -76,6 +123,25 @@ class TestExtractPublicationDataFromXML(TestCase):
                "</MedlineCitation></PubmedArticle>").encode(encoding="UTF-8")
         extract_publication_data_from_xml(BytesIO(xml), self.test_db_conn)
 
+    def test_extract_publication_data_from_xml_duplicated_record(self):
+        """
+        Tests whether a publication occurring twice is written once and counted as duplicate.
+        """
+        article = ("<PubmedArticle><MedlineCitation>"
+                   "<PMID>4325</PMID>"
+                   "<Article>"
+                   "<ArticleTitle>article title</ArticleTitle>"
+                   "<Abstract><AbstractText>abstract text</AbstractText></Abstract>"
+                   "<Journal>"
+                   "<Title>journal name</Title>"
+                   "<JournalIssue><PubDate><Year>2020</Year></PubDate></JournalIssue>"
+                   "</Journal>"
+                   "</Article>"
+                   "</MedlineCitation></PubmedArticle>")
+        xml = f"<PubmedArticleSet>{article}{article}</PubmedArticleSet>".encode(encoding="UTF-8")
+        self.assertEqual((2, 0, 1, 0), extract_publication_data_from_xml(BytesIO(xml), self.test_db_conn))
+        self.assertEqual(1, self.test_db_conn.execute("SELECT COUNT(*) FROM publications").fetchone()[0])
+
     def test_extract_publication_data_from_xml_incomplete_record(self):
         """
         Pass XML without one of the required attributes missing.
@@ -92,6 +158,26 @@ class TestExtractPublicationDataFromXML(TestCase):
                "</MedlineCitation></PubmedArticle>").encode(encoding="UTF-8")
         extract_publication_data_from_xml(BytesIO(xml), self.test_db_conn)
 
+    def test_extract_publication_data_from_xml_syntax_error(self):
+        """
+        Checks whether the publications found before a syntax error are written and the byte offset of the error is
+        reported.
+        """
+        articles = [create_detailed_article(pmid) for pmid in range(1, 6)]
+        articles[3] = articles[3].replace("</PMID>", "</PMI>")
+        xml = "<PubmedArticleSet>\n" + "\n".join(articles) + "\n</PubmedArticleSet>"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = Path(tmp_dir) / "pubmed_broken.xml"
+            file_path.write_text(xml, encoding="UTF-8")
+            sink = StringIO()
+            counters = extract_publication_data_from_xml(file_path, self.test_db_conn, metrics=MetricsRecorder(sink))
+        self.assertEqual((3, 0, 0, 0), counters)
+        self.assertEqual([(1,), (2,), (3,)], self.test_db_conn.execute("SELECT pmid FROM publications").fetchall())
+        event = json.loads(sink.getvalue())
+        self.assertIn("line 5", event['error'])
+        self.assertIn(f"byte offset {event['error_offset']}", event['error'])
+        self.assertEqual(xml.index("</PMI>") + len("</PMI>"), event['error_offset'])
+
     def tearDown(self) -> None:
         """
         Disconnecting from database after test finished.
@@ -100,6 +186,44 @@ class TestExtractPublicationDataFromXML(TestCase):
             shutdown_db_conn(self.test_db_conn)
 
 
+class TestBoundedMemory(TestCase):
+    """
+    Tests that the memory needed by :func:~`data_processing.extract_publication_data.iterate_publications_from_xml`
+    does not grow with the size of the file parsed.
+    """
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp_dir.name)
+
+    @skipUnless(current_rss_bytes(), "the current memory can only be determined on Linux")
+    def test_iterate_publications_from_xml_releases_other_elements(self):
+        """
+        Checks whether elements below the root other than PubmedArticle, of which ~100 MB precede the last article, are
+        released while being parsed instead of being held until the next article is found.
+        """
+        file_path = self.tmp_path / "pubmed_books.xml"
+        text = "book chapter " * 8000
+        with open(file_path, "w", encoding="UTF-8") as file:
+            file.write("<PubmedArticleSet>\n<!-- comment -->\n")
+            for i in range(1000):
+                file.write(f"<PubmedBookArticle><BookDocument><PMID>{i}</PMID><Abstract><AbstractText>{text}"
+                           f"</AbstractText></Abstract></BookDocument></PubmedBookArticle>\n"
+                           f"<DeleteCitation><PMID>{i}</PMID></DeleteCitation>\n")
+            file.write(create_detailed_article(1000) + "\n</PubmedArticleSet>\n")
+
+        deleted_pmids = []
+        rss_before = current_rss_bytes()
+        for publication in iterate_publications_from_xml(file_path, deleted_pmids):
+            # all elements preceding the last article would still be held here
+            rss_growth = current_rss_bytes() - rss_before
+        self.assertEqual("1000", publication.pmid)
+        self.assertEqual(1000, len(deleted_pmids))
+        self.assertLess(rss_growth, 32 * 1024 * 1024)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+
 class TestPublication(TestCase):
     """
     All tests relating to class :class:~`data_processing.extract_publication_data.Publication` in the
@@ -153,6 +277,131 @@ class TestPublication(TestCase):
         shutdown_db_conn(test_db_conn)
 
 
+class TestPublicationDetails(TestCase):
+    """
+    All tests relating to the extraction of abstracts with multiple sections and of the details of publications in
+    :mod:~`data_processing.extract_publication_data`.
+    """
+    def setUp(self) -> None:
+        self.db_conn = sqlite3.connect(":memory:")
+        create_publication_tables(self.db_conn, fields=tuple(DETAIL_FIELDS))
+
+    def test_iterate_publications_from_xml_details(self):
+        """
+        Checks whether all sections of the abstract, text within formatting elements and all details are extracted,
+        as well as whether fields following a missing field are still extracted.
+        """
+        xml = (f"<PubmedArticleSet>{create_detailed_article(1)}{create_detailed_article(2, abstract_sections=0)}"
+               "</PubmedArticleSet>").encode(encoding="UTF-8")
+        publications = list(iterate_publications_from_xml(BytesIO(xml), fields=tuple(DETAIL_FIELDS)))
+        self.assertEqual("SECTION 0: text 0 of 1\nSECTION 1: text 1 of 1", publications[0].abstract_text)
+        self.assertEqual("Role of TNF in arthritis", publications[0].title)
+        self.assertEqual({
+            'mesh_terms': [(1, 0, 'D0', 'Term 0', 0, 'metabolism|genetics'),
+                           (1, 1, 'D1', 'Term 1', 1, 'metabolism|genetics')],
+            'keywords': [(1, 0, 'TNF', 1)],
+            'chemicals': [(1, 0, None, 'D014409', 'Tumor Necrosis Factor-alpha')],
+            'article_ids': [(1, 0, 'pubmed', '1'), (1, 1, 'doi', '10.1000/1')],
+            'authors': [(1, 0, 'Doe', 'Jane', 'J', None), (1, 1, None, None, None, 'Arthritis Study Group')],
+        }, publications[0].to_detail_rows())
+
+        self.assertIsNone(publications[1].abstract_text)
+        self.assertEqual(("2", None, "Role of TNF in arthritis", "journal name", "2020"), publications[1].to_record())
+        self.assertEqual(2, len(publications[1].details['mesh_terms']))
+        self.assertEqual({}, next(iterate_publications_from_xml(BytesIO(xml))).details)
+        self.assertRaises(ValueError, next, iterate_publications_from_xml(BytesIO(xml), fields=('grants',)))
+
+        # the items of several lists of the same detail are collected in the order of the lists
+        xml = ("<PubmedArticleSet><PubmedArticle><MedlineCitation><PMID>3</PMID>"
+               "<KeywordList Owner='NOTNLM'><Keyword>TNF</Keyword></KeywordList>"
+               "<KeywordList Owner='NLM'><Keyword MajorTopicYN='Y'>arthritis</Keyword></KeywordList>"
+               "</MedlineCitation></PubmedArticle></PubmedArticleSet>").encode(encoding="UTF-8")
+        publication = next(iterate_publications_from_xml(BytesIO(xml), fields=('keywords', 'authors')))
+        self.assertEqual({'keywords': [(3, 0, 'TNF', 0), (3, 1, 'arthritis', 1)], 'authors': []},
+                         publication.to_detail_rows())
+
+    def test_extract_publication_data_from_xml_details(self):
+        """
+        Checks whether the details are written to the child tables, replaced when upserting a publication and deleted
+        together with the publication.
+        """
+        def count_rows(table_name):
+            return self.db_conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+
+        xml = (f"<PubmedArticleSet>{create_detailed_article(1, n_mesh_terms=3)}{create_detailed_article(2)}"
+               "</PubmedArticleSet>").encode(encoding="UTF-8")
+        self.assertEqual((2, 0, 0, 0), extract_publication_data_from_xml(BytesIO(xml), self.db_conn,
+                                                                         fields=('mesh_terms', 'article_ids')))
+        self.assertEqual(5, count_rows("publication_mesh_terms"))
+        self.assertEqual(4, count_rows("publication_article_ids"))
+        self.assertEqual(0, count_rows("publication_authors"))
+
+        xml = (f"<PubmedArticleSet>{create_detailed_article(1, n_mesh_terms=1)}"
+               "<DeleteCitation><PMID>2</PMID></DeleteCitation></PubmedArticleSet>").encode(encoding="UTF-8")
+        self.assertEqual((1, 0, 1, 1), extract_publication_data_from_xml(BytesIO(xml), self.db_conn, upsert=True,
+                                                                         fields=tuple(DETAIL_FIELDS)))
+        self.assertEqual([(1, 0, 'Term 0')], self.db_conn.execute(
+            "SELECT pmid, position, descriptor FROM publication_mesh_terms").fetchall())
+        self.assertEqual([('10.1000/1',)], self.db_conn.execute(
+            "SELECT article_id FROM publication_article_ids WHERE id_type='doi'").fetchall())
+        self.assertEqual(2, count_rows("publication_authors"))
+
+    def test_details_of_duplicates_kept(self):
+        """
+        Checks whether publications found again without upsert keep the details stored before, also if the version
+        found again has more MeSH headings, within one file as well as across files and in a parallel ingestion.
+        """
+        first = [(1, 0, 'D0'), (1, 1, 'D1'), (2, 0, 'D0')]
+        xml = (f"<PubmedArticleSet>{create_detailed_article(1)}{create_detailed_article(2, n_mesh_terms=1)}"
+               f"{create_detailed_article(1, n_mesh_terms=4)}</PubmedArticleSet>").encode(encoding="UTF-8")
+        self.assertEqual((3, 0, 1, 0), extract_publication_data_from_xml(BytesIO(xml), self.db_conn,
+                                                                         fields=('mesh_terms',)))
+        self.assertEqual(first, self.db_conn.execute(
+            "SELECT pmid, position, descriptor_ui FROM publication_mesh_terms ORDER BY pmid, position").fetchall())
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = Path(tmp_dir) / "pubmed_update.xml"
+            articles = "".join(create_detailed_article(pmid, n_mesh_terms=n_mesh_terms)
+                               for pmid, n_mesh_terms in ((2, 3), (3, 1), (3, 2)))
+            file_path.write_text(f"<PubmedArticleSet>{articles}</PubmedArticleSet>", encoding="UTF-8")
+            for n_workers in (1, 2):
+                db_conn = sqlite3.connect(":memory:")
+                create_publication_tables(db_conn, fields=('mesh_terms',))
+                extract_publication_data_from_xml(BytesIO(xml), db_conn, fields=('mesh_terms',))
+                ingest_xml_files([file_path], db_conn, n_workers=n_workers, batch_size=16, fields=('mesh_terms',),
+                                 upsert=False, use_manifest=False)
+                self.assertEqual(first + [(3, 0, 'D0')], db_conn.execute(
+                    "SELECT pmid, position, descriptor_ui FROM publication_mesh_terms ORDER BY pmid, position"
+                ).fetchall())
+                db_conn.close()
+
+    def test_ingest_xml_files_details(self):
+        """
+        Checks whether a parallel ingestion writes the same details as a serial one.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_paths = []
+            for i in range(3):
+                file_paths.append(Path(tmp_dir) / f"pubmed_{i}.xml")
+                articles = "".join(create_detailed_article(pmid, n_mesh_terms=pmid % 4)
+                                   for pmid in range(i * 50, i * 50 + 60))
+                file_paths[-1].write_text(f"<PubmedArticleSet>{articles}</PubmedArticleSet>", encoding="UTF-8")
+            tables = []
+            for n_workers in (1, 2):
+                db_conn = sqlite3.connect(":memory:")
+                create_publication_tables(db_conn, compact=n_workers > 1, fields=tuple(DETAIL_FIELDS))
+                ingest_xml_files(file_paths, db_conn, n_workers=n_workers, batch_size=16, insert_batch_size=20,
+                                 upsert=True, fields=tuple(DETAIL_FIELDS))
+                tables.append([db_conn.execute(f"SELECT * FROM {spec.table_name} ORDER BY pmid, position").fetchall()
+                               for spec in DETAIL_FIELDS.values()])
+                db_conn.close()
+        self.assertEqual(tables[0], tables[1])
+        self.assertEqual(sum(pmid % 4 for pmid in range(160)), len(tables[0][0]))
+
+    def tearDown(self) -> None:
+        self.db_conn.close()
+
+
 if __name__ == "__main__":
     TestExtractPublicationDataFromXML.main()
     TestPublication.main()
@@ -0,0 +1,328 @@
+import gzip
+import json
+import multiprocessing
+import sqlite3
+import tempfile
+
+from unittest import TestCase
+from unittest import mock
+from pathlib import Path
+
+from data_processing.extract_publication_data import create_publication_tables
+from data_processing.extract_publication_data import migrate_to_compact_schema
+from data_processing.ingest_publication_data import ingest_xml_files
+from data_processing.ingestion_manifest import SQL_CREATE_MANIFEST_TABLE
+from protein_score_utilities.convenience_functions_database import iterate_publications
+from protein_score_utilities.convenience_functions_files import DECOMPRESSORS
+from protein_score_utilities.convenience_functions_files import read_xml_file_names
+from protein_score_utilities.convenience_functions_files import register_decompressor
+from protein_score_utilities.publication_search import count_publications
+from protein_score_utilities.publication_search import create_publication_search_index
+from protein_score_utilities.run_metrics import MetricsRecorder
+
+
+def create_xml_file(file_path, pmids, incomplete_pmids=(), deleted_pmids=()):
+    """
+    Writes a small Pubmed XML file containing one publication for each PMID provided.
+    :param file_path: path the XML file is written to
+    :type file_path: Path
+    :param pmids: PMIDs of the publications to be written to the file
+    :type pmids: list
+    :param incomplete_pmids: PMIDs of publications for which the abstract is left out
+    :type incomplete_pmids: tuple
+    :param deleted_pmids: PMIDs of publications to be listed for deletion
+    :type deleted_pmids: tuple
+    """
+    articles = []
+    for pmid in pmids:
+        abstract = "" if pmid in incomplete_pmids else \
+            f"<Abstract><AbstractText>abstract {pmid} from {file_path.name}</AbstractText></Abstract>"
+        articles.append("<PubmedArticle><MedlineCitation>"
+                        f"<PMID>{pmid}</PMID>"
+                        "<Article>"
+                        f"<ArticleTitle>title {pmid}</ArticleTitle>"
+                        f"{abstract}"
+                        "<Journal>"
+                        "<Title>journal name</Title>"
+                        "<JournalIssue><PubDate><Year>2020</Year></PubDate></JournalIssue>"
+                        "</Journal>"
+                        "</Article>"
+                        "</MedlineCitation></PubmedArticle>")
+    if deleted_pmids:
+        pmid_elements = "".join(f"<PMID Version='1'>{pmid}</PMID>" for pmid in deleted_pmids)
+        articles.append(f"<DeleteCitation>{pmid_elements}</DeleteCitation>")
+    file_path.write_text(f"<PubmedArticleSet>{''.join(articles)}</PubmedArticleSet>", encoding="UTF-8")
+
+
+def open_reversed_file(file_path):
+    """
+    Opens a test file whose content is stored in reverse byte order as binary stream of the original content.
+    """
+    import io
+    with open(file_path, 'rb') as file:
+        return io.BytesIO(file.read()[::-1])
+
+
+class TestIngestXMLFiles(TestCase):
+    """
+    All tests relating to :func:~`data_processing.ingest_publication_data.ingest_xml_files` in the data_processing
+    package.
+    """
+    def setUp(self) -> None:
+        """
+        Creating a number of XML files with overlapping PMIDs and incomplete records in a temporary folder.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp_dir.name)
+        self.file_paths = []
+        for i in range(5):
+            file_path = self.tmp_path / f"pubmed_{i}.xml"
+            # every file shares some PMIDs with the following file
+            create_xml_file(file_path, range(i * 100, i * 100 + 120), incomplete_pmids=(i * 100 + 7,))
+            self.file_paths.append(file_path)
+        create_xml_file(self.tmp_path / "pubmed_broken.xml", range(10))
+        with open(self.tmp_path / "pubmed_broken.xml", "a") as file:
+            file.write("<PubmedArticle>")
+        self.file_paths.insert(2, self.tmp_path / "pubmed_broken.xml")
+
+    def _ingest(self, db_name, n_workers, file_paths=None, use_manifest=False, upsert=False, compact=False):
+        """
+        Ingests the test files into a new database and returns the counters and the content of the publication table.
+        """
+        db_conn = sqlite3.connect(self.tmp_path / db_name)
+        create_publication_tables(db_conn, compact=compact)
+        db_conn.execute(SQL_CREATE_MANIFEST_TABLE)
+        file_paths = self.file_paths if file_paths is None else file_paths
+        counters = ingest_xml_files(file_paths, db_conn, n_workers=n_workers, queue_size=2, batch_size=16,
+                                    use_manifest=use_manifest, upsert=upsert)
+        rows = [row for chunk in iterate_publications(db_conn) for row in chunk]
+        db_conn.close()
+        return counters, rows
+
+    def test_ingest_xml_files_parallel_matches_serial(self):
+        """
+        Checks whether a parallel run results in the same counters and database content as a serial run.
+        """
+        serial_counters, serial_rows = self._ingest("serial.db", n_workers=1)
+        parallel_counters, parallel_rows = self._ingest("parallel.db", n_workers=3)
+        self.assertEqual((610, 5, 85, 0), serial_counters)
+        self.assertEqual(serial_counters, parallel_counters)
+        self.assertEqual(520, len(serial_rows))
+        self.assertEqual(serial_rows, parallel_rows)
+
+    def test_ingest_xml_files_gzip(self):
+        """
+        Checks whether gzip compressed XML files are identified and lead to the same database content.
+        """
+        gzip_dir = self.tmp_path / "gzip"
+        gzip_dir.mkdir()
+        for file_path in self.file_paths:
+            with open(file_path, "rb") as file, gzip.open(gzip_dir / (file_path.name + ".gz"), "wb") as gz_file:
+                gz_file.write(file.read())
+        (gzip_dir / "notes.txt").write_text("not an XML file")
+
+        gzip_file_paths = read_xml_file_names(str(gzip_dir))
+        self.assertEqual(len(self.file_paths), len(gzip_file_paths))
+        # keep order of the uncompressed files so that the same duplicates are found
+        gzip_file_paths = [gzip_dir / (file_path.name + ".gz") for file_path in self.file_paths]
+        self.assertEqual(self._ingest("plain.db", n_workers=1), self._ingest("gzip.db", n_workers=2,
+                                                                              file_paths=gzip_file_paths))
+
+    def test_ingest_xml_files_registered_decompressor_spawn(self):
+        """
+        Checks whether a decompressor registered in the calling process is also used by workers started with spawn,
+        which do not inherit the registration.
+        """
+        register_decompressor(".rev", open_reversed_file)
+        self.addCleanup(DECOMPRESSORS.pop, ".rev")
+        rev_file_paths = []
+        for file_path in self.file_paths:
+            rev_file_path = self.tmp_path / (file_path.name + ".rev")
+            rev_file_path.write_bytes(file_path.read_bytes()[::-1])
+            rev_file_paths.append(rev_file_path)
+
+        get_context = multiprocessing.get_context
+        with mock.patch("multiprocessing.get_context", lambda method=None: get_context("spawn")):
+            rev_result = self._ingest("rev.db", n_workers=2, file_paths=rev_file_paths)
+        self.assertEqual(self._ingest("plain.db", n_workers=1), rev_result)
+
+    def test_ingest_xml_files_manifest_skips_ingested_files(self):
+        """
+        Checks whether a second run with the manifest only processes new files and files that could not be parsed.
+        """
+        self._ingest("manifest.db", n_workers=2, use_manifest=True)
+        new_file_path = self.tmp_path / "pubmed_update.xml"
+        create_xml_file(new_file_path, range(1000, 1010))
+        counters, rows = self._ingest("manifest.db", n_workers=2, file_paths=self.file_paths + [new_file_path],
+                                      use_manifest=True)
+        # only the broken file (10 publications, all duplicated) and the new file are processed
+        self.assertEqual((20, 0, 10, 0), counters)
+        self.assertEqual(530, len(rows))
+
+        db_conn = sqlite3.connect(self.tmp_path / "manifest.db")
+        statuses = dict(db_conn.execute("SELECT file_name, status FROM ingestion_manifest"))
+        db_conn.close()
+        self.assertEqual("failed", statuses["pubmed_broken.xml"])
+        self.assertEqual("completed", statuses["pubmed_update.xml"])
+
+    def test_ingest_xml_files_manifest_interrupted_file(self):
+        """
+        Checks whether a file whose ingestion has been started but not completed is processed again.
+        """
+        self._ingest("interrupted.db", n_workers=1, file_paths=self.file_paths[:1], use_manifest=True)
+        db_conn = sqlite3.connect(self.tmp_path / "interrupted.db")
+        db_conn.execute("UPDATE ingestion_manifest SET status='started'")
+        db_conn.commit()
+        db_conn.close()
+        counters, rows = self._ingest("interrupted.db", n_workers=1, file_paths=self.file_paths[:1],
+                                      use_manifest=True)
+        self.assertEqual((120, 1, 119, 0), counters)
+        self.assertEqual(119, len(rows))
+
+    def test_ingest_xml_files_update_file(self):
+        """
+        Checks whether an update file replaces existing publications and deletes the publications listed for deletion,
+        in a serial as well as in a parallel run.
+        """
+        update_file_path = self.tmp_path / "pubmed_update.xml"
+        create_xml_file(update_file_path, [5, 6, 2000], deleted_pmids=(10, 11, 3000))
+        for n_workers in (1, 3):
+            counters, rows = self._ingest(f"update_{n_workers}.db", n_workers=n_workers,
+                                          file_paths=self.file_paths + [update_file_path], upsert=True)
+            self.assertEqual((613, 5, 87, 2), counters)
+            self.assertEqual(519, len(rows))
+            rows = {row[0]: row for row in rows}
+            self.assertNotIn(10, rows)
+            self.assertIn(2000, rows)
+            self.assertEqual("abstract 5 from pubmed_update.xml", rows[5][1])
+            # without an update, the version of the publication found last is kept
+            self.assertEqual("abstract 105 from pubmed_1.xml", rows[105][1])
+
+    def test_ingest_xml_files_compact_schema(self):
+        """
+        Checks whether publications ingested into the compact schema read the same as in the plain schema, apart from
+        the year being an integer, and whether the full-text index follows the compressed abstracts.
+        """
+        update_file_path = self.tmp_path / "pubmed_update.xml"
+        create_xml_file(update_file_path, [5, 6, 2000], deleted_pmids=(10, 11, 3000))
+        file_paths = self.file_paths + [update_file_path]
+        plain_counters, plain_rows = self._ingest("plain.db", n_workers=1, file_paths=file_paths, upsert=True)
+        for n_workers in (1, 3):
+            db_conn = sqlite3.connect(self.tmp_path / f"compact_{n_workers}.db")
+            create_publication_tables(db_conn, compact=True)
+            create_publication_search_index(db_conn)
+            db_conn.close()
+            counters, rows = self._ingest(f"compact_{n_workers}.db", n_workers=n_workers, file_paths=file_paths,
+                                          upsert=True, compact=True)
+            self.assertEqual(plain_counters, counters)
+            self.assertEqual([row[:4] + (int(row[4]),) for row in plain_rows], rows)
+
+            db_conn = sqlite3.connect(self.tmp_path / f"compact_{n_workers}.db")
+            self.assertEqual(1, db_conn.execute("SELECT COUNT(*) FROM journals").fetchone()[0])
+            self.assertEqual(bytes, type(db_conn.execute("SELECT pub_abstract FROM publications").fetchone()[0]))
+            self.assertEqual(3, count_publications(db_conn, "pubmed_update"))
+            db_conn.close()
+
+    def test_migrate_to_compact_schema(self):
+        """
+        Checks whether a database in the plain schema is migrated to the compact schema with its full-text index and
+        whether further files can be ingested afterwards.
+        """
+        db_conn = sqlite3.connect(self.tmp_path / "migrate.db")
+        create_publication_tables(db_conn)
+        create_publication_search_index(db_conn)
+        db_conn.close()
+        _, plain_rows = self._ingest("migrate.db", n_workers=1, upsert=True)
+
+        db_conn = sqlite3.connect(self.tmp_path / "migrate.db")
+        self.assertEqual(520, migrate_to_compact_schema(db_conn))
+        self.assertEqual(0, migrate_to_compact_schema(db_conn))
+        self.assertEqual([row[:4] + (int(row[4]),) for row in plain_rows],
+                         [row for chunk in iterate_publications(db_conn, chunk_size=7) for row in chunk])
+        self.assertEqual(91, count_publications(db_conn, "pubmed_0"))
+        db_conn.close()
+
+        update_file_path = self.tmp_path / "pubmed_update.xml"
+        create_xml_file(update_file_path, [5, 2000], deleted_pmids=(10,))
+        self.assertEqual((2, 0, 1, 1), self._ingest("migrate.db", n_workers=1, file_paths=[update_file_path],
+                                                    upsert=True, compact=True)[0])
+        db_conn = sqlite3.connect(self.tmp_path / "migrate.db")
+        self.assertEqual(2, count_publications(db_conn, "pubmed_update"))
+        self.assertEqual(90, count_publications(db_conn, "pubmed_0"))
+        db_conn.close()
+
+    def test_ingest_xml_files_truncated_file(self):
+        """
+        Checks whether the publications of a truncated compressed file are committed up to the point the file could be
+        read, with the number of bytes read reported and the file marked as failed in the manifest.
+        """
+        file_path = self.tmp_path / "pubmed_truncated.xml"
+        create_xml_file(file_path, range(2000, 4000))
+        compressed = gzip.compress(file_path.read_bytes(), mtime=0)
+        truncated_path = self.tmp_path / "pubmed_truncated.xml.gz"
+        truncated_path.write_bytes(compressed[:len(compressed) // 2])
+        for n_workers in (1, 2):
+            db_name = f"truncated_{n_workers}.db"
+            metrics_file = self.tmp_path / f"truncated_{n_workers}.jsonl"
+            db_conn = sqlite3.connect(self.tmp_path / db_name)
+            create_publication_tables(db_conn)
+            db_conn.execute(SQL_CREATE_MANIFEST_TABLE)
+            with MetricsRecorder.open(metrics_file) as metrics:
+                counters = ingest_xml_files([truncated_path, self.file_paths[0]], db_conn, n_workers=n_workers,
+                                            batch_size=16, use_manifest=True, metrics=metrics)
+            statuses = dict(db_conn.execute("SELECT file_name, status FROM ingestion_manifest"))
+            n_rows = db_conn.execute("SELECT COUNT(*) FROM publications WHERE pmid >= 2000").fetchone()[0]
+            db_conn.close()
+
+            event = json.loads(metrics_file.read_text().splitlines()[0])
+            self.assertGreater(event['publications'], 0)
+            self.assertLess(event['publications'], 2000)
+            self.assertEqual(event['publications'], n_rows)
+            self.assertEqual(event['publications'] + 120, counters[0])
+            self.assertIn(f"after {event['error_offset']} bytes", event['error'])
+            self.assertGreater(event['error_offset'], 0)
+            self.assertEqual({"pubmed_truncated.xml.gz": "failed", "pubmed_0.xml": "completed"}, statuses)
+
+    def test_ingest_xml_files_no_files(self):
+        """
+        Checks whether an empty list of files can be passed safely.
+        """
+        self.assertEqual((0, 0, 0, 0), self._ingest("empty.db", n_workers=4, file_paths=[])[0])
+
+    def test_ingest_xml_files_metrics(self):
+        """
+        Checks whether an event with counters and timings is emitted for every file and a summary for the run, in a
+        serial as well as in a parallel run.
+        """
+        for n_workers in (1, 2):
+            metrics_file = self.tmp_path / f"metrics_{n_workers}.jsonl"
+            db_conn = sqlite3.connect(self.tmp_path / f"metrics_{n_workers}.db")
+            create_publication_tables(db_conn)
+            with MetricsRecorder.open(metrics_file, run="test") as metrics:
+                counters = ingest_xml_files(self.file_paths, db_conn, n_workers=n_workers, metrics=metrics)
+            db_conn.close()
+
+            events = [json.loads(line) for line in metrics_file.read_text().splitlines()]
+            self.assertEqual(["file"] * 6 + ["run"], [event['event'] for event in events])
+            files = events[:-1]
+            self.assertEqual([str(file_path) for file_path in self.file_paths], [event['file'] for event in files])
+            self.assertEqual(counters, tuple(sum(event[counter] for event in files) for counter in (
+                'publications', 'publications_incomplete', 'publications_duplicated', 'publications_deleted')))
+            errors = [(event['error'], event['error_offset']) for event in files if event['error'] is not None]
+            self.assertEqual(1, len(errors))
+            self.assertTrue(errors[0][0].startswith("Provided XML could not be parsed: "))
+            self.assertEqual(len("<PubmedArticle>"), self.file_paths[2].stat().st_size - errors[0][1])
+            self.assertEqual(self.file_paths[0].stat().st_size, files[0]['bytes_read'])
+            for stage in ('parse', 'extract', 'insert', 'commit'):
+                self.assertGreaterEqual(events[-1][f"{stage}_seconds"], 0)
+            self.assertGreater(events[-1]['parse_seconds'], 0)
+            self.assertEqual((6, 1, counters[0]), (events[-1]['files'], events[-1]['files_failed'],
+                                                   events[-1]['publications']))
+            self.assertGreater(files[0]['publications_per_second'], 0)
+            self.assertGreater(files[0]['worker_peak_rss_bytes'], 0)
+
+    def tearDown(self) -> None:
+        """
+        Removing the temporary folder with all test files and databases.
+        """
+        self.tmp_dir.cleanup()
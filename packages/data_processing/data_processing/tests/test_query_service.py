@@ -0,0 +1,169 @@
+import asyncio
+import http.client
+import json
+import sqlite3
+import tempfile
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from pathlib import Path
+
+from data_processing.annotate_text_data import LexiconAnnotator
+from data_processing.extract_publication_data import create_publication_tables
+from data_processing.query_service import QueryService
+from protein_score_utilities.protein_rankings import ProteinRankingCache
+from protein_score_utilities.publication_search import create_publication_search_index
+
+
+def setup_db_file(db_file):
+    """
+    Creates a database with 30 publications, of which every third mentions arthritis in the abstract, annotated with the
+    protein A in the publications mentioning arthritis and the protein B in every second publication, and creates the
+    full-text index.
+    :param db_file: path to the database file
+    :type db_file: Path
+    """
+    db_conn = sqlite3.connect(db_file)
+    create_publication_tables(db_conn)
+    db_conn.executemany("INSERT INTO publications(pmid,pub_abstract,title,journal,pub_year) VALUES(?,?,?,?,?)", [
+        (pmid, f"abstract {pmid} on {'arthritis' if pmid % 3 == 0 else 'diabetes'}", f"title {pmid}", "journal",
+         "2020") for pmid in range(1, 31)])
+    db_conn.execute("CREATE TABLE annotations (pmid integer, entity_id text, entity_type text)")
+    db_conn.executemany("INSERT INTO annotations VALUES (?,?,?)",
+                        [(pmid, "A", "protein") for pmid in range(3, 31, 3)] +
+                        [(pmid, "B", "protein") for pmid in range(2, 31, 2)])
+    create_publication_search_index(db_conn)
+    db_conn.commit()
+    db_conn.close()
+
+
+class TestQueryService(TestCase):
+    """
+    All tests relating to :mod:~`data_processing.query_service` in the data_processing package, run against the service
+    listening on localhost.
+    """
+    def setUp(self) -> None:
+        """
+        Starting the service on a free port with an event loop running in a background thread.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        db_file = Path(self.tmp_dir.name) / "publications.db"
+        setup_db_file(db_file)
+        self.service = QueryService(db_file, n_connections=3, stream_batch_size=3,
+                                    ranking_cache=ProteinRankingCache(Path(self.tmp_dir.name) / "cache.db"),
+                                    annotator=LexiconAnnotator({"tumor necrosis factor": "P01375", "TNF": "P01375"}))
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.host, self.port = asyncio.run_coroutine_threadsafe(self.service.start('127.0.0.1', 0), self.loop).result()
+
+    def _get(self, path: str, connection: http.client.HTTPConnection = None):
+        """
+        Sends a GET request and returns the status, the headers and the decoded JSON of the response.
+        """
+        connection = connection or http.client.HTTPConnection(self.host, self.port, timeout=10)
+        connection.request("GET", path)
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), json.loads(response.read())
+
+    def test_health_and_publication(self):
+        """
+        Checks whether the health endpoint reports the content version and publications are looked up by PMID.
+        """
+        status, _, content = self._get("/health")
+        self.assertEqual((200, "ok", 3), (status, content['status'], content['connections']))
+        self.assertEqual(16, len(content['content_version']))
+        status, _, publication = self._get("/publications/7")
+        self.assertEqual(200, status)
+        self.assertEqual({'pmid': 7, 'abstract': "abstract 7 on diabetes", 'title': "title 7", 'journal': "journal",
+                          'pub_year': "2020"}, publication)
+        self.assertEqual(404, self._get("/publications/99")[0])
+
+    def test_errors(self):
+        """
+        Checks whether invalid requests are answered with an error status and message.
+        """
+        for path, status in (("/publications/abc", 400), ("/unknown", 404), ("/search", 400),
+                             ("/search?q=arthritis&limit=0", 400), ("/rankings?disease=arthritis&method=unknown", 400),
+                             ("/rankings", 400)):
+            response_status, _, content = self._get(path)
+            self.assertEqual(status, response_status, path)
+            self.assertIn('error', content)
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=10)
+        connection.request("POST", "/search", body=b"{}")
+        self.assertEqual(405, connection.getresponse().status)
+
+    def test_search_streamed(self):
+        """
+        Checks whether search results are streamed in chunks, also for searches without limit and without results,
+        over a connection kept alive.
+        """
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=10)
+        status, headers, results = self._get("/search?q=arthritis&limit=all", connection)
+        self.assertEqual(200, status)
+        self.assertEqual("chunked", headers['Transfer-Encoding'])
+        self.assertEqual(list(range(3, 31, 3)), sorted(result['pmid'] for result in results))
+        self.assertEqual(2, len(self._get("/search?q=arthritis&limit=2", connection)[2]))
+        self.assertEqual(20, len(self._get("/search?q=arthritis&q=diabetes", connection)[2]))
+        self.assertEqual([], self._get("/search?q=cancer", connection)[2])
+
+    def test_rankings_cached(self):
+        """
+        Checks whether the proteins are ranked for a disease term and repeated requests are answered from the cache.
+        """
+        status, _, content = self._get("/rankings?disease=arthritis&k=5")
+        self.assertEqual(200, status)
+        self.assertEqual(["A"], [protein['protein_id'] for protein in content['proteins']])
+        self.assertEqual(content, self._get("/rankings?disease=arthritis&k=5")[2])
+        self.assertEqual((1, 1), (self.service.ranking_cache.hits, self.service.ranking_cache.misses))
+
+    def test_annotate(self):
+        """
+        Checks whether the proteins mentioned in a text are found with the lexicon of the service.
+        """
+        status, _, content = self._get("/annotate?text=Role%20of%20tumor%20necrosis%20factor%20in%20arthritis")
+        self.assertEqual(200, status)
+        self.assertEqual([{'start': 8, 'end': 29, 'text': "tumor necrosis factor", 'entity_ids': ["P01375"]}],
+                         content['mentions'])
+
+    def test_handler_error(self):
+        """
+        Checks whether an unexpected error raised by an endpoint is answered with the status 500, keeping the
+        connection usable for further requests.
+        """
+        def fail(*args):
+            raise RuntimeError("scoring failed")
+
+        self.service.ranking_cache.top_proteins = fail
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=10)
+        with self.assertLogs('data_processing.query_service', level='ERROR'):
+            status, _, content = self._get("/rankings?disease=arthritis", connection)
+        self.assertEqual(500, status)
+        self.assertIn("scoring failed", content['error'])
+        self.assertEqual(200, self._get("/health", connection)[0])
+
+    def test_concurrent_requests(self):
+        """
+        Checks whether many clients are answered concurrently with consistent results, where there are more clients than
+        connections to the database.
+        """
+        paths = ["/search?q=arthritis&limit=all", "/publications/12", "/rankings?disease=diabetes", "/health"] * 25
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            responses = list(executor.map(self._get, paths))
+        self.assertEqual({200}, set(status for status, _, _ in responses))
+        for path in set(paths[:3]):
+            self.assertEqual(1, len(set(json.dumps(content) for (_, _, content), request_path in zip(responses, paths)
+                                        if request_path == path)))
+        self.assertGreaterEqual(self.service.requests_served, len(paths))
+
+    def tearDown(self) -> None:
+        """
+        Stopping the service and the event loop.
+        """
+        asyncio.run_coroutine_threadsafe(self.service.close(), self.loop).result()
+        self.service.ranking_cache.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.tmp_dir.cleanup()
@@ -0,0 +1,54 @@
+import gzip
+import sqlite3
+import tempfile
+
+from unittest import TestCase
+from pathlib import Path
+
+from data_processing.extract_publication_data import create_publication_tables
+from data_processing.ingest_publication_data import ingest_xml_files
+from data_processing.synthetic_pubmed import write_synthetic_pubmed_xml
+
+
+class TestSyntheticPubmed(TestCase):
+    """
+    All tests relating to :mod:~`data_processing.synthetic_pubmed` in the data_processing package.
+    """
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp_dir.name)
+
+    def test_deterministic(self):
+        """
+        Checks whether the same settings result in the same file, also gzip compressed, and another seed does not.
+        """
+        settings = dict(n_articles=50, abstract_words=40, n_items=3, duplicate_rate=0.1, missing_rate=0.1)
+        write_synthetic_pubmed_xml(self.tmp_path / "a.xml", **settings)
+        write_synthetic_pubmed_xml(self.tmp_path / "b.xml.gz", **settings)
+        write_synthetic_pubmed_xml(self.tmp_path / "c.xml.gz", **settings)
+        write_synthetic_pubmed_xml(self.tmp_path / "d.xml", seed=7, **settings)
+        content = (self.tmp_path / "a.xml").read_bytes()
+        self.assertEqual(content, gzip.decompress((self.tmp_path / "b.xml.gz").read_bytes()))
+        self.assertEqual((self.tmp_path / "b.xml.gz").read_bytes(), (self.tmp_path / "c.xml.gz").read_bytes())
+        self.assertNotEqual(content, (self.tmp_path / "d.xml").read_bytes())
+
+    def test_expected_counters(self):
+        """
+        Checks whether the counters returned match the ones of an ingestion into an empty database.
+        """
+        complete_pmids = set()
+        expected = write_synthetic_pubmed_xml(self.tmp_path / "update.xml.gz", 500, abstract_words=30,
+                                              duplicate_rate=0.1, missing_rate=0.05, first_pmid=1000,
+                                              deleted_pmids=(1000, 1001, 1002, 5), complete_pmids=complete_pmids)
+        self.assertEqual(500, expected[0])
+        self.assertGreater(expected[1], 10)
+        self.assertGreater(expected[2], 30)
+        db_conn = sqlite3.connect(self.tmp_path / "synthetic.db")
+        create_publication_tables(db_conn)
+        self.assertEqual(expected, ingest_xml_files([self.tmp_path / "update.xml.gz"], db_conn))
+        stored_pmids = set(pmid for pmid, in db_conn.execute("SELECT pmid FROM publications"))
+        db_conn.close()
+        self.assertEqual(complete_pmids - {1000, 1001, 1002}, stored_pmids)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
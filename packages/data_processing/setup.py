@@ -8,4 +8,7 @@ setup(
     url="https://github.com/AnikaC-git/Protein_score_mining",
     packages=find_packages(),
     python_requires='>=3.8',
+    entry_points={
+        'console_scripts': ['pubmed-data-processing=data_processing.cli:main'],
+    },
 )
@@ -1,75 +1,172 @@
 """
 Functionality interact with SQLite database where extracted data from articles will be stored into. For the moment,
 the module contains functionality to connect to a database, create tables, delete table content and insert data into
-tables.
+tables, either one record at a time or in bulk through :class:~`BulkInsertWriter`. Errors of the database are raised as
+:class:~`sqlite3.Error`, so that the calling code can decide how they are handled.
+
+The publications can also be stored in a compact schema, where the journals are held in a separate table, the year is
+an integer and the abstracts are compressed (zlib, or zstd if the zstandard package is installed). The accessor
+functions :func:~`get_publication` and :func:~`iterate_publications` as well as :func:~`decompress_text` return the
+publications in the same form for both schemas.
 """
 
 import sqlite3 as sl3
-import sys
+import time
+import zlib
+from contextlib import contextmanager
+from functools import lru_cache
+
+# number of rows passed to a single executemany call
+DEFAULT_INSERT_BATCH_SIZE = 5000
+# number of rows written within one transaction before it is committed
+DEFAULT_TRANSACTION_SIZE = 50000
+
+DEFAULT_COMPRESSION_CODEC = 'zlib'
+# compressed values are recognised by their first bytes, zlib streams start with 0x78 for the default window size
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# number of publications read at once by :func:~`iterate_publications`
+DEFAULT_READ_CHUNK_SIZE = 2000
 
+# pragmas applied by :func:~`create_database_connection` for each profile, cache_size is given in KiB if negative and
+# timeout is the number of seconds a connection waits for a lock held by another connection
+CONNECTION_PROFILES = {
+    'default': {},
+    'bulk_load': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -512 * 1024,
+        'mmap_size': 1 << 30,
+        'temp_store': 'MEMORY',
+        'timeout': 60.0,
+    },
+    'read_mostly': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -128 * 1024,
+        'mmap_size': 1 << 30,
+        'temp_store': 'MEMORY',
+        'timeout': 30.0,
+    },
+}
 
-def create_database_connection(db_file):
+
+def create_database_connection(db_file, profile: str = 'default', read_only: bool = False,
+                               check_same_thread: bool = True, **pragmas):
     """
-    Creates a connection to a database file and returns the connector. Should an error be an encountered while trying
-    to connect to the database, the program is aborted.
+    Creates a connection to a database file and returns the connector, tuned with the pragmas of the given profile
+    (see :data:~`CONNECTION_PROFILES`):
+
+    * 'default' keeps the settings of SQLite,
+    * 'bulk_load' is meant for the single process writing large amounts of data, e.g. while ingesting Pubmed files; it
+      does not wait for data to reach the disk (a crash of the machine, not of the process, can corrupt the database)
+      and uses a large page cache,
+    * 'read_mostly' is meant for processes querying the database while another process may be writing to it.
+
+    Both tuned profiles switch the database to write-ahead logging, so that readers do not block the writer and the
+    writer does not block readers.
 
     :param db_file: file path to the database file that a connection should be established to
     :type db_file: str or Path
+    :param profile: name of the connection profile
+    :type profile: str
+    :param read_only: whether the database is opened read-only; the file needs to exist
+    :type read_only: bool
+    :param check_same_thread: whether the connection may only be used by the thread that created it; connections
+        shared between threads, e.g. in a pool, need to be used by one thread at a time
+    :type check_same_thread: bool
+    :param pragmas: further pragmas overriding the ones of the profile, e.g. journal_mode='OFF'
     :return: connector to database
-    :rtype: connector
+    :rtype: sqlite3.Connection
+    :raises ValueError: if the profile is unknown
+    :raises sqlite3.Error: if the database cannot be opened or a pragma cannot be applied
     """
+    from pathlib import Path
 
     try:
-        conn = sl3.connect(db_file)
-        return conn
-    except sl3.Error as e:
-        print(e)
-        sys.exit()
+        settings = dict(CONNECTION_PROFILES[profile])
+    except KeyError:
+        raise ValueError(f"Unknown connection profile '{profile}', expected one of {', '.join(CONNECTION_PROFILES)}.")
+    settings.update(pragmas)
+    timeout = settings.pop('timeout', 5.0)
+
+    if read_only:
+        conn = sl3.connect(Path(db_file).resolve().as_uri() + "?mode=ro", uri=True, timeout=timeout,
+                           check_same_thread=check_same_thread)
+        # the journal mode can only be changed by connections allowed to write
+        settings.pop('journal_mode', None)
+    else:
+        conn = sl3.connect(db_file, timeout=timeout, check_same_thread=check_same_thread)
+    try:
+        for pragma, value in settings.items():
+            conn.execute(f"PRAGMA {pragma}={value}")
+    except sl3.Error:
+        conn.close()
+        raise
+    return conn
 
 
 def create_table(db_conn, create_table_sql: str):
     """
-    Creates a table in the database to which a connection has been established before. Should an error be encountered
-    while trying to create the table, the program is aborted.
+    Creates a table (or index, view, ...) in the database to which a connection has been established before.
 
     :param db_conn: connection to the database extracted publication information should be written to
     :type db_conn: sqlite3.Connection
     :param create_table_sql: SQL statement for generating table
     :type create_table_sql: str
+    :raises sqlite3.Error: if the table cannot be created
     """
-    try:
-        c = db_conn.cursor()
-        c.execute(create_table_sql)
-    except sl3.Error as e:
-        print(e)
-        db_conn.close()
-        sys.exit()
+    db_conn.execute(create_table_sql)
 
 
 def delete_table_content(db_conn, table_name: str):
     """
-    Deletes the content of a database table, e.g. when the data should be extracted afresh. Should an error be an
-    encountered while trying to erase the content of the table, the program is aborted.
+    Deletes the content of a database table, e.g. when the data should be extracted afresh.
 
     :param db_conn: connection to the database extracted publication information should be written to
     :type db_conn: sqlite3.Connection
     :param table_name: name of the table of which content should be deleted
     :type table_name: str
+    :raises sqlite3.Error: if the content of the table cannot be deleted
+    """
+    db_conn.execute(f"DELETE FROM {table_name}")
+
+
+@contextmanager
+def deferred_indexes(db_conn, table_names):
     """
+    Context manager dropping the secondary indexes of the given tables for the duration of a bulk load and creating
+    them again at the end, which is considerably faster than maintaining them for every row inserted. The indexes are
+    created again also if the load fails, after the transaction still open has been rolled back.
 
+    :param db_conn: connection to the database holding the tables
+    :type db_conn: sqlite3.Connection
+    :param table_names: names of the tables whose indexes are deferred
+    :type table_names: iterable
+    :return: names of the indexes deferred
+    :rtype: list
+    """
+    table_names = list(table_names)
+    # indexes without SQL are the ones SQLite creates for primary keys and unique constraints
+    indexes = db_conn.execute(f"SELECT name, sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL AND "
+                              f"tbl_name IN ({','.join('?' for _ in table_names)})", table_names).fetchall()
+    for name, _ in indexes:
+        db_conn.execute(f"DROP INDEX {name}")
+    db_conn.commit()
     try:
-        c = db_conn.cursor()
-        c.execute(f"DELETE FROM {table_name}")
-    except sl3.Error as e:
-        print(e)
-        db_conn.close()
-        sys.exit()
+        yield [name for name, _ in indexes]
+    except BaseException:
+        db_conn.rollback()
+        raise
+    finally:
+        for _, sql in indexes:
+            db_conn.execute(sql)
+        db_conn.commit()
 
 
 def execute_insert_statement(db_conn, stm: str, data: tuple):
     """
-    Inserts data into a table based on the insert statement and data provided. Should an error other than
-    IntegrityErrors (e.g. through duplicated primary keys be encountered), the program will be aborted.
+    Inserts data into a table based on the insert statement and data provided. For inserting a larger number of
+    records, :class:~`BulkInsertWriter` should be used instead.
 
     :param db_conn: connection to database file
     :type db_conn: sqlite3.Connection
@@ -77,19 +174,360 @@ def execute_insert_statement(db_conn, stm: str, data: tuple):
     :type stm: str
     :param data: tuple containing data to be inserted into statement and consequently database
     :type data: tuple
+    :return: True if the record was inserted, False if it violated a constraint (e.g. duplicated primary key)
+    :rtype: bool
+    :raises sqlite3.Error: if the record cannot be inserted for other reasons than a violated constraint
     """
 
     try:
         c = db_conn.cursor()
         c.execute(stm, data)
+        return True
     except sl3.IntegrityError as e:
         # errors are raised when an entry is attempted with an already existing primary key
         # todo: this is at the moment to support import to continue with existing data issues; going forward better
         #  handling of the data issues should be decided after investigation
-        print(stm)
-        print(data)
-        pass
-    except sl3.Error as e:
-        print(e)
-        db_conn.close()
-        sys.exit()
+        return False
+
+
+class BulkInsertWriter:
+    """
+    Writer that buffers rows destined for one table and inserts them with executemany, which is considerably faster
+    than inserting one row at a time. The rows are written within explicit transactions that are committed once the
+    configured number of rows has been written, as well as when the writer is closed. Rows conflicting with an existing
+    primary key or unique constraint are either ignored (``on_conflict='ignore'``) or update the existing row
+    (``on_conflict='update'``); in both cases they are counted as duplicates. Rows can also be deleted in bulk by their
+    key, where the deletion is applied after all rows added before. Besides the number of rows, the writer records the
+    seconds spent writing rows and committing transactions.
+
+    The writer can be used as context manager, in which case it is closed at the end of the block. Should an exception
+    be raised within the block, the transaction that is still open is rolled back instead.
+    """
+
+    def __init__(self, db_conn, table_name: str, columns: tuple, batch_size: int = DEFAULT_INSERT_BATCH_SIZE,
+                 transaction_size: int = DEFAULT_TRANSACTION_SIZE, on_conflict: str = 'ignore',
+                 conflict_columns: tuple = None):
+        """
+        Setting up the insert statement for the table and the counters.
+
+        :param db_conn: connection to the database the rows should be written to
+        :type db_conn: sqlite3.Connection
+        :param table_name: name of the table the rows should be written to
+        :type table_name: str
+        :param columns: names of the columns in the order of the values of each row
+        :type columns: tuple
+        :param batch_size: number of rows that are buffered before they are inserted with executemany
+        :type batch_size: int
+        :param transaction_size: number of rows after which the transaction is committed
+        :type transaction_size: int
+        :param on_conflict: either 'ignore' to skip rows violating a constraint or 'update' to overwrite existing rows
+        :type on_conflict: str
+        :param conflict_columns: columns of the primary key or unique constraint, required for on_conflict 'update'
+        :type conflict_columns: tuple
+        """
+        self.db_conn = db_conn
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.transaction_size = transaction_size
+        self.on_conflict = on_conflict
+
+        placeholders = ",".join("?" for _ in columns)
+        if on_conflict == 'ignore':
+            self.statement = f"INSERT OR IGNORE INTO {table_name}({','.join(columns)}) VALUES({placeholders})"
+        elif on_conflict == 'update':
+            if not conflict_columns:
+                raise ValueError("Conflict columns need to be provided to update existing rows.")
+            updates = ",".join(f"{c}=excluded.{c}" for c in columns if c not in conflict_columns)
+            self.statement = f"INSERT INTO {table_name}({','.join(columns)}) VALUES({placeholders}) " \
+                             f"ON CONFLICT({','.join(conflict_columns)}) DO UPDATE SET {updates}"
+        else:
+            raise ValueError(f"Unknown conflict handling '{on_conflict}', expected 'ignore' or 'update'.")
+
+        # key column and its position within the rows to count the rows updating an existing row
+        self._key_column = conflict_columns[0] if on_conflict == 'update' and len(conflict_columns) == 1 else None
+        self._key_index = columns.index(self._key_column) if self._key_column is not None else None
+
+        self._buffer = []
+        self._rows_in_transaction = 0
+
+        # counters for summary stats
+        self.rows_received = 0
+        self.rows_written = 0
+        self.rows_duplicated = 0
+        self.rows_deleted = 0
+        self.seconds_inserting = 0.0
+        self.seconds_committing = 0.0
+
+    def add(self, row: tuple):
+        """
+        Adds a row to the buffer, which is written to the database once the batch size is reached.
+
+        :param row: values of the row in the order of the columns
+        :type row: tuple
+        """
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def add_many(self, rows):
+        """
+        Adds multiple rows to the buffer, see :meth:~`add`. The rows are added at once, so that the batch written can
+        exceed the batch size by the number of rows added.
+
+        :param rows: iterable of rows with values in the order of the columns
+        :type rows: iterable
+        """
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all buffered rows to the database with executemany. A transaction is opened if none is open yet and is
+        committed once the transaction size is reached.
+        """
+        if not self._buffer:
+            return
+
+        start = time.perf_counter()
+        if not self.db_conn.in_transaction:
+            self.db_conn.execute("BEGIN")
+        n_rows = len(self._buffer)
+        if self._key_index is not None:
+            # every row that does not add a new key updates an existing row
+            keys = {row[self._key_index] for row in self._buffer}
+            self.rows_duplicated += n_rows - len(keys) + self._count_existing_keys(keys)
+        cur = self.db_conn.executemany(self.statement, self._buffer)
+        self.rows_received += n_rows
+        self.rows_written += cur.rowcount
+        if self.on_conflict == 'ignore':
+            self.rows_duplicated += n_rows - cur.rowcount
+        self._rows_in_transaction += n_rows
+        self._buffer = []
+        self.seconds_inserting += time.perf_counter() - start
+
+        if self._rows_in_transaction >= self.transaction_size:
+            self.commit()
+
+    def _count_existing_keys(self, keys: set):
+        """
+        Counts how many of the given keys already exist in the table.
+
+        :param keys: distinct keys to be looked up
+        :type keys: set
+        :return: number of keys found in the table
+        :rtype: int
+        """
+        keys = list(keys)
+        count = 0
+        # the number of parameters per statement is limited in older SQLite versions
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            count += self.db_conn.execute(f"SELECT COUNT(*) FROM {self.table_name} WHERE {self._key_column} IN "
+                                          f"({','.join('?' for _ in chunk)})", chunk).fetchone()[0]
+        return count
+
+    def delete(self, key_column: str, keys):
+        """
+        Deletes all rows whose key is among the keys provided. Rows still buffered are written before, so that rows
+        added before are deleted as well.
+
+        :param key_column: name of the column the keys refer to
+        :type key_column: str
+        :param keys: keys of the rows to be deleted
+        :type keys: iterable
+        :return: number of rows deleted
+        :rtype: int
+        """
+        self.flush()
+        keys = [(key,) for key in keys]
+        if not keys:
+            return 0
+
+        start = time.perf_counter()
+        if not self.db_conn.in_transaction:
+            self.db_conn.execute("BEGIN")
+        cur = self.db_conn.executemany(f"DELETE FROM {self.table_name} WHERE {key_column}=?", keys)
+        self.rows_deleted += cur.rowcount
+        self.seconds_inserting += time.perf_counter() - start
+        self._rows_in_transaction += len(keys)
+        if self._rows_in_transaction >= self.transaction_size:
+            self.commit()
+        return cur.rowcount
+
+    def commit(self):
+        """
+        Writes all buffered rows and commits the open transaction.
+        """
+        if self._buffer:
+            # flush commits itself if the transaction size is reached
+            self.flush()
+        if self.db_conn.in_transaction:
+            start = time.perf_counter()
+            self.db_conn.commit()
+            self.seconds_committing += time.perf_counter() - start
+        self._rows_in_transaction = 0
+
+    def close(self):
+        """
+        Writes all buffered rows and commits the open transaction. The connection to the database is kept open.
+        """
+        self.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._buffer = []
+            self.db_conn.rollback()
+        return False
+
+
+@lru_cache(maxsize=None)
+def _zstd_compressor(level: int):
+    import zstandard
+    return zstandard.ZstdCompressor(level=level)
+
+
+@lru_cache(maxsize=None)
+def _zstd_decompressor():
+    import zstandard
+    return zstandard.ZstdDecompressor()
+
+
+def _compress_zlib(data: bytes, level: int = None):
+    return zlib.compress(data, 6 if level is None else level)
+
+
+def _compress_zstd(data: bytes, level: int = None):
+    return _zstd_compressor(3 if level is None else level).compress(data)
+
+
+# compression functions by the name of the codec, taking the data and the compression level (None for the default)
+COMPRESSION_CODECS = {
+    'zlib': _compress_zlib,
+    'zstd': _compress_zstd,
+}
+
+
+def compress_text(text: str, codec: str = DEFAULT_COMPRESSION_CODEC, level: int = None):
+    """
+    Compresses a text, e.g. an abstract, for storage in a BLOB column.
+
+    :param text: text to be compressed
+    :type text: str
+    :param codec: name of the codec, either 'zlib' or 'zstd' (requires the zstandard package)
+    :type codec: str
+    :param level: compression level, None for the default of the codec
+    :type level: int
+    :return: compressed UTF-8 encoded text, None if no text was provided
+    :rtype: bytes
+    """
+    if text is None:
+        return None
+    try:
+        compress = COMPRESSION_CODECS[codec]
+    except KeyError:
+        raise ValueError(f"Unknown compression codec '{codec}', expected one of {', '.join(COMPRESSION_CODECS)}.")
+    return compress(text.encode("UTF-8"), level)
+
+
+def decompress_text(value):
+    """
+    Returns the text of a value read from a text column that may be compressed. Texts that are not compressed are
+    returned unchanged, so that the function can be applied to columns of both the plain and the compact schema.
+
+    :param value: value as read from the database
+    :type value: str or bytes
+    :return: decompressed text
+    :rtype: str
+    """
+    if not isinstance(value, bytes):
+        return value
+    if value[:4] == _ZSTD_MAGIC:
+        return _zstd_decompressor().decompress(value).decode("UTF-8")
+    return zlib.decompress(value).decode("UTF-8")
+
+
+def register_compression_functions(db_conn, codec: str = DEFAULT_COMPRESSION_CODEC):
+    """
+    Registers the SQL functions compress_text and decompress_text with the connection, which are needed by statements
+    (e.g. triggers and views) working on compressed columns.
+
+    :param db_conn: connection to the database
+    :type db_conn: sqlite3.Connection
+    :param codec: codec used by compress_text
+    :type codec: str
+    """
+    db_conn.create_function("compress_text", 1, lambda text: compress_text(text, codec), deterministic=True)
+    db_conn.create_function("decompress_text", 1, decompress_text, deterministic=True)
+
+
+def has_compact_publication_schema(db_conn):
+    """
+    Checks whether the table publications uses the compact schema, i.e. refers to the table journals.
+
+    :param db_conn: connection to the database
+    :type db_conn: sqlite3.Connection
+    :return: True if the compact schema is used, otherwise False
+    :rtype: bool
+    """
+    return any(row[1] == 'journal_id' for row in db_conn.execute("PRAGMA table_info(publications)"))
+
+
+def _publication_select_sql(db_conn):
+    """
+    Returns the select statement for the columns PMID, abstract, title, journal and publication year matching the
+    schema of the database.
+    """
+    if has_compact_publication_schema(db_conn):
+        return "SELECT p.pmid, p.pub_abstract, p.title, j.journal, p.pub_year FROM publications p " \
+               "JOIN journals j ON j.journal_id = p.journal_id"
+    return "SELECT p.pmid, p.pub_abstract, p.title, p.journal, p.pub_year FROM publications p"
+
+
+def get_publication(db_conn, pmid: int):
+    """
+    Reads a publication with its abstract decompressed and its journal resolved, whatever the schema of the database.
+
+    :param db_conn: connection to the database holding the table publications
+    :type db_conn: sqlite3.Connection
+    :param pmid: PMID of the publication
+    :type pmid: int
+    :return: PMID, abstract, title, journal and publication year of the publication, None if it does not exist
+    :rtype: tuple
+    """
+    row = db_conn.execute(_publication_select_sql(db_conn) + " WHERE p.pmid=?", (pmid,)).fetchone()
+    if row is None:
+        return None
+    return row[0], decompress_text(row[1]), row[2], row[3], row[4]
+
+
+def iterate_publications(db_conn, chunk_size: int = DEFAULT_READ_CHUNK_SIZE, after_pmid: int = None):
+    """
+    Generator reading all publications ordered by PMID in chunks, with the abstracts decompressed and the journals
+    resolved, whatever the schema of the database. Each chunk is read with a separate query starting after the last
+    PMID of the previous chunk, so that only one chunk is held in memory at a time.
+
+    :param db_conn: connection to the database holding the table publications
+    :type db_conn: sqlite3.Connection
+    :param chunk_size: number of publications per chunk
+    :type chunk_size: int
+    :param after_pmid: only publications with a PMID larger than this are read, None to start at the beginning
+    :type after_pmid: int
+    :return: generator of lists of tuples of PMID, abstract, title, journal and publication year
+    :rtype: generator
+    """
+    stm = _publication_select_sql(db_conn) + " WHERE p.pmid > ? ORDER BY p.pmid LIMIT ?"
+    last_pmid = after_pmid if after_pmid is not None else -1
+    while True:
+        chunk = db_conn.execute(stm, (last_pmid, chunk_size)).fetchall()
+        if not chunk:
+            return
+        yield [(pmid, decompress_text(abstract), title, journal, year)
+               for pmid, abstract, title, journal, year in chunk]
+        last_pmid = chunk[-1][0]
+
@@ -1,35 +1,158 @@
 """
 Convenience functions in relation to identifying relevant files, reading config file and file handling in general.
+Compressed files, as e.g. distributed by Pubmed, can be read as stream without decompressing them to disk first. A
+decompressor is chosen based on the file extension, where further decompressors can be added through
+:func:~`register_decompressor`.
 """
 
 
-def read_config(config: str):
+def _open_gzip(file_path):
+    """
+    Opens a gzip compressed file as binary stream of the decompressed content.
+    """
+    import gzip
+    return gzip.open(file_path, 'rb')
+
+
+def _open_bz2(file_path):
+    """
+    Opens a bz2 compressed file as binary stream of the decompressed content.
+    """
+    import bz2
+    return bz2.open(file_path, 'rb')
+
+
+def _open_xz(file_path):
+    """
+    Opens a xz compressed file as binary stream of the decompressed content.
+    """
+    import lzma
+    return lzma.open(file_path, 'rb')
+
+
+# functions opening a compressed file as binary stream of the decompressed content, keyed by the file extension
+DECOMPRESSORS = {
+    '.gz': _open_gzip,
+    '.bz2': _open_bz2,
+    '.xz': _open_xz,
+}
+
+
+def register_decompressor(extension: str, opener):
+    """
+    Registers a function that opens compressed files with the given file extension, so that such files are identified
+    by :func:~`read_xml_file_names` and decompressed on the fly by :func:~`open_data_file`.
+
+    The registration only applies to the calling process. The ingestion hands the registered decompressors over to its
+    worker processes, which requires the opener to be picklable, i.e. a function defined at module level, as workers
+    started with spawn or forkserver (the default on macOS and Windows) do not inherit the registration.
+
+    :param extension: file extension of the compressed files including the leading dot, e.g. ".zst"
+    :type extension: str
+    :param opener: function taking the file path and returning a binary file object of the decompressed content
+    :type opener: callable
+    """
+    DECOMPRESSORS[extension] = opener
+
+
+def open_data_file(file_path):
+    """
+    Opens a data file for reading in binary mode. Should the file extension belong to a registered decompressor, the
+    file is decompressed on the fly while being read.
+
+    :param file_path: path to the file to be opened
+    :type file_path: str or Path
+    :return: binary file object providing the (decompressed) content of the file
+    :rtype: file object
+    """
+    from pathlib import Path
+    opener = DECOMPRESSORS.get(Path(file_path).suffix)
+    if opener is not None:
+        return opener(file_path)
+    return open(file_path, 'rb')
+
+
+# settings every run relies on, with the type expected and the default used if a setting is missing from the config file
+CONFIG_SCHEMA = {
+    'data_raw': (str, 'data/raw/'),
+    'data_processed': (str, 'data/processed/'),
+    'db_file': (str, 'publication_data.sql'),
+    'database_rewrite': (bool, False),
+}
+# settings of CONFIG_SCHEMA naming folders, which file names are appended to
+_FOLDER_SETTINGS = ('data_raw', 'data_processed')
+
+
+def validate_config(config, schema: dict = None):
+    """
+    Validates the settings read from a config file against a schema, adding the default of every setting missing. The
+    folders data_raw and data_processed are completed by a trailing slash, as file names are appended to them.
+
+    :param config: settings read from the config file, None for an empty file
+    :type config: dict
+    :param schema: type and default for each setting validated, :data:~`CONFIG_SCHEMA` if None
+    :type schema: dict
+    :return: Dictionary containing the validated settings as well as all further settings of the config file.
+    :rtype: dict
+    :raises ValueError: if the config file does not hold a mapping of settings or a setting is of the wrong type
+    """
+    if config is None:
+        config = {}
+    if not isinstance(config, dict):
+        raise ValueError(f"Config file needs to hold a mapping of settings, got {type(config).__name__}.")
+    validated = dict(config)
+    for key, (expected_type, default) in (schema or CONFIG_SCHEMA).items():
+        value = validated.get(key)
+        if value is None:
+            validated[key] = default
+        # booleans are integers in Python, but not a valid value for any other type of setting
+        elif not isinstance(value, expected_type) or (isinstance(value, bool) and expected_type is not bool):
+            raise ValueError(f"Setting '{key}' needs to be of type {expected_type.__name__}, "
+                             f"got {type(value).__name__} ({value!r}).")
+    for key in _FOLDER_SETTINGS:
+        if key in validated and isinstance(validated[key], str) and not validated[key].endswith('/'):
+            validated[key] += '/'
+    return validated
+
+
+def read_config(config: str, schema: dict = None):
     """
     Reads parameter settings required for operation from config file. Config file format is expected to be in yaml file
-    format.
+    format. The file is parsed with the libyaml based loader if PyYAML was built with it, which is considerably faster
+    than the pure Python loader, and the settings are validated once by :func:~`validate_config`.
 
     :param config: Path to config file provided as string.
     :type config: str
+    :param schema: type and default for each setting validated, :data:~`CONFIG_SCHEMA` if None
+    :type schema: dict
     :return: Dictionary containing parameter settings for operation.
     :rtype: dict
+    :raises ValueError: if the config file is not valid yaml or a setting is of the wrong type
     """
 
     import yaml
-    # todo: more elaborate error handling needed if file parser raises error
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
     with open(config) as file:
-        # loader returns dictionary of settings specified in config file
-        return yaml.load(file, Loader=yaml.FullLoader)
+        try:
+            # loader returns dictionary of settings specified in config file
+            settings = yaml.load(file, Loader=loader)
+        except yaml.YAMLError as error:
+            raise ValueError(f"Config file {config} could not be parsed: {error}") from error
+    return validate_config(settings, schema)
 
 
 def read_xml_file_names(xml_folder: str):
     """
     Function to read names of XML files in specified folder. Convenience function to process multiple XML files at once.
+    Compressed XML files, e.g. ending in ".xml.gz", are included if a decompressor for the extension is registered.
 
-    :param xml_folder: Folder assumed to hold XML files, with file names ending in .xml.
+    :param xml_folder: Folder assumed to hold XML files, with file names ending in .xml or e.g. .xml.gz.
     :type xml_folder: str
-    :return: A list of file names ending in ".xml" in the specified folder.
+    :return: A list of file names ending in ".xml" or ".xml" followed by a registered compression extension in the
+        specified folder.
     :rtype: list
     """
 
     from pathlib import Path
-    return [x for x in Path(xml_folder).iterdir() if x.is_file() and str(x).endswith(".xml")]
+    extensions = tuple([".xml"] + [".xml" + extension for extension in DECOMPRESSORS])
+    return [x for x in Path(xml_folder).iterdir() if x.is_file() and str(x).endswith(extensions)]
@@ -0,0 +1,286 @@
+"""
+Query layer returning the proteins ranked highest for a disease term, scored as in
+:mod:~`protein_score_utilities.protein_scoring`, so that the rankings analysts ask for repeatedly are computed once
+rather than for every request. A :class:~`ProteinRankingCache` holds the results in two layers:
+
+* an in-process LRU cache of the most recently requested rankings, and
+* optionally a persistent cache in a separate SQLite file, which survives restarts and is shared between processes.
+
+Results are keyed on the query, its parameters (e.g. scoring method and number of proteins) and the content version of
+the database (see :func:~`database_content_version`), which changes whenever publications are ingested or annotated.
+Rankings computed for an older content of the database are therefore never returned, and persistent entries of older
+versions are removed once a ranking for a new version is stored. The co-occurrence matrices the scores are computed from
+are kept in memory for the current content version as well.
+
+The persistent cache is held in a file of its own, so that rankings can be cached for databases opened read-only.
+"""
+
+import hashlib
+import json
+import sqlite3 as sl3
+import threading
+from collections import OrderedDict
+
+SQL_CREATE_QUERY_CACHE_TABLE = "CREATE TABLE IF NOT EXISTS query_cache (cache_key text PRIMARY KEY, " \
+                               "content_version text NOT NULL, query text NOT NULL, result text NOT NULL, " \
+                               "created_at text);"
+
+# queries the content version is derived from, for each table that exists in the database; all of them are answered
+# from the end of an index or from small tables, so that the version is cheap to determine for every request
+_CONTENT_VERSION_QUERIES = (
+    ('publications', "SELECT MAX(pmid) FROM publications"),
+    ('ingestion_manifest', "SELECT COUNT(*), MAX(completed_at), TOTAL(article_count) FROM ingestion_manifest"),
+    ('annotations', "SELECT MAX(rowid) FROM annotations"),
+    ('annotation_progress', "SELECT group_concat(entity_type || ':' || last_pmid || ':' || IFNULL(updated_at, '')) "
+                            "FROM annotation_progress"),
+)
+
+# number of rankings held by the in-process cache
+DEFAULT_LRU_SIZE = 256
+# ways a disease term is matched, i.e. by a full-text search of title and abstract or as identifier of the concepts
+# annotated in the table annotations
+RANKING_SOURCES = ('search', 'concept')
+
+
+def database_content_version(db_conn):
+    """
+    Returns a version of the content of the publication database, derived from the highest PMID, the files recorded
+    in the ingestion manifest and the annotations. The version changes whenever files are ingested, publications with
+    new PMIDs are added or publications are annotated, but not if publications are updated in place without the
+    manifest, in which case cached results need to be cleared explicitly (see :meth:~`ProteinRankingCache.clear`).
+
+    :param db_conn: connection to the publication database
+    :type db_conn: sqlite3.Connection
+    :return: hexadecimal version of the content
+    :rtype: str
+    """
+    tables = set(row[0] for row in db_conn.execute("SELECT name FROM sqlite_master WHERE type='table'"))
+    state = [(table, db_conn.execute(stm).fetchone()) for table, stm in _CONTENT_VERSION_QUERIES if table in tables]
+    return hashlib.sha1(repr(state).encode('UTF-8')).hexdigest()[:16]
+
+
+def _cache_key(query: str, params: dict, content_version: str):
+    """
+    Returns the key of a result, combining the query, its parameters and the content version of the database.
+    """
+    key = json.dumps([query, params, content_version], sort_keys=True)
+    return hashlib.sha1(key.encode('UTF-8')).hexdigest()
+
+
+class ProteinRankingCache:
+    """
+    Cached query layer returning the top-k proteins for a disease term. The cache can be shared by multiple threads,
+    each passing its own connection to the database, e.g. from a pool of read-only connections.
+    """
+
+    def __init__(self, cache_file=None, lru_size: int = DEFAULT_LRU_SIZE, protein_type: str = None,
+                 concept_type: str = None):
+        """
+        Setting up the cache.
+
+        :param cache_file: path to the SQLite file of the persistent cache, which is created if needed, None to only
+            cache rankings in memory
+        :type cache_file: str or Path
+        :param lru_size: number of rankings held in memory
+        :type lru_size: int
+        :param protein_type: entity type of the proteins in the table annotations, the default of
+            :class:~`protein_score_utilities.protein_scoring.CoOccurrenceMatrices` if None
+        :type protein_type: str
+        :param concept_type: entity type of the concepts in the table annotations, the default of
+            :class:~`protein_score_utilities.protein_scoring.CoOccurrenceMatrices` if None
+        :type concept_type: str
+        """
+        self.lru_size = lru_size
+        self.entity_types = dict((key, value) for key, value in (('protein_type', protein_type),
+                                                                 ('concept_type', concept_type)) if value)
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._compute_lock = threading.Lock()
+        self._matrices = None
+        self._matrices_version = None
+        self._concept_scores = {}
+        self._cache_conn = None
+        self._cache_version = None
+        if cache_file is not None:
+            self._cache_conn = sl3.connect(str(cache_file), check_same_thread=False)
+            self._cache_conn.execute(SQL_CREATE_QUERY_CACHE_TABLE)
+            self._cache_conn.commit()
+
+    def top_proteins(self, db_conn, disease_term: str, k: int = 20, method: str = 'pmi', source: str = 'search'):
+        """
+        Returns the k proteins with the highest score for a disease term, taken from the cache if the ranking has been
+        computed for the current content of the database before.
+
+        :param db_conn: connection to the database holding the tables publications and annotations, as well as the
+            full-text index (see :mod:~`protein_score_utilities.publication_search`) for the source 'search'
+        :type db_conn: sqlite3.Connection
+        :param disease_term: name of the disease searched in title and abstract of the publications for the source
+            'search', identifier of the concept in the table annotations for the source 'concept'
+        :type disease_term: str
+        :param k: number of proteins returned
+        :type k: int
+        :param method: scoring method, either 'pmi', 'npmi' or 'tf-idf'
+        :type method: str
+        :param source: how the publications of the disease are found, one of :data:~`RANKING_SOURCES`
+        :type source: str
+        :return: tuples of protein identifier and score, the highest score first; empty if the disease is not found
+        :rtype: list
+        """
+        if source not in RANKING_SOURCES:
+            raise ValueError(f"Unknown source '{source}', expected one of {', '.join(RANKING_SOURCES)}.")
+        if method not in ('pmi', 'npmi', 'tf-idf'):
+            raise ValueError(f"Unknown scoring method '{method}', expected one of 'pmi', 'npmi' or 'tf-idf'.")
+        params = dict(disease_term=disease_term, k=k, method=method, source=source, **self.entity_types)
+        content_version = database_content_version(db_conn)
+        key = _cache_key('top_proteins', params, content_version)
+
+        result = self._cached(key)
+        if result is not None:
+            return list(result)
+        # rankings are computed one at a time, while rankings cached already can be returned in the meantime
+        with self._compute_lock:
+            # the content may have changed while waiting, e.g. when another thread has loaded newer matrices, so that
+            # the ranking is computed, labelled and cached for the content version read now
+            content_version = database_content_version(db_conn)
+            key = _cache_key('top_proteins', params, content_version)
+            # the ranking may have been computed by another thread, which missed on the same key, while waiting
+            result = self._cached(key)
+            if result is None:
+                result = self._rank(db_conn, content_version, disease_term, k, method, source)
+                # the ranking is cached before the next thread waiting can check for it
+                with self._lock:
+                    self.misses += 1
+                    self._store(key, content_version, params, result)
+                    self._remember(key, result)
+        return list(result)
+
+    def warm_up(self, db_conn):
+        """
+        Loads the co-occurrence matrices for the current content of the database, e.g. when a service is started, so
+        that the first ranking requested does not have to wait for them.
+
+        :param db_conn: connection to the database holding the tables publications and annotations
+        :type db_conn: sqlite3.Connection
+        """
+        with self._compute_lock:
+            self._current_matrices(db_conn, database_content_version(db_conn))
+
+    def _rank(self, db_conn, content_version: str, disease_term: str, k: int, method: str, source: str):
+        """
+        Computes the ranking of the proteins for a disease term from the co-occurrence matrices of the current content
+        version.
+        """
+        from protein_score_utilities.protein_scoring import score_co_occurrences
+        from protein_score_utilities.protein_scoring import score_proteins_for_publications
+        from protein_score_utilities.protein_scoring import top_k_proteins
+        from protein_score_utilities.publication_search import search_publication_ids
+
+        matrices = self._current_matrices(db_conn, content_version)
+        if source == 'search':
+            scores = score_proteins_for_publications(matrices, search_publication_ids(db_conn, disease_term), method)
+        else:
+            try:
+                concept_index = matrices.concept_index(disease_term)
+            except KeyError:
+                return ()
+            if method not in self._concept_scores:
+                self._concept_scores[method] = score_co_occurrences(
+                    matrices.protein_concept, matrices.protein_counts, matrices.concept_counts,
+                    matrices.n_publications, method).tocsc()
+            scores = self._concept_scores[method][:, concept_index]
+        return tuple((str(protein_id), score) for protein_id, score in top_k_proteins(scores, matrices.protein_ids, k))
+
+    def _current_matrices(self, db_conn, content_version: str):
+        """
+        Returns the co-occurrence matrices, loading them again if the content of the database has changed.
+        """
+        if self._matrices is None or self._matrices_version != content_version:
+            from protein_score_utilities.protein_scoring import CoOccurrenceMatrices
+            in_transaction = db_conn.in_transaction
+            self._matrices = CoOccurrenceMatrices(db_conn, **self.entity_types)
+            # the temporary table used while loading opens a transaction, which would keep other processes from writing
+            if not in_transaction and db_conn.in_transaction:
+                db_conn.commit()
+            self._matrices_version = content_version
+            self._concept_scores = {}
+        return self._matrices
+
+    def _cached(self, key: str):
+        """
+        Returns a ranking from the in-process or the persistent cache, None if neither of them holds it.
+        """
+        with self._lock:
+            result = self._lru.get(key)
+            if result is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return result
+            result = self._load(key)
+            if result is not None:
+                self.persistent_hits += 1
+                self._remember(key, result)
+            return result
+
+    def _remember(self, key: str, result: tuple):
+        """
+        Adds a ranking to the in-process cache, dropping the ranking used least recently if the cache is full.
+        """
+        self._lru[key] = result
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def _load(self, key: str):
+        """
+        Returns a ranking from the persistent cache, None if it is not held or no persistent cache is used.
+        """
+        if self._cache_conn is None:
+            return None
+        row = self._cache_conn.execute("SELECT result FROM query_cache WHERE cache_key=?", (key,)).fetchone()
+        return tuple(tuple(item) for item in json.loads(row[0])) if row is not None else None
+
+    def _store(self, key: str, content_version: str, params: dict, result: tuple):
+        """
+        Writes a ranking to the persistent cache, removing the rankings of other content versions first.
+        """
+        if self._cache_conn is None:
+            return
+        if self._cache_version != content_version:
+            self._cache_conn.execute("DELETE FROM query_cache WHERE content_version != ?", (content_version,))
+            self._cache_version = content_version
+        self._cache_conn.execute("INSERT OR REPLACE INTO query_cache(cache_key,content_version,query,result,"
+                                 "created_at) VALUES(?,?,?,?,datetime('now'))",
+                                 (key, content_version, json.dumps(params, sort_keys=True), json.dumps(result)))
+        self._cache_conn.commit()
+
+    def clear(self):
+        """
+        Removes all rankings from the in-process and the persistent cache, e.g. after publications have been updated
+        in a way the content version does not reflect.
+        """
+        with self._compute_lock:
+            self._matrices = None
+            self._matrices_version = None
+            self._concept_scores = {}
+        with self._lock:
+            self._lru.clear()
+            if self._cache_conn is not None:
+                self._cache_conn.execute("DELETE FROM query_cache")
+                self._cache_conn.commit()
+
+    def close(self):
+        """
+        Closes the connection to the persistent cache.
+        """
+        if self._cache_conn is not None:
+            self._cache_conn.close()
+            self._cache_conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
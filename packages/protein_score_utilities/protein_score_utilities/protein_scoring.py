@@ -0,0 +1,304 @@
+"""
+Functionality to score the relevance of proteins for concepts (e.g. diseases) based on their co-occurrence in
+publications, following the approach of `this publication
+<https://journals.plos.org/plosone/article?id=10.1371/journal.pone.0233956>`_.
+
+The annotations of the publications (see :mod:~`data_processing.annotate_text_data`) are loaded into sparse incidence
+matrices in CSR format, one holding the publications each protein is mentioned in and one holding the publications each
+concept is mentioned in. Both share the same publication axis, so that the protein x concept co-occurrence matrix is a
+single sparse matrix product. All scores are computed with vectorised operations on the non-zero entries of these
+matrices only, so that memory and time grow with the number of annotations rather than with the number of proteins times
+the number of concepts or publications.
+
+Requires numpy and scipy.
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+# entity type of the annotations the proteins are taken from
+DEFAULT_PROTEIN_TYPE = 'protein'
+# entity type of the annotations the concepts are taken from
+DEFAULT_CONCEPT_TYPE = 'disease'
+
+
+def _read_entity_publication_pairs(db_conn, entity_type: str):
+    """
+    Reads the distinct pairs of publication and entity of the given type from the table annotations. The entity
+    identifiers are numbered within SQLite, so that the pairs can be streamed into a numpy array without holding them as
+    Python objects.
+
+    :param db_conn: connection to the database holding the table annotations
+    :type db_conn: sqlite3.Connection
+    :param entity_type: type of the entities, e.g. 'protein'
+    :type entity_type: str
+    :return: identifiers of the entities in the order of their index and an array with one row of PMID and entity index
+        per pair
+    :rtype: tuple
+    """
+    from itertools import chain
+
+    entity_ids = np.array([row[0] for row in db_conn.execute(
+        "SELECT DISTINCT entity_id FROM annotations WHERE entity_type=? ORDER BY entity_id", (entity_type,))],
+        dtype=object)
+    db_conn.execute("DROP TABLE IF EXISTS temp.entity_index")
+    db_conn.execute("CREATE TEMP TABLE entity_index (entity_index integer PRIMARY KEY, entity_id text UNIQUE)")
+    db_conn.executemany("INSERT INTO temp.entity_index VALUES (?,?)", enumerate(entity_ids))
+    try:
+        rows = db_conn.execute("SELECT DISTINCT a.pmid, e.entity_index FROM annotations a "
+                               "JOIN temp.entity_index e ON e.entity_id = a.entity_id WHERE a.entity_type=?",
+                               (entity_type,))
+        pairs = np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(-1, 2)
+    finally:
+        db_conn.execute("DROP TABLE temp.entity_index")
+    return entity_ids, pairs
+
+
+def _incidence_matrix(pairs, pmids, n_entities: int):
+    """
+    Builds the binary entity x publication incidence matrix from pairs of PMID and entity index.
+
+    :param pairs: array with one row of PMID and entity index per distinct pair
+    :type pairs: numpy.ndarray
+    :param pmids: sorted PMIDs of the publication axis, containing all PMIDs of the pairs
+    :type pmids: numpy.ndarray
+    :param n_entities: number of entities
+    :type n_entities: int
+    :return: incidence matrix
+    :rtype: scipy.sparse.csr_matrix
+    """
+    columns = np.searchsorted(pmids, pairs[:, 0]).astype(np.int32)
+    data = np.ones(len(pairs), dtype=np.int32)
+    return sp.csr_matrix((data, (pairs[:, 1].astype(np.int32), columns)), shape=(n_entities, len(pmids)))
+
+
+class CoOccurrenceMatrices:
+    """
+    Sparse matrices describing in which publications proteins and concepts are mentioned, loaded from the table
+    annotations. Rows of the matrices refer to the identifiers in :attr:`protein_ids` and :attr:`concept_ids`, columns
+    of the incidence matrices to the PMIDs in :attr:`pmids`.
+
+    :param db_conn: connection to the database holding the tables publications and annotations
+    :type db_conn: sqlite3.Connection
+    :param protein_type: entity type of the proteins in the table annotations
+    :type protein_type: str
+    :param concept_type: entity type of the concepts in the table annotations, e.g. 'disease'
+    :type concept_type: str
+    """
+    def __init__(self, db_conn, protein_type: str = DEFAULT_PROTEIN_TYPE, concept_type: str = DEFAULT_CONCEPT_TYPE):
+        self.protein_ids, protein_pairs = _read_entity_publication_pairs(db_conn, protein_type)
+        self.concept_ids, concept_pairs = _read_entity_publication_pairs(db_conn, concept_type)
+        # only publications mentioning at least one protein or concept are part of the publication axis
+        self.pmids = np.union1d(protein_pairs[:, 0], concept_pairs[:, 0])
+        self.protein_publication = _incidence_matrix(protein_pairs, self.pmids, len(self.protein_ids))
+        self.concept_publication = _incidence_matrix(concept_pairs, self.pmids, len(self.concept_ids))
+        # publications without any mention still count towards the total used by the scores
+        self.n_publications = max(len(self.pmids),
+                                  db_conn.execute("SELECT COUNT(*) FROM publications").fetchone()[0])
+        self._protein_concept = None
+
+    @property
+    def protein_counts(self):
+        """
+        Number of publications each protein is mentioned in.
+        """
+        return np.asarray(self.protein_publication.sum(axis=1)).ravel()
+
+    @property
+    def concept_counts(self):
+        """
+        Number of publications each concept is mentioned in.
+        """
+        return np.asarray(self.concept_publication.sum(axis=1)).ravel()
+
+    @property
+    def protein_concept(self):
+        """
+        Protein x concept matrix holding the number of publications in which both are mentioned, computed on first
+        access.
+        """
+        if self._protein_concept is None:
+            self._protein_concept = (self.protein_publication @ self.concept_publication.T).tocsr()
+            self._protein_concept.sort_indices()
+        return self._protein_concept
+
+    def protein_index(self, protein_id: str):
+        """
+        Returns the row index of a protein, raising a KeyError if the protein is not mentioned in any publication.
+        """
+        return _lookup_index(self.protein_ids, protein_id)
+
+    def concept_index(self, concept_id: str):
+        """
+        Returns the row index of a concept, raising a KeyError if the concept is not mentioned in any publication.
+        """
+        return _lookup_index(self.concept_ids, concept_id)
+
+    def publication_indicator(self, pmids):
+        """
+        Returns a vector over the publication axis that is 1 for the given PMIDs, e.g. the publications found by a full
+        text search, and 0 otherwise. PMIDs not mentioning any protein or concept are ignored.
+
+        :param pmids: PMIDs of the publications
+        :type pmids: iterable
+        :return: indicator vector
+        :rtype: numpy.ndarray
+        """
+        pmids = np.fromiter(pmids, dtype=np.int64)
+        positions = np.searchsorted(self.pmids, pmids)
+        inside = positions < len(self.pmids)
+        positions, pmids = positions[inside], pmids[inside]
+        indicator = np.zeros(len(self.pmids), dtype=np.int32)
+        indicator[positions[self.pmids[positions] == pmids]] = 1
+        return indicator
+
+
+def _lookup_index(ids, entity_id: str):
+    """
+    Looks up the index of an identifier in the sorted array of identifiers.
+    """
+    position = int(np.searchsorted(ids, entity_id))
+    if position == len(ids) or ids[position] != entity_id:
+        raise KeyError(entity_id)
+    return position
+
+
+def _row_indices(matrix):
+    """
+    Returns the row index of each stored entry of a CSR matrix.
+    """
+    return np.repeat(np.arange(matrix.shape[0], dtype=np.int32), np.diff(matrix.indptr))
+
+
+def tf_idf_scores(protein_concept, protein_counts, n_publications: int, sublinear_tf: bool = False):
+    """
+    Scores each protein for each concept by the number of publications mentioning both (term frequency), weighted by
+    the inverse document frequency of the protein, so that proteins mentioned in a large share of all publications are
+    scored lower.
+
+    :param protein_concept: protein x concept co-occurrence matrix
+    :type protein_concept: scipy.sparse.csr_matrix
+    :param protein_counts: number of publications each protein is mentioned in
+    :type protein_counts: numpy.ndarray
+    :param n_publications: number of publications in total
+    :type n_publications: int
+    :param sublinear_tf: whether the logarithm of the co-occurrence count (1 + log) is used rather than the count
+    :type sublinear_tf: bool
+    :return: protein x concept score matrix with the same non-zero entries as the co-occurrence matrix
+    :rtype: scipy.sparse.csr_matrix
+    """
+    # smoothed as in scikit-learn, so that proteins mentioned in all publications still get a positive weight
+    idf = np.log((1 + n_publications) / (1 + np.asarray(protein_counts, dtype=np.float64))) + 1
+    scores = protein_concept.astype(np.float64, copy=True)
+    if sublinear_tf:
+        np.log(scores.data, out=scores.data)
+        scores.data += 1
+    scores.data *= idf[_row_indices(scores)]
+    return scores
+
+
+def pmi_scores(protein_concept, protein_counts, concept_counts, n_publications: int, normalised: bool = False,
+               positive: bool = True):
+    """
+    Scores each protein for each concept by the pointwise mutual information (PMI) of their mentions, i.e. the
+    logarithm of how much more often both are mentioned in the same publication than expected if they were mentioned
+    independently of each other.
+
+    :param protein_concept: protein x concept co-occurrence matrix
+    :type protein_concept: scipy.sparse.csr_matrix
+    :param protein_counts: number of publications each protein is mentioned in
+    :type protein_counts: numpy.ndarray
+    :param concept_counts: number of publications each concept is mentioned in
+    :type concept_counts: numpy.ndarray
+    :param n_publications: number of publications in total
+    :type n_publications: int
+    :param normalised: whether the normalised PMI in the range of -1 to 1 is returned
+    :type normalised: bool
+    :param positive: whether negative scores, i.e. pairs mentioned together less often than expected, are dropped
+    :type positive: bool
+    :return: protein x concept score matrix, holding entries only for pairs mentioned together
+    :rtype: scipy.sparse.csr_matrix
+    """
+    scores = protein_concept.astype(np.float64, copy=True)
+    joint = scores.data / n_publications
+    expected = (np.asarray(protein_counts, dtype=np.float64)[_row_indices(scores)] / n_publications) * \
+               (np.asarray(concept_counts, dtype=np.float64)[scores.indices] / n_publications)
+    scores.data = np.log(joint / expected)
+    if normalised:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # pairs always mentioned together in all publications are perfectly associated
+            scores.data = np.where(joint < 1, scores.data / -np.log(joint), 1.0)
+    if positive:
+        scores.data[scores.data < 0] = 0
+        scores.eliminate_zeros()
+    return scores
+
+
+def score_proteins_for_publications(matrices: CoOccurrenceMatrices, pmids, method: str = 'pmi'):
+    """
+    Scores all proteins for a set of publications, e.g. the publications a full text search for a disease name returns
+    (see :func:~`protein_score_utilities.publication_search.search_publication_ids`), treating the set like a concept.
+
+    :param matrices: co-occurrence matrices of the annotated publications
+    :type matrices: :class:~`CoOccurrenceMatrices`
+    :param pmids: PMIDs of the publications
+    :type pmids: iterable
+    :param method: scoring method, either 'pmi', 'npmi' or 'tf-idf'
+    :type method: str
+    :return: score of each protein, in the order of the protein identifiers
+    :rtype: numpy.ndarray
+    """
+    indicator = matrices.publication_indicator(pmids)
+    protein_concept = sp.csr_matrix(matrices.protein_publication @ indicator[:, np.newaxis])
+    scores = score_co_occurrences(protein_concept, matrices.protein_counts, np.array([indicator.sum()]),
+                                  matrices.n_publications, method)
+    return scores.toarray().ravel()
+
+
+def score_co_occurrences(protein_concept, protein_counts, concept_counts, n_publications: int, method: str = 'pmi'):
+    """
+    Scores the co-occurrences of proteins and concepts with the given method.
+
+    :param protein_concept: protein x concept co-occurrence matrix
+    :type protein_concept: scipy.sparse.csr_matrix
+    :param protein_counts: number of publications each protein is mentioned in
+    :type protein_counts: numpy.ndarray
+    :param concept_counts: number of publications each concept is mentioned in
+    :type concept_counts: numpy.ndarray
+    :param n_publications: number of publications in total
+    :type n_publications: int
+    :param method: scoring method, either 'pmi', 'npmi' or 'tf-idf'
+    :type method: str
+    :return: protein x concept score matrix
+    :rtype: scipy.sparse.csr_matrix
+    """
+    if method == 'tf-idf':
+        return tf_idf_scores(protein_concept, protein_counts, n_publications)
+    elif method in ('pmi', 'npmi'):
+        return pmi_scores(protein_concept, protein_counts, concept_counts, n_publications,
+                          normalised=method == 'npmi')
+    raise ValueError(f"Unknown scoring method '{method}', expected one of 'pmi', 'npmi' or 'tf-idf'.")
+
+
+def top_k_proteins(scores, protein_ids, k: int = 20):
+    """
+    Returns the k proteins with the highest positive score, without sorting all scores.
+
+    :param scores: score of each protein, e.g. a column of a score matrix or the result of
+        :func:~`score_proteins_for_publications`
+    :type scores: numpy.ndarray or scipy.sparse.spmatrix
+    :param protein_ids: identifiers of the proteins in the order of the scores
+    :type protein_ids: numpy.ndarray
+    :param k: number of proteins returned
+    :type k: int
+    :return: tuples of protein identifier and score, the highest score first
+    :rtype: list
+    """
+    if sp.issparse(scores):
+        scores = scores.toarray()
+    scores = np.asarray(scores, dtype=np.float64).ravel()
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    # ties are broken by the protein identifier, so that the ranking is stable
+    return sorted(((protein_ids[i], float(scores[i])) for i in candidates), key=lambda x: (-x[1], x[0]))
@@ -0,0 +1,215 @@
+"""
+Functionality to search the titles and abstracts of the publications held in the SQLite database. The search is backed
+by an SQLite FTS5 full-text index, which avoids scanning all abstracts for each term looked up. The index is an
+external content table on top of the table publications, so that the text is not stored twice, and it is kept in sync
+through triggers, i.e. it is populated while publications are ingested and follows updates and deletions.
+
+The index is optional and needs to be created once through :func:~`create_publication_search_index`, publications
+already in the database at that point are indexed straight away.
+
+For the compact schema (see :mod:~`protein_score_utilities.convenience_functions_database`) the index is built on the
+view publications_text holding the decompressed abstracts, and the triggers decompress the abstracts while indexing
+them. Connections writing publications to such a database need the compression functions
+registered (:func:~`protein_score_utilities.convenience_functions_database.register_compression_functions`).
+"""
+
+from protein_score_utilities.convenience_functions_database import has_compact_publication_schema
+from protein_score_utilities.convenience_functions_database import register_compression_functions
+
+_SQL_CREATE_SEARCH_INDEX = "CREATE VIRTUAL TABLE IF NOT EXISTS publications_fts USING fts5(title, pub_abstract, " \
+                           "content='{content}', content_rowid='pmid');"
+_SQL_CREATE_SEARCH_INDEX_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS publications_fts_insert AFTER INSERT ON publications BEGIN "
+    "INSERT INTO publications_fts(rowid, title, pub_abstract) VALUES (new.pmid, new.title, {new_abstract}); END;",
+    "CREATE TRIGGER IF NOT EXISTS publications_fts_delete AFTER DELETE ON publications BEGIN "
+    "INSERT INTO publications_fts(publications_fts, rowid, title, pub_abstract) "
+    "VALUES ('delete', old.pmid, old.title, {old_abstract}); END;",
+    "CREATE TRIGGER IF NOT EXISTS publications_fts_update AFTER UPDATE ON publications BEGIN "
+    "INSERT INTO publications_fts(publications_fts, rowid, title, pub_abstract) "
+    "VALUES ('delete', old.pmid, old.title, {old_abstract}); "
+    "INSERT INTO publications_fts(rowid, title, pub_abstract) VALUES (new.pmid, new.title, {new_abstract}); END;",
+)
+SQL_CREATE_SEARCH_INDEX = _SQL_CREATE_SEARCH_INDEX.format(content='publications')
+SQL_CREATE_SEARCH_INDEX_TRIGGERS = tuple(stm.format(new_abstract='new.pub_abstract', old_abstract='old.pub_abstract')
+                                         for stm in _SQL_CREATE_SEARCH_INDEX_TRIGGERS)
+SQL_CREATE_COMPACT_SEARCH_INDEX = _SQL_CREATE_SEARCH_INDEX.format(content='publications_text')
+SQL_CREATE_COMPACT_SEARCH_INDEX_TRIGGERS = tuple(stm.format(new_abstract='decompress_text(new.pub_abstract)',
+                                                            old_abstract='decompress_text(old.pub_abstract)')
+                                                 for stm in _SQL_CREATE_SEARCH_INDEX_TRIGGERS)
+
+# weights of the columns title and abstract in the ranking, a term found in the title counts more
+DEFAULT_TITLE_WEIGHT = 2.0
+DEFAULT_ABSTRACT_WEIGHT = 1.0
+
+
+def create_publication_search_index(db_conn):
+    """
+    Creates the full-text index for the table publications together with the triggers keeping it in sync. If the
+    index is created for a database already holding publications, these are indexed straight away. The table
+    publications needs to exist before.
+
+    :param db_conn: connection to the database holding the table publications
+    :type db_conn: sqlite3.Connection
+    """
+    exists = has_publication_search_index(db_conn)
+    if has_compact_publication_schema(db_conn):
+        register_compression_functions(db_conn)
+        sql_create_index = SQL_CREATE_COMPACT_SEARCH_INDEX
+        sql_create_triggers = SQL_CREATE_COMPACT_SEARCH_INDEX_TRIGGERS
+    else:
+        sql_create_index = SQL_CREATE_SEARCH_INDEX
+        sql_create_triggers = SQL_CREATE_SEARCH_INDEX_TRIGGERS
+    db_conn.execute(sql_create_index)
+    for sql_create_trigger in sql_create_triggers:
+        db_conn.execute(sql_create_trigger)
+    if not exists:
+        rebuild_publication_search_index(db_conn)
+    db_conn.commit()
+
+
+def rebuild_publication_search_index(db_conn):
+    """
+    Rebuilds the full-text index from the content of the table publications, e.g. after the triggers have been
+    dropped for a bulk load.
+
+    :param db_conn: connection to the database holding the table publications
+    :type db_conn: sqlite3.Connection
+    """
+    if has_compact_publication_schema(db_conn):
+        register_compression_functions(db_conn)
+    db_conn.execute("INSERT INTO publications_fts(publications_fts) VALUES('rebuild');")
+    db_conn.commit()
+
+
+def drop_publication_search_index(db_conn):
+    """
+    Drops the full-text index together with the triggers keeping it in sync, without committing.
+
+    :param db_conn: connection to the database holding the full-text index
+    :type db_conn: sqlite3.Connection
+    """
+    for trigger in ('insert', 'delete', 'update'):
+        db_conn.execute(f"DROP TRIGGER IF EXISTS publications_fts_{trigger}")
+    db_conn.execute("DROP TABLE IF EXISTS publications_fts")
+
+
+def has_publication_search_index(db_conn):
+    """
+    Checks whether the full-text index has been created for the database.
+
+    :param db_conn: connection to the database
+    :type db_conn: sqlite3.Connection
+    :return: True if the full-text index exists, otherwise False
+    :rtype: bool
+    """
+    return db_conn.execute("SELECT 1 FROM sqlite_master WHERE name='publications_fts'").fetchone() is not None
+
+
+def build_match_expression(terms, match_all: bool = False):
+    """
+    Builds an FTS5 match expression in which each term is searched as phrase, so that terms like disease or protein
+    names containing characters with a special meaning in the FTS5 query syntax (e.g. "IL-6") can be looked up safely.
+
+    :param terms: a single term or a list of terms
+    :type terms: str or list
+    :param match_all: whether publications need to contain all terms (AND) rather than any of them (OR)
+    :type match_all: bool
+    :return: match expression for the FTS5 table
+    :rtype: str
+    """
+    if isinstance(terms, str):
+        terms = [terms]
+    phrases = ['"' + term.replace('"', '""') + '"' for term in terms if term.strip()]
+    if not phrases:
+        raise ValueError("At least one non-empty search term needs to be provided.")
+    return (" AND " if match_all else " OR ").join(phrases)
+
+
+def search_publications(db_conn, terms, limit: int = 20, match_all: bool = False,
+                        title_weight: float = DEFAULT_TITLE_WEIGHT, abstract_weight: float = DEFAULT_ABSTRACT_WEIGHT):
+    """
+    Looks up the publications whose title or abstract mention the given terms and returns them ranked by relevance
+    (BM25), the most relevant publication first.
+
+    :param db_conn: connection to the database holding the full-text index
+    :type db_conn: sqlite3.Connection
+    :param terms: a single term or a list of terms, e.g. disease or protein names
+    :type terms: str or list
+    :param limit: maximal number of publications returned, None for all
+    :type limit: int
+    :param match_all: whether publications need to contain all terms rather than any of them
+    :type match_all: bool
+    :param title_weight: weight of matches in the title
+    :type title_weight: float
+    :param abstract_weight: weight of matches in the abstract
+    :type abstract_weight: float
+    :return: tuples of PMID, title and score of the publications found, where a higher score is more relevant
+    :rtype: list
+    """
+    return search_publications_cursor(db_conn, terms, limit, match_all, title_weight, abstract_weight).fetchall()
+
+
+def search_publications_cursor(db_conn, terms, limit: int = None, match_all: bool = False,
+                               title_weight: float = DEFAULT_TITLE_WEIGHT,
+                               abstract_weight: float = DEFAULT_ABSTRACT_WEIGHT):
+    """
+    Looks up publications like :func:~`search_publications`, but returns the cursor, so that a large number of
+    publications can be read in batches, e.g. to stream them to a client.
+
+    :param db_conn: connection to the database holding the full-text index
+    :type db_conn: sqlite3.Connection
+    :param terms: a single term or a list of terms, e.g. disease or protein names
+    :type terms: str or list
+    :param limit: maximal number of publications returned, None for all
+    :type limit: int
+    :param match_all: whether publications need to contain all terms rather than any of them
+    :type match_all: bool
+    :param title_weight: weight of matches in the title
+    :type title_weight: float
+    :param abstract_weight: weight of matches in the abstract
+    :type abstract_weight: float
+    :return: cursor returning tuples of PMID, title and score, the most relevant publication first
+    :rtype: sqlite3.Cursor
+    """
+    # bm25 returns lower values for better matches, so the sign is flipped for the score
+    stm = "SELECT f.rowid, p.title, -bm25(publications_fts, ?, ?) AS score FROM publications_fts f " \
+          "JOIN publications p ON p.pmid = f.rowid WHERE publications_fts MATCH ? ORDER BY bm25(publications_fts, ?, ?)"
+    params = [title_weight, abstract_weight, build_match_expression(terms, match_all), title_weight, abstract_weight]
+    if limit is not None:
+        stm += " LIMIT ?"
+        params.append(limit)
+    return db_conn.execute(stm, params)
+
+
+def search_publication_ids(db_conn, terms, match_all: bool = False):
+    """
+    Returns the PMIDs of all publications whose title or abstract mention the given terms, without ranking them.
+
+    :param db_conn: connection to the database holding the full-text index
+    :type db_conn: sqlite3.Connection
+    :param terms: a single term or a list of terms, e.g. disease or protein names
+    :type terms: str or list
+    :param match_all: whether publications need to contain all terms rather than any of them
+    :type match_all: bool
+    :return: PMIDs of the publications found
+    :rtype: list
+    """
+    return [row[0] for row in db_conn.execute("SELECT rowid FROM publications_fts WHERE publications_fts MATCH ?",
+                                              (build_match_expression(terms, match_all),))]
+
+
+def count_publications(db_conn, terms, match_all: bool = False):
+    """
+    Counts the publications whose title or abstract mention the given terms.
+
+    :param db_conn: connection to the database holding the full-text index
+    :type db_conn: sqlite3.Connection
+    :param terms: a single term or a list of terms, e.g. disease or protein names
+    :type terms: str or list
+    :param match_all: whether publications need to contain all terms rather than any of them
+    :type match_all: bool
+    :return: number of publications found
+    :rtype: int
+    """
+    return db_conn.execute("SELECT COUNT(*) FROM publications_fts WHERE publications_fts MATCH ?",
+                           (build_match_expression(terms, match_all),)).fetchone()[0]
@@ -0,0 +1,240 @@
+"""
+Functionality to instrument long running pipeline stages, such as the ingestion of Pubmed XML files. A
+:class:~`MetricsRecorder` accumulates the time spent per stage (e.g. parse, extract, insert, commit) and counters (e.g.
+duplicated or incomplete publications) and writes events as JSON lines, one JSON object per line, to a metrics file.
+Each line carries the time it was written, the peak memory (resident set size) of the process up to then and the
+context of the run, so that the file can be followed while the run is ongoing (e.g. with tail -f) and analysed
+afterwards, e.g. with pandas.read_json(file, lines=True).
+
+Runs can further be profiled with cProfile or, if installed, pyinstrument through :func:~`profiling`, which is meant
+to be switched on from the config file of a run script.
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# profilers supported by :func:~`profiling` and the suffix of the file their profile is written to
+PROFILERS = {
+    'cprofile': '.prof',
+    'pyinstrument': '.html',
+}
+
+
+def peak_rss_bytes(children: bool = False):
+    """
+    Returns the peak resident set size of the current process, i.e. the most memory it has held at any point in time.
+
+    :param children: whether the peak of the largest terminated child process is to be returned instead
+    :type children: bool
+    :return: peak resident set size in bytes, None if it cannot be determined on the platform (e.g. Windows)
+    :rtype: int
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # Linux reports the peak in KiB, macOS in bytes
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+
+def current_rss_bytes():
+    """
+    Returns the resident set size the current process holds at the moment, e.g. to check that the memory of a stage
+    does not grow with the size of its input. Unlike :func:~`peak_rss_bytes`, it also reflects memory released again.
+
+    :return: resident set size in bytes, None if it cannot be determined on the platform (only Linux is supported)
+    :rtype: int
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+
+class MetricsRecorder:
+    """
+    Recorder accumulating the time spent per stage and counters of a run, which writes events as JSON lines to a file
+    object (the sink). Without a sink, the timings and counters are still accumulated, but no events are written, so
+    that instrumented functions can always be handed a recorder.
+    """
+
+    def __init__(self, sink=None, **context):
+        """
+        Setting up the recorder.
+
+        :param sink: text file object the events are written to, None to not write any events
+        :type sink: file object
+        :param context: values added to every event, e.g. the name of the run
+        """
+        self.sink = sink
+        self.context = context
+        self.timings = {}
+        self.counters = {}
+        self._started = time.perf_counter()
+        self._owns_sink = False
+
+    @classmethod
+    def open(cls, file_path, **context):
+        """
+        Creates a recorder appending its events to the given file, which is closed together with the recorder.
+
+        :param file_path: path to the metrics file, None for a recorder without sink
+        :type file_path: str or Path
+        :param context: values added to every event, e.g. the name of the run
+        :return: recorder writing to the file
+        :rtype: MetricsRecorder
+        """
+        if file_path is None:
+            return cls(**context)
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        # line buffered, so that every event is visible in the file once it has been emitted
+        recorder = cls(open(file_path, 'a', encoding='UTF-8', buffering=1), **context)
+        recorder._owns_sink = True
+        return recorder
+
+    @property
+    def enabled(self):
+        """
+        Whether events are written, i.e. whether the recorder has a sink.
+        """
+        return self.sink is not None
+
+    @property
+    def elapsed(self):
+        """
+        Seconds passed since the recorder has been set up.
+        """
+        return time.perf_counter() - self._started
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Context manager adding the time spent within the block to the timing of the given stage.
+
+        :param name: name of the stage, e.g. 'insert'
+        :type name: str
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float):
+        """
+        Adds the given time to the timing of a stage, e.g. for stages timed elsewhere such as in a worker process.
+
+        :param name: name of the stage
+        :type name: str
+        :param seconds: seconds spent within the stage
+        :type seconds: float
+        """
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def count(self, name: str, n: int = 1):
+        """
+        Increases a counter by the given number.
+
+        :param name: name of the counter, e.g. 'publications_duplicated'
+        :type name: str
+        :param n: number the counter is increased by
+        :type n: int
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def emit(self, event: str, **fields):
+        """
+        Writes an event as one JSON line to the sink, together with the time, the elapsed seconds, the peak resident
+        set size of the process and the context of the recorder.
+
+        :param event: type of the event, e.g. 'file' or 'run'
+        :type event: str
+        :param fields: values of the event, which need to be serialisable as JSON (other values are written as string)
+        :return: the event as written, also if the recorder has no sink
+        :rtype: dict
+        """
+        record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'event': event, **self.context, **fields,
+                  'elapsed_seconds': round(self.elapsed, 3), 'peak_rss_bytes': peak_rss_bytes()}
+        if self.sink is not None:
+            self.sink.write(json.dumps(record, default=str) + '\n')
+        return record
+
+    def emit_summary(self, event: str = 'run', **fields):
+        """
+        Writes an event with the accumulated timings and counters, e.g. at the end of a run.
+
+        :param event: type of the event
+        :type event: str
+        :param fields: further values of the event
+        :return: the event as written
+        :rtype: dict
+        """
+        timings = dict((f"{name}_seconds", round(seconds, 3)) for name, seconds in self.timings.items())
+        return self.emit(event, **self.counters, **timings, **fields)
+
+    def close(self):
+        """
+        Closes the sink if it has been opened by the recorder.
+        """
+        if self._owns_sink and self.sink is not None:
+            self.sink.close()
+            self.sink = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+@contextmanager
+def profiling(profiler: str, output_file):
+    """
+    Context manager profiling the code executed within the block, where the profile is written to the output file
+    with the suffix of the profiler (see :data:~`PROFILERS`) once the block is left, also if an exception is raised.
+    The profile of cProfile can be read with pstats or e.g. snakeviz, the one of pyinstrument is an HTML page. Only the
+    calling process is profiled, not any worker processes started within the block.
+
+    :param profiler: either 'cprofile' or 'pyinstrument', None or 'off' to not profile
+    :type profiler: str
+    :param output_file: path the profile is written to, the suffix is replaced by the one of the profiler
+    :type output_file: str or Path
+    :return: path the profile is written to, None if not profiling
+    :rtype: Path
+    """
+    if profiler in (None, 'off'):
+        yield None
+        return
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler '{profiler}', expected one of {', '.join(PROFILERS)} or 'off'.")
+
+    output_file = Path(output_file).with_suffix(PROFILERS[profiler])
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    if profiler == 'cprofile':
+        import cProfile
+        profile = cProfile.Profile()
+        start, stop, write = profile.enable, profile.disable, profile.dump_stats
+    else:
+        from pyinstrument import Profiler
+        profile = Profiler()
+        start, stop = profile.start, profile.stop
+
+        def write(file_path):
+            file_path.write_text(profile.output_html(), encoding='UTF-8')
+
+    start()
+    try:
+        yield output_file
+    finally:
+        # the profile of a failed run is written as well, as it shows where the run got stuck
+        stop()
+        write(output_file)
+        print(f"Profile written to {output_file}")
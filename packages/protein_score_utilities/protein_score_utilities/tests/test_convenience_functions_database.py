@@ -0,0 +1,163 @@
+import sqlite3
+import tempfile
+
+from unittest import TestCase
+from unittest import skipUnless
+from pathlib import Path
+
+from protein_score_utilities.convenience_functions_database import compress_text
+from protein_score_utilities.convenience_functions_database import create_database_connection
+from protein_score_utilities.convenience_functions_database import create_table
+from protein_score_utilities.convenience_functions_database import deferred_indexes
+from protein_score_utilities.convenience_functions_database import decompress_text
+from protein_score_utilities.convenience_functions_database import get_publication
+from protein_score_utilities.convenience_functions_database import has_compact_publication_schema
+from protein_score_utilities.convenience_functions_database import iterate_publications
+from protein_score_utilities.convenience_functions_database import register_compression_functions
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ABSTRACT = "Interleukin 6 (IL-6) levels were increased in patients with rheumatoid arthritis. " * 10
+
+
+class TestDatabaseConnection(TestCase):
+    """
+    All tests relating to :func:~`protein_score_utilities.convenience_functions_database.create_database_connection`
+    and :func:~`protein_score_utilities.convenience_functions_database.deferred_indexes`.
+    """
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = Path(self.tmp_dir.name) / "profiles.db"
+
+    def test_profiles(self):
+        """
+        Checks whether the pragmas of the profiles are applied and can be overridden.
+        """
+        db_conn = create_database_connection(self.db_file, profile='bulk_load', cache_size=-1024)
+        self.assertEqual("wal", db_conn.execute("PRAGMA journal_mode").fetchone()[0])
+        self.assertEqual(0, db_conn.execute("PRAGMA synchronous").fetchone()[0])
+        self.assertEqual(-1024, db_conn.execute("PRAGMA cache_size").fetchone()[0])
+        create_table(db_conn, "CREATE TABLE publications (pmid integer PRIMARY KEY)")
+        db_conn.execute("INSERT INTO publications VALUES (1)")
+        db_conn.commit()
+
+        reader = create_database_connection(self.db_file, profile='read_mostly', read_only=True)
+        self.assertEqual(1, reader.execute("PRAGMA synchronous").fetchone()[0])
+        self.assertEqual([(1,)], reader.execute("SELECT * FROM publications").fetchall())
+        self.assertRaises(sqlite3.OperationalError, reader.execute, "INSERT INTO publications VALUES (2)")
+        reader.close()
+        db_conn.close()
+
+    def test_errors_raised(self):
+        """
+        Checks whether errors are raised as exceptions rather than ending the program.
+        """
+        self.assertRaises(ValueError, create_database_connection, self.db_file, profile='unknown')
+        self.assertRaises(sqlite3.OperationalError, create_database_connection, self.db_file / "missing.db")
+        db_conn = create_database_connection(self.db_file)
+        self.assertRaises(sqlite3.OperationalError, create_table, db_conn, "CREATE TABLE (")
+        db_conn.close()
+
+    def test_deferred_indexes(self):
+        """
+        Checks whether indexes are dropped within the block and created again afterwards, also if the block fails.
+        """
+        db_conn = create_database_connection(self.db_file, profile='bulk_load')
+        db_conn.execute("CREATE TABLE annotations (pmid integer, entity_id text UNIQUE)")
+        db_conn.execute("CREATE INDEX annotations_pmid ON annotations(pmid)")
+        with deferred_indexes(db_conn, ["annotations"]) as names:
+            self.assertEqual(["annotations_pmid"], names)
+            self.assertIsNone(db_conn.execute("SELECT 1 FROM sqlite_master WHERE name='annotations_pmid'").fetchone())
+            db_conn.execute("INSERT INTO annotations VALUES (1, 'P1')")
+            db_conn.commit()
+        with self.assertRaises(RuntimeError):
+            with deferred_indexes(db_conn, ["annotations"]):
+                db_conn.execute("INSERT INTO annotations VALUES (2, 'P2')")
+                raise RuntimeError("failed load")
+        self.assertEqual([(1,)], db_conn.execute("SELECT pmid FROM annotations").fetchall())
+        self.assertIsNotNone(db_conn.execute("SELECT 1 FROM sqlite_master WHERE name='annotations_pmid'").fetchone())
+        db_conn.close()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+
+class TestCompression(TestCase):
+    """
+    All tests relating to the compression of texts in :mod:~`protein_score_utilities.convenience_functions_database`.
+    """
+    def test_zlib_round_trip(self):
+        """
+        Checks whether texts are compressed and restored, while uncompressed texts are returned unchanged.
+        """
+        compressed = compress_text(ABSTRACT)
+        self.assertLess(len(compressed), len(ABSTRACT) / 4)
+        self.assertEqual(ABSTRACT, decompress_text(compressed))
+        self.assertEqual(ABSTRACT, decompress_text(ABSTRACT))
+        self.assertIsNone(decompress_text(compress_text(None)))
+
+    @skipUnless(zstandard, "zstandard is not installed")
+    def test_zstd_round_trip(self):
+        """
+        Checks whether texts compressed with zstd are recognised when decompressed.
+        """
+        self.assertEqual("äbstract " + ABSTRACT, decompress_text(compress_text("äbstract " + ABSTRACT, codec="zstd")))
+
+    def test_unknown_codec(self):
+        """
+        Checks whether an unknown codec is refused.
+        """
+        self.assertRaises(ValueError, compress_text, ABSTRACT, codec="lz4")
+
+
+class TestPublicationAccessors(TestCase):
+    """
+    All tests relating to reading publications from the plain and the compact schema.
+    """
+    def setUp(self) -> None:
+        self.plain_db_conn = sqlite3.connect(":memory:")
+        self.plain_db_conn.execute("CREATE TABLE publications (pmid integer PRIMARY KEY, pub_abstract text, "
+                                   "journal text, title text, pub_year text)")
+        self.plain_db_conn.executemany("INSERT INTO publications VALUES (?,?,?,?,?)",
+                                       [(pmid, ABSTRACT, "Journal", f"Title {pmid}", "2020") for pmid in range(5)])
+        self.compact_db_conn = sqlite3.connect(":memory:")
+        self.compact_db_conn.execute("CREATE TABLE journals (journal_id integer PRIMARY KEY, journal text UNIQUE)")
+        self.compact_db_conn.execute("CREATE TABLE publications (pmid integer PRIMARY KEY, pub_abstract blob, "
+                                     "journal_id integer, title text, pub_year integer)")
+        self.compact_db_conn.execute("INSERT INTO journals VALUES (1, 'Journal')")
+        self.compact_db_conn.executemany("INSERT INTO publications VALUES (?,?,?,?,?)",
+                                         [(pmid, compress_text(ABSTRACT), 1, f"Title {pmid}", 2020)
+                                          for pmid in range(5)])
+
+    def test_get_publication(self):
+        """
+        Checks whether a publication is read alike from both schemas.
+        """
+        self.assertFalse(has_compact_publication_schema(self.plain_db_conn))
+        self.assertTrue(has_compact_publication_schema(self.compact_db_conn))
+        self.assertEqual((3, ABSTRACT, "Title 3", "Journal", "2020"), get_publication(self.plain_db_conn, 3))
+        self.assertEqual((3, ABSTRACT, "Title 3", "Journal", 2020), get_publication(self.compact_db_conn, 3))
+        self.assertIsNone(get_publication(self.compact_db_conn, 7))
+
+    def test_iterate_publications(self):
+        """
+        Checks whether all publications are read in chunks with the abstracts decompressed.
+        """
+        chunks = list(iterate_publications(self.compact_db_conn, chunk_size=2, after_pmid=0))
+        self.assertEqual([2, 2], [len(chunk) for chunk in chunks])
+        self.assertEqual((4, ABSTRACT, "Title 4", "Journal", 2020), chunks[-1][-1])
+
+    def test_register_compression_functions(self):
+        """
+        Checks whether the abstracts can be decompressed within SQL statements.
+        """
+        register_compression_functions(self.compact_db_conn)
+        self.assertEqual(ABSTRACT, self.compact_db_conn.execute(
+            "SELECT decompress_text(compress_text(decompress_text(pub_abstract))) FROM publications").fetchone()[0])
+
+    def tearDown(self) -> None:
+        self.plain_db_conn.close()
+        self.compact_db_conn.close()
@@ -0,0 +1,44 @@
+import tempfile
+
+from unittest import TestCase
+from pathlib import Path
+
+from protein_score_utilities.convenience_functions_files import CONFIG_SCHEMA
+from protein_score_utilities.convenience_functions_files import read_config
+from protein_score_utilities.convenience_functions_files import validate_config
+
+
+class TestReadConfig(TestCase):
+    """
+    All tests relating to :func:~`protein_score_utilities.convenience_functions_files.read_config` and
+    :func:~`protein_score_utilities.convenience_functions_files.validate_config`.
+    """
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.config_file = Path(self.tmp_dir.name) / "config.yml"
+
+    def test_read_config(self):
+        """
+        Checks whether settings are read, folders completed by a trailing slash and missing settings set to defaults.
+        """
+        self.config_file.write_text("data_raw: 'raw'  # comment\ndata_processed: 'processed/'\nn_workers: 2\n"
+                                    "extraction_fields: ['keywords']\n")
+        config = read_config(str(self.config_file))
+        self.assertEqual({'data_raw': "raw/", 'data_processed': "processed/", 'db_file': CONFIG_SCHEMA['db_file'][1],
+                          'database_rewrite': False, 'n_workers': 2, 'extraction_fields': ["keywords"]}, config)
+        self.config_file.write_text("")
+        self.assertEqual(set(CONFIG_SCHEMA), set(read_config(str(self.config_file))))
+
+    def test_invalid_config(self):
+        """
+        Checks whether settings of the wrong type and files not holding a mapping of settings are rejected.
+        """
+        for content in ("database_rewrite: 'yes'", "db_file: 1", "data_raw: True", "- data_raw", "data_raw: [",
+                        "!!python/name:os.system"):
+            self.config_file.write_text(content)
+            self.assertRaises(ValueError, read_config, str(self.config_file))
+        self.assertEqual(5, validate_config({'n_workers': 5}, {'n_workers': (int, 1)})['n_workers'])
+        self.assertRaises(ValueError, validate_config, {'n_workers': True}, {'n_workers': (int, 1)})
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
@@ -0,0 +1,218 @@
+import math
+import sqlite3
+import tempfile
+import threading
+
+from unittest import TestCase
+from pathlib import Path
+
+from protein_score_utilities.protein_rankings import ProteinRankingCache
+from protein_score_utilities.protein_rankings import database_content_version
+from protein_score_utilities.publication_search import create_publication_search_index
+
+
+def setup_db_conn(db_file):
+    """
+    Sets up a database with eleven publications, of which 1-4 mention arthritis and 5-10 diabetes, annotated with the
+    proteins A (publications 1-4), B (1-8) and C (9) as well as the diseases D (1-4) and E (5-10), and creates the
+    full-text index.
+    :param db_file: path to the database file
+    :type db_file: Path
+    :return: connection to test database
+    :rtype: sqlite3.Connection
+    """
+    test_db_conn = sqlite3.connect(db_file)
+    test_db_conn.execute("CREATE TABLE publications (pmid integer PRIMARY KEY, pub_abstract text NOT NULL, "
+                         "journal text NOT NULL, title text NOT NULL, pub_year text NOT NULL)")
+    test_db_conn.executemany("INSERT INTO publications VALUES (?,?,?,?,?)", [
+        (pmid, f"abstract {pmid} on {'arthritis' if pmid < 5 else 'diabetes' if pmid < 11 else 'cells'}", "J",
+         f"title {pmid}", "2020") for pmid in range(1, 12)])
+    test_db_conn.execute("CREATE TABLE annotations (pmid integer, entity_id text, entity_type text)")
+    test_db_conn.executemany("INSERT INTO annotations VALUES (?,?,?)",
+                             [(pmid, "A", "protein") for pmid in range(1, 5)] +
+                             [(pmid, "B", "protein") for pmid in range(1, 9)] + [(9, "C", "protein")] +
+                             [(pmid, "D", "disease") for pmid in range(1, 5)] +
+                             [(pmid, "E", "disease") for pmid in range(5, 11)])
+    create_publication_search_index(test_db_conn)
+    test_db_conn.commit()
+    return test_db_conn
+
+
+class TestProteinRankingCache(TestCase):
+    """
+    All tests relating to :mod:~`protein_score_utilities.protein_rankings` in the protein_score_utilities package.
+    """
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp_dir.name)
+        self.test_db_conn = setup_db_conn(self.tmp_path / "publications.db")
+        self.cache_file = self.tmp_path / "rankings_cache.db"
+
+    def test_top_proteins(self):
+        """
+        Checks whether the proteins are ranked for a disease found by full-text search and as annotated concept.
+        """
+        expected = [("A", math.log(11 / 4)), ("B", math.log(11 / 8))]
+        with ProteinRankingCache() as cache:
+            for source, disease_term in (('search', "arthritis"), ('concept', "D")):
+                rankings = cache.top_proteins(self.test_db_conn, disease_term, source=source)
+                self.assertEqual([protein_id for protein_id, _ in expected], [protein_id for protein_id, _ in rankings])
+                for (_, expected_score), (_, score) in zip(expected, rankings):
+                    self.assertAlmostEqual(expected_score, score)
+            self.assertEqual([expected[0][0]], [protein_id for protein_id, _ in
+                                                 cache.top_proteins(self.test_db_conn, "D", k=1, source='concept')])
+            self.assertEqual([], cache.top_proteins(self.test_db_conn, "F", source='concept'))
+            self.assertRaises(ValueError, cache.top_proteins, self.test_db_conn, "D", method="unknown")
+            self.assertRaises(ValueError, cache.top_proteins, self.test_db_conn, "D", source="unknown")
+
+    def test_in_process_cache(self):
+        """
+        Checks whether repeated queries are answered from the LRU cache, which holds the rankings used most recently.
+        """
+        cache = ProteinRankingCache(lru_size=2)
+        first = cache.top_proteins(self.test_db_conn, "arthritis")
+        self.assertEqual(first, cache.top_proteins(self.test_db_conn, "arthritis"))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        cache.top_proteins(self.test_db_conn, "diabetes")
+        cache.top_proteins(self.test_db_conn, "arthritis", method='tf-idf')
+        # the ranking requested first has been dropped from the cache
+        cache.top_proteins(self.test_db_conn, "arthritis")
+        self.assertEqual((1, 4), (cache.hits, cache.misses))
+        cache.clear()
+        cache.top_proteins(self.test_db_conn, "arthritis")
+        self.assertEqual((1, 5), (cache.hits, cache.misses))
+
+    def test_concurrent_misses(self):
+        """
+        Checks whether a ranking missed by two threads at the same time is computed only once.
+        """
+        cache = ProteinRankingCache()
+        ranked, loaded = [], []
+        both_missed = threading.Event()
+        rank, load = cache._rank, cache._load
+
+        def count_rank(*args):
+            ranked.append(args)
+            return rank(*args)
+
+        def count_load(key):
+            loaded.append(key)
+            if len(loaded) == 2:
+                both_missed.set()
+            return load(key)
+
+        def query(results):
+            db_conn = sqlite3.connect(self.tmp_path / "publications.db")
+            results.append(cache.top_proteins(db_conn, "arthritis"))
+            db_conn.close()
+
+        cache._rank, cache._load = count_rank, count_load
+        results = []
+        threads = [threading.Thread(target=query, args=(results,)) for _ in range(2)]
+        # both threads miss the cache before either of them can compute the ranking
+        with cache._compute_lock:
+            for thread in threads:
+                thread.start()
+            self.assertTrue(both_missed.wait(timeout=10))
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len(ranked))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_content_changed_while_waiting(self):
+        """
+        Checks whether a ranking requested before the content of the database changed, but computed afterwards, is
+        computed and cached for the new content version, keeping the rankings cached for it already.
+        """
+        with ProteinRankingCache(self.cache_file) as cache:
+            load = cache._load
+            missed = threading.Event()
+
+            def signal_load(key):
+                missed.set()
+                return load(key)
+
+            def query(results):
+                db_conn = sqlite3.connect(self.tmp_path / "publications.db")
+                results.append(cache.top_proteins(db_conn, "arthritis"))
+                db_conn.close()
+
+            cache._load = signal_load
+            results = []
+            thread = threading.Thread(target=query, args=(results,))
+            with cache._compute_lock:
+                thread.start()
+                self.assertTrue(missed.wait(timeout=10))
+                # the content changes while the thread waits, and a ranking of the new version is cached meanwhile
+                self.test_db_conn.execute("INSERT INTO publications VALUES (12, 'arthritis', 'J', 'title 12', '2021')")
+                self.test_db_conn.executemany("INSERT INTO annotations VALUES (?,?,?)", [(12, "C", "protein")] * 3)
+                self.test_db_conn.commit()
+            cache._load = load
+            diabetes = cache.top_proteins(self.test_db_conn, "diabetes")
+            thread.join()
+
+            version = database_content_version(self.test_db_conn)
+            self.assertEqual(["A", "B", "C"], [protein_id for protein_id, _ in results[0]])
+            self.assertEqual(version, cache._matrices_version)
+            self.assertEqual(diabetes, cache.top_proteins(self.test_db_conn, "diabetes"))
+        cache_conn = sqlite3.connect(self.cache_file)
+        self.assertEqual([(version, 2)], cache_conn.execute(
+            "SELECT content_version, COUNT(*) FROM query_cache GROUP BY content_version").fetchall())
+        cache_conn.close()
+
+    def test_persistent_cache(self):
+        """
+        Checks whether rankings are kept across instances of the cache in the cache file.
+        """
+        with ProteinRankingCache(self.cache_file) as cache:
+            rankings = cache.top_proteins(self.test_db_conn, "diabetes", method='npmi')
+        with ProteinRankingCache(self.cache_file) as cache:
+            self.assertEqual(rankings, cache.top_proteins(self.test_db_conn, "diabetes", method='npmi'))
+            self.assertEqual((0, 1, 0), (cache.hits, cache.persistent_hits, cache.misses))
+            self.assertEqual(rankings, cache.top_proteins(self.test_db_conn, "diabetes", method='npmi'))
+            self.assertEqual(1, cache.hits)
+
+    def test_invalidated_on_ingest(self):
+        """
+        Checks whether rankings are computed again once publications have been ingested or annotated, also if the
+        publications are written through another connection, and whether persistent rankings of older versions are
+        removed.
+        """
+        with ProteinRankingCache(self.cache_file) as cache:
+            version = database_content_version(self.test_db_conn)
+            self.assertEqual(["A", "B"], [protein_id for protein_id, _ in
+                                          cache.top_proteins(self.test_db_conn, "arthritis")])
+            writer_conn = sqlite3.connect(self.tmp_path / "publications.db")
+            writer_conn.execute("INSERT INTO publications VALUES (12, 'arthritis', 'J', 'title 12', '2021')")
+            writer_conn.executemany("INSERT INTO annotations VALUES (?,?,?)", [(12, "C", "protein")] * 3)
+            writer_conn.commit()
+            writer_conn.close()
+            self.assertNotEqual(version, database_content_version(self.test_db_conn))
+            rankings = cache.top_proteins(self.test_db_conn, "arthritis")
+            self.assertEqual(["A", "B", "C"], [protein_id for protein_id, _ in rankings])
+            self.assertEqual((0, 2), (cache.hits, cache.misses))
+
+        cache_conn = sqlite3.connect(self.cache_file)
+        versions = [row[0] for row in cache_conn.execute("SELECT content_version FROM query_cache")]
+        cache_conn.close()
+        self.assertEqual([database_content_version(self.test_db_conn)], versions)
+
+    def test_content_version_manifest(self):
+        """
+        Checks whether the content version follows the files recorded in the ingestion manifest.
+        """
+        version = database_content_version(self.test_db_conn)
+        self.assertEqual(version, database_content_version(self.test_db_conn))
+        self.test_db_conn.execute("CREATE TABLE ingestion_manifest (file_name text PRIMARY KEY, article_count integer, "
+                                  "status text, completed_at text)")
+        self.test_db_conn.execute("INSERT INTO ingestion_manifest VALUES ('pubmed_1.xml', 10, 'completed', "
+                                  "'2024-01-01 10:00:00')")
+        manifest_version = database_content_version(self.test_db_conn)
+        self.assertNotEqual(version, manifest_version)
+        self.test_db_conn.execute("UPDATE ingestion_manifest SET completed_at='2024-01-02 10:00:00'")
+        self.assertNotEqual(manifest_version, database_content_version(self.test_db_conn))
+
+    def tearDown(self) -> None:
+        self.test_db_conn.close()
+        self.tmp_dir.cleanup()
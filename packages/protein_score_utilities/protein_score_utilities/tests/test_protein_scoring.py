@@ -0,0 +1,87 @@
+import math
+import sqlite3
+
+from unittest import TestCase
+
+import numpy as np
+
+from protein_score_utilities.protein_scoring import CoOccurrenceMatrices
+from protein_score_utilities.protein_scoring import pmi_scores
+from protein_score_utilities.protein_scoring import score_proteins_for_publications
+from protein_score_utilities.protein_scoring import tf_idf_scores
+from protein_score_utilities.protein_scoring import top_k_proteins
+
+
+def setup_db_conn():
+    """
+    Sets up an in-memory database with eleven publications, annotated with the proteins A (publications 1-4), B (1-8)
+    and C (9) as well as the diseases D (1-4) and E (5-10).
+    :return: connection to test database
+    :rtype: sqlite3.Connection
+    """
+    test_db_conn = sqlite3.connect(":memory:")
+    test_db_conn.execute("CREATE TABLE publications (pmid integer PRIMARY KEY)")
+    test_db_conn.executemany("INSERT INTO publications VALUES (?)", [(pmid,) for pmid in range(1, 12)])
+    test_db_conn.execute("CREATE TABLE annotations (pmid integer, entity_id text, entity_type text)")
+    mentions = [(pmid, "A", "protein") for pmid in range(1, 5)] + \
+               [(pmid, "B", "protein") for pmid in range(1, 9)] + [(9, "C", "protein")] + \
+               [(pmid, "D", "disease") for pmid in range(1, 5)] + \
+               [(pmid, "E", "disease") for pmid in range(5, 11)]
+    # proteins mentioned repeatedly within a publication count once
+    test_db_conn.executemany("INSERT INTO annotations VALUES (?,?,?)", mentions + [(1, "A", "protein")])
+    return test_db_conn
+
+
+class TestProteinScoring(TestCase):
+    """
+    All tests relating to :mod:~`protein_score_utilities.protein_scoring` in the protein_score_utilities package.
+    """
+    def setUp(self) -> None:
+        self.test_db_conn = setup_db_conn()
+        self.matrices = CoOccurrenceMatrices(self.test_db_conn)
+
+    def test_co_occurrence_matrices(self):
+        """
+        Checks whether the incidence and co-occurrence matrices are built from the annotations.
+        """
+        self.assertEqual(["A", "B", "C"], list(self.matrices.protein_ids))
+        self.assertEqual(["D", "E"], list(self.matrices.concept_ids))
+        self.assertEqual(11, self.matrices.n_publications)
+        self.assertEqual([4, 8, 1], list(self.matrices.protein_counts))
+        self.assertEqual([4, 6], list(self.matrices.concept_counts))
+        self.assertEqual([[4, 0], [4, 4], [0, 1]], self.matrices.protein_concept.toarray().tolist())
+        self.assertEqual(1, self.matrices.protein_index("B"))
+        self.assertRaises(KeyError, self.matrices.concept_index, "F")
+
+    def test_pmi_scores(self):
+        """
+        Checks whether the (positive) PMI is computed for the pairs mentioned together.
+        """
+        scores = pmi_scores(self.matrices.protein_concept, self.matrices.protein_counts, self.matrices.concept_counts,
+                            self.matrices.n_publications).toarray()
+        np.testing.assert_allclose([[math.log(11 / 4), 0], [math.log(11 / 8), 0], [0, math.log(11 / 6)]], scores)
+        scores = pmi_scores(self.matrices.protein_concept, self.matrices.protein_counts, self.matrices.concept_counts,
+                            self.matrices.n_publications, positive=False).toarray()
+        self.assertAlmostEqual(math.log(44 / 48), scores[1, 1])
+
+    def test_tf_idf_scores(self):
+        """
+        Checks whether co-occurrence counts are weighted by the inverse document frequency of the protein.
+        """
+        scores = tf_idf_scores(self.matrices.protein_concept, self.matrices.protein_counts,
+                               self.matrices.n_publications).toarray()
+        self.assertAlmostEqual(4 * (math.log(12 / 5) + 1), scores[0, 0])
+        self.assertAlmostEqual(4 * (math.log(12 / 9) + 1), scores[1, 0])
+
+    def test_score_proteins_for_publications(self):
+        """
+        Checks whether proteins are ranked for a set of publications like for a concept, ignoring unknown PMIDs.
+        """
+        scores = score_proteins_for_publications(self.matrices, [1, 2, 3, 4, 99])
+        self.assertEqual([("A", math.log(11 / 4)), ("B", math.log(11 / 8))],
+                         top_k_proteins(scores, self.matrices.protein_ids))
+        self.assertEqual([("A", math.log(11 / 4))], top_k_proteins(scores, self.matrices.protein_ids, k=1))
+        self.assertRaises(ValueError, score_proteins_for_publications, self.matrices, [1], method="unknown")
+
+    def tearDown(self) -> None:
+        self.test_db_conn.close()
@@ -0,0 +1,79 @@
+import sqlite3
+
+from unittest import TestCase
+
+from protein_score_utilities.publication_search import count_publications
+from protein_score_utilities.publication_search import create_publication_search_index
+from protein_score_utilities.publication_search import search_publication_ids
+from protein_score_utilities.publication_search import search_publications
+
+
+def setup_db_conn():
+    """
+    Sets up an in-memory database with a publication table holding a few publications.
+    :return: connection to test database
+    :rtype: sqlite3.Connection
+    """
+    test_db_conn = sqlite3.connect(":memory:")
+    test_db_conn.execute(
+        "CREATE TABLE IF NOT EXISTS publications (pmid integer PRIMARY KEY, "
+        "pub_abstract text NOT NULL, journal text NOT NULL, title text NOT NULL, "
+        "pub_year text NOT NULL);"
+    )
+    test_db_conn.executemany("INSERT INTO publications VALUES (?,?,?,?,?)", [
+        (1, "IL-6 levels were increased in patients with rheumatoid arthritis.", "J", "Cytokines in arthritis", "2019"),
+        (2, "TNF and IL-6 drive inflammation.", "J", "Rheumatoid arthritis and IL-6 signalling", "2020"),
+        (3, "Insulin resistance in type 2 diabetes.", "J", "Diabetes", "2020"),
+    ])
+    return test_db_conn
+
+
+class TestPublicationSearch(TestCase):
+    """
+    All tests relating to :mod:~`protein_score_utilities.publication_search` in the protein_score_utilities package.
+    """
+    def setUp(self) -> None:
+        """
+        Creating the full-text index for a database already holding publications.
+        """
+        self.test_db_conn = setup_db_conn()
+        create_publication_search_index(self.test_db_conn)
+
+    def test_search_publications_existing_content_indexed(self):
+        """
+        Checks whether publications stored before the index was created are found, ranked by relevance.
+        """
+        results = search_publications(self.test_db_conn, "rheumatoid arthritis")
+        self.assertEqual([2, 1], [pmid for pmid, title, score in results])
+        self.assertGreater(results[0][2], results[1][2])
+
+    def test_search_publications_special_characters(self):
+        """
+        Checks whether terms with characters of the FTS5 query syntax are searched as phrase.
+        """
+        self.assertEqual([1, 2], sorted(search_publication_ids(self.test_db_conn, "IL-6")))
+        self.assertEqual(1, count_publications(self.test_db_conn, 'diabetes"'))
+
+    def test_search_publications_match_all(self):
+        """
+        Checks whether multiple terms are combined with OR by default and with AND if requested.
+        """
+        self.assertEqual(3, count_publications(self.test_db_conn, ["IL-6", "insulin"]))
+        self.assertEqual(1, count_publications(self.test_db_conn, ["TNF", "IL-6"], match_all=True))
+
+    def test_search_publications_follows_updates_and_deletions(self):
+        """
+        Checks whether the index is kept in sync with inserted, updated and deleted publications.
+        """
+        self.test_db_conn.execute("INSERT INTO publications VALUES (4, 'Obesity and diabetes.', 'J', 'Obesity', '2021')")
+        self.test_db_conn.execute("UPDATE publications SET pub_abstract='Insulin signalling.' WHERE pmid=3")
+        self.test_db_conn.execute("DELETE FROM publications WHERE pmid=1")
+        self.assertEqual([3, 4], sorted(search_publication_ids(self.test_db_conn, "diabetes")))
+        self.assertEqual([2], search_publication_ids(self.test_db_conn, "IL-6"))
+        self.assertEqual([], search_publication_ids(self.test_db_conn, "resistance"))
+
+    def tearDown(self) -> None:
+        """
+        Disconnecting from database after test finished.
+        """
+        self.test_db_conn.close()
@@ -0,0 +1,132 @@
+import json
+import pstats
+import tempfile
+import time
+
+from unittest import TestCase
+from unittest import skipUnless
+from pathlib import Path
+
+from protein_score_utilities.run_metrics import MetricsRecorder
+from protein_score_utilities.run_metrics import current_rss_bytes
+from protein_score_utilities.run_metrics import peak_rss_bytes
+from protein_score_utilities.run_metrics import profiling
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+
+class TestMetricsRecorder(TestCase):
+    """
+    All tests relating to :class:~`protein_score_utilities.run_metrics.MetricsRecorder`.
+    """
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.metrics_file = Path(self.tmp_dir.name) / "metrics" / "run.jsonl"
+
+    def test_events_written_as_json_lines(self):
+        """
+        Checks whether events are appended to the metrics file as JSON lines with the context and the peak memory.
+        """
+        for run in ("first", "second"):
+            with MetricsRecorder.open(self.metrics_file, run=run) as metrics:
+                metrics.emit('file', file=Path("pubmed.xml"), publications=10)
+        events = [json.loads(line) for line in self.metrics_file.read_text().splitlines()]
+        self.assertEqual(["first", "second"], [event['run'] for event in events])
+        self.assertEqual({'file'}, set(event['event'] for event in events))
+        self.assertEqual("pubmed.xml", events[0]['file'])
+        self.assertEqual(10, events[0]['publications'])
+        self.assertGreater(events[0]['peak_rss_bytes'], 0)
+        self.assertTrue(metrics.sink is None)
+
+    def test_timings_and_counters(self):
+        """
+        Checks whether the time spent in stages and the counters are accumulated and reported in the summary, also
+        without a sink.
+        """
+        metrics = MetricsRecorder()
+        self.assertFalse(metrics.enabled)
+        for _ in range(2):
+            with metrics.stage('parse'):
+                time.sleep(0.01)
+        metrics.add_time('insert', 0.5)
+        metrics.count('publications', 20)
+        metrics.count('publications')
+        self.assertGreaterEqual(metrics.timings['parse'], 0.02)
+        summary = metrics.emit_summary(files=1)
+        self.assertEqual(21, summary['publications'])
+        self.assertEqual(0.5, summary['insert_seconds'])
+        self.assertEqual(1, summary['files'])
+
+    def test_peak_rss(self):
+        """
+        Checks whether the peak memory grows with the memory held by the process.
+        """
+        before = peak_rss_bytes()
+        data = bytearray(64 * 1024 * 1024)
+        self.assertGreaterEqual(peak_rss_bytes(), before)
+        self.assertGreaterEqual(peak_rss_bytes(), len(data))
+
+    @skipUnless(current_rss_bytes(), "the current memory can only be determined on Linux")
+    def test_current_rss(self):
+        """
+        Checks whether the current memory reflects memory being held and released again.
+        """
+        before = current_rss_bytes()
+        data = bytearray(b"x" * 64 * 1024 * 1024)
+        held = current_rss_bytes()
+        self.assertGreaterEqual(held - before, len(data) // 2)
+        del data
+        self.assertLess(current_rss_bytes(), held)
+        self.assertLessEqual(current_rss_bytes(), peak_rss_bytes())
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+
+class TestProfiling(TestCase):
+    """
+    All tests relating to :func:~`protein_score_utilities.run_metrics.profiling`.
+    """
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp_dir.name)
+
+    def test_cprofile(self):
+        """
+        Checks whether the profile of cProfile is written, also if the block raises an exception.
+        """
+        with self.assertRaises(RuntimeError):
+            with profiling('cprofile', self.tmp_path / "profile") as output_file:
+                sorted(range(1000), key=lambda x: -x)
+                raise RuntimeError("failed run")
+        self.assertEqual(self.tmp_path / "profile.prof", output_file)
+        functions = [function for _, _, function in pstats.Stats(str(output_file)).stats]
+        self.assertIn("<built-in method builtins.sorted>", functions)
+
+    def test_off_and_unknown(self):
+        """
+        Checks whether nothing is written if profiling is switched off and an unknown profiler is refused.
+        """
+        with profiling('off', self.tmp_path / "profile") as output_file:
+            self.assertIsNone(output_file)
+        self.assertEqual([], list(self.tmp_path.iterdir()))
+        with self.assertRaises(ValueError):
+            with profiling('yappi', self.tmp_path / "profile"):
+                pass
+
+    @skipUnless(pyinstrument, "pyinstrument is not installed")
+    def test_pyinstrument(self):
+        """
+        Checks whether the profile of pyinstrument is written as HTML page, also if the block raises an exception.
+        """
+        with self.assertRaises(RuntimeError):
+            with profiling('pyinstrument', self.tmp_path / "profile") as output_file:
+                sorted(range(100000), key=lambda x: -x)
+                raise RuntimeError("failed run")
+        self.assertTrue(output_file.read_text().lstrip().startswith("<"))
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
@@ -0,0 +1,55 @@
+"""
+Run script to extract semantic concepts from the publications extracted by run_data_processing_XML.py and to cluster
+the publications by these concepts. The clusters are trained incrementally: publications added to the database since
+the last run (e.g. from Pubmed update files) update the stored clusters rather than all publications being clustered
+anew. The clusters of the publications are written to the table publication_clusters of the same database and the model
+is stored next to the database.
+"""
+
+import sys
+from pathlib import Path
+
+from data_processing.extract_concepts import DEFAULT_CONCEPT_CHUNK_SIZE
+from data_processing.extract_concepts import DEFAULT_CONCEPTS_PER_FEATURE
+from data_processing.extract_concepts import DEFAULT_N_CLUSTERS
+from data_processing.extract_concepts import ConceptClusterer
+from data_processing.extract_concepts import SQL_CREATE_CONCEPTS_INDEXES
+from data_processing.extract_concepts import SQL_CREATE_CONCEPTS_TABLE
+from data_processing.extract_concepts import SQL_CREATE_PUBLICATION_CLUSTERS_TABLE
+from data_processing.extract_concepts import cluster_publications
+from data_processing.extract_concepts import describe_clusters
+from protein_score_utilities.convenience_functions_files import read_config
+from protein_score_utilities.convenience_functions_database import create_database_connection
+from protein_score_utilities.convenience_functions_database import create_table
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("No config file provided. Program will abort")
+        sys.exit(1)
+    elif not str(sys.argv[1]).endswith(".yml"):
+        print("Config file is not in the correct format -- yaml file needed. Program will abort")
+        sys.exit(1)
+
+    config = read_config(sys.argv[1])
+
+    db_conn = create_database_connection(config['data_processed'] + config['db_file'], profile='bulk_load')
+    for sql_create_table in (SQL_CREATE_CONCEPTS_TABLE, SQL_CREATE_PUBLICATION_CLUSTERS_TABLE) + \
+            SQL_CREATE_CONCEPTS_INDEXES:
+        create_table(db_conn, sql_create_table)
+
+    model_file = config['data_processed'] + config.get('concept_model_file', 'concept_model.pkl')
+    clusterer = ConceptClusterer(n_clusters=config.get('concept_clusters', DEFAULT_N_CLUSTERS))
+    cluster_publications(db_conn, model_file, clusterer,
+                         chunk_size=config.get('concept_chunk_size', DEFAULT_CONCEPT_CHUNK_SIZE),
+                         restart=config.get('concept_restart', False),
+                         concepts_per_feature=config.get('concepts_per_feature', DEFAULT_CONCEPTS_PER_FEATURE))
+
+    # the model is only stored once publications have been clustered
+    if Path(model_file).exists():
+        for cluster, concepts in enumerate(describe_clusters(db_conn, ConceptClusterer.load(model_file))):
+            print(f"Cluster {cluster}: {', '.join(concepts)}")
+    else:
+        print("No publications to cluster")
+
+    db_conn.close()
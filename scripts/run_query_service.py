@@ -0,0 +1,50 @@
+"""
+Run script to serve search and ranking queries over the database created by run_data_processing_XML.py through a local
+HTTP service, see data_processing.query_service for the endpoints. The config file used for the data processing is
+extended by the address and port of the service, the number of read-only connections queries are run on and the file
+rankings are cached in. If a lexicon is configured and service_lexicon is set, it is compiled once at startup, so that
+texts can be annotated through the service as well. The service runs until it is stopped with Ctrl+C.
+"""
+
+import asyncio
+import sys
+
+from data_processing.query_service import DEFAULT_CONNECTIONS
+from data_processing.query_service import DEFAULT_HOST
+from data_processing.query_service import DEFAULT_PORT
+from data_processing.query_service import run_query_service
+from protein_score_utilities.convenience_functions_files import read_config
+from protein_score_utilities.protein_rankings import ProteinRankingCache
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("No config file provided. Program will abort")
+        sys.exit(1)
+    elif not str(sys.argv[1]).endswith(".yml"):
+        print("Config file is not in the correct format -- yaml file needed. Program will abort")
+        sys.exit(1)
+
+    config = read_config(sys.argv[1])
+
+    annotator = None
+    if config.get('service_lexicon', False):
+        from data_processing.annotate_text_data import LexiconAnnotator
+        from data_processing.annotate_text_data import read_lexicon
+        lexicon = read_lexicon(config['lexicon_file'], has_header=config.get('lexicon_has_header', False))
+        annotator = LexiconAnnotator(lexicon, case_sensitive=config.get('annotation_case_sensitive', False))
+        print(f"Compiled lexicon with {annotator.n_synonyms} synonyms")
+
+    cache_file = config.get('ranking_cache_file')
+    ranking_cache = ProteinRankingCache(config['data_processed'] + cache_file if cache_file else None,
+                                        concept_type=config.get('concept_type'))
+    try:
+        asyncio.run(run_query_service(config['data_processed'] + config['db_file'],
+                                      host=config.get('service_host', DEFAULT_HOST),
+                                      port=config.get('service_port', DEFAULT_PORT),
+                                      n_connections=config.get('service_connections', DEFAULT_CONNECTIONS),
+                                      ranking_cache=ranking_cache, annotator=annotator))
+    except KeyboardInterrupt:
+        print("Service stopped")
+    finally:
+        ranking_cache.close()
@@ -0,0 +1,65 @@
+"""
+Run script to annotate the publications extracted by run_data_processing_XML.py with mentions of proteins and genes.
+The config file used for the data processing is extended by the location of the lexicon, a tab separated file holding
+an identifier and a synonym of a protein or gene on each line (e.g. exported from UniProt or HGNC). The mentions found
+are written to the table annotations of the same database. If a second lexicon is configured (setting
+concept_lexicon_file), the publications are annotated with the concepts it holds, e.g. diseases, as well, which the
+proteins are scored against. Publications are annotated by a pool of worker processes and
+the progress is recorded, so that an interrupted run and publications added later are picked up by the next run.
+"""
+
+import sys
+
+from data_processing.annotate_text_data import DEFAULT_CHUNK_SIZE
+from data_processing.annotate_text_data import LexiconAnnotator
+from data_processing.annotate_text_data import SQL_CREATE_ANNOTATIONS_INDEXES
+from data_processing.annotate_text_data import SQL_CREATE_ANNOTATIONS_TABLE
+from data_processing.annotate_text_data import read_lexicon
+from data_processing.annotation_pipeline import annotate_publications_parallel
+from data_processing.annotation_pipeline import create_annotation_tracking
+from data_processing.annotation_pipeline import get_annotation_watermark
+from protein_score_utilities.convenience_functions_files import read_config
+from protein_score_utilities.convenience_functions_database import create_database_connection
+from protein_score_utilities.convenience_functions_database import create_table
+from protein_score_utilities.convenience_functions_database import deferred_indexes
+from protein_score_utilities.protein_scoring import DEFAULT_CONCEPT_TYPE
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("No config file provided. Program will abort")
+        sys.exit(1)
+    elif not str(sys.argv[1]).endswith(".yml"):
+        print("Config file is not in the correct format -- yaml file needed. Program will abort")
+        sys.exit(1)
+
+    config = read_config(sys.argv[1])
+
+    # proteins are annotated with the lexicon of lexicon_file, and if configured the concepts they are scored against
+    # (see protein_score_utilities.protein_scoring) with the lexicon of concept_lexicon_file
+    lexicon_files = {'protein': config['lexicon_file']}
+    if config.get('concept_lexicon_file'):
+        lexicon_files[config.get('concept_type', DEFAULT_CONCEPT_TYPE)] = config['concept_lexicon_file']
+
+    db_conn = create_database_connection(config['data_processed'] + config['db_file'], profile='bulk_load')
+    create_table(db_conn, SQL_CREATE_ANNOTATIONS_TABLE)
+    for sql_create_index in SQL_CREATE_ANNOTATIONS_INDEXES:
+        create_table(db_conn, sql_create_index)
+    # publications deleted or updated by later ingestions are tracked from now on
+    create_annotation_tracking(db_conn)
+
+    restart = config.get('annotation_restart', False)
+    # when all publications are annotated, the indexes are created once at the end rather than kept up to date
+    defer_indexes = restart or any(get_annotation_watermark(db_conn, entity_type) is None
+                                   for entity_type in lexicon_files)
+    with deferred_indexes(db_conn, ['annotations'] if defer_indexes else []):
+        for entity_type, lexicon_file in lexicon_files.items():
+            lexicon = read_lexicon(lexicon_file, has_header=config.get('lexicon_has_header', False))
+            annotator = LexiconAnnotator(lexicon, case_sensitive=config.get('annotation_case_sensitive', False))
+            print(f"Compiled {entity_type} lexicon with {annotator.n_synonyms} synonyms")
+            annotate_publications_parallel(db_conn, annotator, entity_type=entity_type,
+                                           n_workers=config.get('annotation_workers', 1),
+                                           chunk_size=config.get('annotation_chunk_size', DEFAULT_CHUNK_SIZE),
+                                           restart=restart)
+
+    db_conn.close()